@@ -0,0 +1,218 @@
+"""
+Hourly activity rollups.
+
+ActivityRollup bins messages into UTC hour buckets with np.bincount and
+keeps only the hours that saw a message: a sorted array of those hours and,
+per role (user / assistant / other), their message and token counts
+(tokens are whitespace-separated words, the unit response_tokens uses).
+Size follows activity, not the time span, so a stray timestamp decades
+away costs one bucket. New messages are added with update(), rollups of
+separate batches or processes combine with merge(), and to_dict() stores
+the arrays zlib-compressed and base64-encoded (under 50 KB for a user-year
+with activity in every hour, far less for typical users), small enough to
+travel inside wrapped_json.
+
+Every query takes an optional [start, end) range (anything pd.Timestamp
+accepts, UTC if naive) and touches only the active buckets in it, never
+message rows: totals and assistant/user ratios, a weekday x hour heatmap,
+daily counts, per-month volume and weekly streaks.
+"""
+import base64
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+ROLES = ("user", "assistant", "other")
+
+Bound = Optional[Any]   # None (open), or anything pd.Timestamp accepts
+
+
+def _to_hour(value) -> int:
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return int(ts.value // 3_600_000_000_000)
+
+
+def _encode(arr: np.ndarray) -> str:
+    return base64.b64encode(zlib.compress(arr.astype("<i4").tobytes(), 6)).decode("ascii")
+
+
+def _decode(data: str, rows: int) -> np.ndarray:
+    raw = np.frombuffer(zlib.decompress(base64.b64decode(data)), dtype="<i4")
+    return raw.astype(np.int64).reshape(rows, -1)
+
+
+def _week_runs(weeks: np.ndarray) -> Tuple[int, int]:
+    """(longest run, run ending at weeks[-1]) of consecutive values in a sorted unique array"""
+    if not len(weeks):
+        return 0, 0
+    breaks = np.flatnonzero(np.diff(weeks) != 1) + 1
+    bounds = np.r_[0, breaks, len(weeks)]
+    return int(np.diff(bounds).max()), int(len(weeks) - bounds[-2])
+
+
+class ActivityRollup:
+    """Per-role message and token counts in hourly buckets (hours since the epoch, UTC)"""
+
+    def __init__(self):
+        self.hours = np.zeros(0, dtype=np.int64)     # active buckets, ascending
+        self.messages = np.zeros((len(ROLES), 0), dtype=np.int64)
+        self.tokens = np.zeros((len(ROLES), 0), dtype=np.int64)
+
+    @property
+    def buckets(self) -> int:
+        return len(self.hours)
+
+    def _add(self, hours: np.ndarray, messages: np.ndarray, tokens: np.ndarray):
+        """Add counts for the (ascending, unique) hours"""
+        if not len(hours):
+            return
+        merged = np.union1d(self.hours, hours)
+        if len(merged) != self.buckets:
+            grown_m = np.zeros((len(ROLES), len(merged)), dtype=np.int64)
+            grown_t = np.zeros_like(grown_m)
+            at = np.searchsorted(merged, self.hours)
+            grown_m[:, at] = self.messages
+            grown_t[:, at] = self.tokens
+            self.hours, self.messages, self.tokens = merged, grown_m, grown_t
+        at = np.searchsorted(self.hours, hours)
+        self.messages[:, at] += messages
+        self.tokens[:, at] += tokens
+
+    # ── Building ────────────────────────────────────────────────────
+
+    def update(self, df: pd.DataFrame) -> "ActivityRollup":
+        """Add a sanitized frame (UTC created_at, author_role, body)"""
+        if df.empty:
+            return self
+        hours = df["created_at"].values.astype("datetime64[h]").astype(np.int64)
+        role = df["author_role"].to_numpy()
+        role_idx = np.where(role == "user", 0, np.where(role == "assistant", 1, 2))
+        words = df["body"].fillna("").astype(str).str.split().str.len().to_numpy()
+
+        uniq, inv = np.unique(hours, return_inverse=True)
+        flat = role_idx * len(uniq) + inv.ravel()
+        size = len(ROLES) * len(uniq)
+        self._add(
+            uniq,
+            np.bincount(flat, minlength=size).reshape(len(ROLES), -1),
+            np.bincount(flat, weights=words, minlength=size).astype(np.int64).reshape(len(ROLES), -1),
+        )
+        return self
+
+    def merge(self, other: "ActivityRollup") -> "ActivityRollup":
+        """Fold other into self"""
+        self._add(other.hours, other.messages, other.tokens)
+        return self
+
+    # ── Range queries ───────────────────────────────────────────────
+
+    def _slice(self, start: Bound, end: Bound) -> Tuple[int, int]:
+        """Bucket indices [i0, i1) of the active hours in [start, end)"""
+        i0 = 0 if start is None else int(np.searchsorted(self.hours, _to_hour(start)))
+        i1 = self.buckets if end is None else int(np.searchsorted(self.hours, _to_hour(end)))
+        return i0, max(i0, i1)
+
+    def totals(self, start: Bound = None, end: Bound = None) -> Dict[str, Any]:
+        """Messages / tokens per role and assistant-to-user ratios"""
+        i0, i1 = self._slice(start, end)
+        msgs = self.messages[:, i0:i1].sum(axis=1)
+        toks = self.tokens[:, i0:i1].sum(axis=1)
+        u, a = ROLES.index("user"), ROLES.index("assistant")
+        return {
+            "messages": {r: int(n) for r, n in zip(ROLES, msgs)},
+            "tokens": {r: int(n) for r, n in zip(ROLES, toks)},
+            "assistant_user_message_ratio": float(msgs[a] / msgs[u]) if msgs[u] else None,
+            "assistant_user_token_ratio": float(toks[a] / toks[u]) if toks[u] else None,
+        }
+
+    def heatmap(self, start: Bound = None, end: Bound = None,
+                utc_offset_hours: int = 0) -> List[List[int]]:
+        """7 x 24 message counts, weekday (Monday = 0) by local hour"""
+        i0, i1 = self._slice(start, end)
+        local = self.hours[i0:i1] + utc_offset_hours
+        # 1970-01-01 was a Thursday (weekday 3)
+        cell = ((local // 24 + 3) % 7) * 24 + local % 24
+        counts = np.bincount(cell, weights=self.messages[:, i0:i1].sum(axis=0), minlength=7 * 24)
+        return counts.astype(np.int64).reshape(7, 24).tolist()
+
+    def daily(self, start: Bound = None, end: Bound = None,
+              utc_offset_hours: int = 0) -> Dict[str, int]:
+        """Messages per local day, for days with activity"""
+        i0, i1 = self._slice(start, end)
+        days, inv = np.unique((self.hours[i0:i1] + utc_offset_hours) // 24, return_inverse=True)
+        counts = np.bincount(inv.ravel(), weights=self.messages[:, i0:i1].sum(axis=0),
+                             minlength=len(days))
+        labels = days.astype("datetime64[D]").astype(str)
+        return {d: int(n) for d, n in zip(labels, counts) if n}
+
+    def weekly_streaks(self, start: Bound = None, end: Bound = None,
+                       utc_offset_hours: int = 0) -> Dict[str, int]:
+        """Longest run of consecutive (Monday-based) active weeks, and the run ending at the range's last week"""
+        i0, i1 = self._slice(start, end)
+        active = self.messages[:, i0:i1].sum(axis=0) > 0
+        if not active.any():
+            return {"active_weeks": 0, "longest": 0, "current": 0}
+        week = lambda hours: ((hours + utc_offset_hours) // 24 + 3) // 7
+        weeks = np.unique(week(self.hours[i0:i1][active]))
+        longest, trailing = _week_runs(weeks)
+        # The range ends at end (exclusive) or at the last activity, whichever is first
+        last = self.hours[-1] if end is None else min(_to_hour(end) - 1, int(self.hours[-1]))
+        current = trailing if weeks[-1] == week(last) else 0
+        return {"active_weeks": len(weeks), "longest": longest, "current": current}
+
+    def monthly(self, start: Bound = None, end: Bound = None) -> Dict[str, Dict[str, int]]:
+        """Per UTC month: messages and tokens per role, for months with activity"""
+        i0, i1 = self._slice(start, end)
+        months = self.hours[i0:i1].astype("datetime64[h]").astype("datetime64[M]")
+        labels, idx = np.unique(months, return_inverse=True)
+        idx = idx.ravel()
+        out: Dict[str, Dict[str, int]] = {}
+        per_role = {}
+        for name, arr in (("messages", self.messages), ("tokens", self.tokens)):
+            for r, role in enumerate(ROLES):
+                per_role[f"{role}_{name}"] = np.bincount(idx, weights=arr[r, i0:i1], minlength=len(labels))
+        total = sum(per_role[f"{r}_messages"] for r in ROLES)
+        for i in np.flatnonzero(total):
+            out[str(labels[i])] = {
+                "messages": int(total[i]),
+                "tokens": int(sum(per_role[f"{r}_tokens"][i] for r in ROLES)),
+                **{k: int(v[i]) for k, v in per_role.items()},
+            }
+        return out
+
+    def summary(self, start: Bound = None, end: Bound = None,
+                utc_offset_hours: int = 0) -> Dict[str, Any]:
+        """Everything the activity views need for [start, end)"""
+        return {
+            **self.totals(start, end),
+            "heatmap": self.heatmap(start, end, utc_offset_hours),
+            "daily": self.daily(start, end, utc_offset_hours),
+            "weekly_streaks": self.weekly_streaks(start, end, utc_offset_hours),
+            "monthly": self.monthly(start, end),
+        }
+
+    # ── Persistence ─────────────────────────────────────────────────
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bucket": "hour",
+            "start_hour": int(self.hours[0]) if self.buckets else None,
+            "roles": list(ROLES),
+            # Gaps between active hours, then the per-role counts in them
+            "hours": _encode(np.diff(self.hours, prepend=self.hours[:1])),
+            "messages": _encode(self.messages),
+            "tokens": _encode(self.tokens),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ActivityRollup":
+        out = cls()
+        if data.get("start_hour") is None:
+            return out
+        out.hours = int(data["start_hour"]) + np.cumsum(_decode(data["hours"], 1)[0])
+        out.messages = _decode(data["messages"], len(ROLES))
+        out.tokens = _decode(data["tokens"], len(ROLES))
+        return out
@@ -0,0 +1,194 @@
+"""
+Recompute wrapped + graph analytics for many users in one job.
+
+update_analytics_for_email sets up a MiniChatEmbedder (spaCy and all) for
+every call, which dominates when it is run for every e-mail in the table.
+run_batch_analytics instead:
+
+  * starts a process pool whose initializer builds one embedder per worker
+    process, so spaCy is loaded once per process and reused for every user
+    that worker handles (its NER memo is shared across those users, too);
+  * hands users to the pool one at a time, so workers that draw small users
+    simply take more of them;
+  * fetches each user's rows with concurrent paged queries
+    (fetch_rows_for_email with workers > 1);
+  * collects the wrapped_json / graph_json payloads and writes them back in
+    bulk upserts once every user is done;
+  * prints a per-user breakdown of fetch, NER, wrapped and graph time.
+
+    python batch_analytics.py                       # every e-mail in the table
+    python batch_analytics.py a@x.com b@y.com --workers 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from claude_parser import (
+    TABLE_NAME,
+    EmbedConfig,
+    MiniChatEmbedder,
+    analytics_update,
+    fetch_rows_for_email,
+    list_emails_in_database,
+    save_analytics_state,
+    store_analytics_updates,
+)
+
+# One per worker process, built by _init_worker
+_EMBEDDER: Optional[MiniChatEmbedder] = None
+
+
+@dataclass
+class UserTiming:
+    email: str
+    rows: int = 0
+    fetch_s: float = 0.0
+    ner_s: float = 0.0
+    wrapped_s: float = 0.0          # excluding NER
+    graph_s: float = 0.0            # excluding NER
+    pid: int = 0
+    error: Optional[str] = None
+
+    @property
+    def total_s(self) -> float:
+        return self.fetch_s + self.ner_s + self.wrapped_s + self.graph_s
+
+    def summary(self) -> str:
+        if self.error:
+            return f"{self.email}: ❌ {self.error}"
+        return (f"{self.email}: {self.rows} rows in {self.total_s:.2f}s "
+                f"(fetch {self.fetch_s:.2f}s, NER {self.ner_s:.2f}s, "
+                f"wrapped {self.wrapped_s:.2f}s, graph {self.graph_s:.2f}s) [pid {self.pid}]")
+
+
+@dataclass
+class UserAnalytics:
+    timing: UserTiming
+    update: Optional[Dict[str, Any]] = None     # analytics_update payload
+
+
+@dataclass
+class BatchReport:
+    users: List[UserTiming] = field(default_factory=list)
+    stored: int = 0
+    write_s: float = 0.0
+    wall_s: float = 0.0
+
+    def summary(self) -> str:
+        ok = [u for u in self.users if not u.error]
+        rows = sum(u.rows for u in ok)
+        phases = {name: sum(getattr(u, f"{name}_s") for u in ok)
+                  for name in ("fetch", "ner", "wrapped", "graph")}
+        rate = rows / self.wall_s if self.wall_s else 0.0
+        return (f"{len(ok)}/{len(self.users)} users, {rows} rows in {self.wall_s:.1f}s "
+                f"({rate:,.0f} rows/s); worker time "
+                + ", ".join(f"{name} {sec:.1f}s" for name, sec in phases.items())
+                + f"; bulk write {self.stored} rows in {self.write_s:.1f}s")
+
+
+def _init_worker(cfg: EmbedConfig):
+    global _EMBEDDER
+    _EMBEDDER = MiniChatEmbedder.for_analytics(cfg)
+
+
+def analyze_user(email: str,
+                 embedder: MiniChatEmbedder,
+                 table_name: str = TABLE_NAME,
+                 fetch_workers: int = 4) -> UserAnalytics:
+    """Fetch one user's rows and compute their analytics with a warm embedder"""
+    timing = UserTiming(email, pid=os.getpid())
+    t0 = time.perf_counter()
+    rows = fetch_rows_for_email(email, table_name, workers=fetch_workers)
+    timing.fetch_s = time.perf_counter() - t0
+    timing.rows = len(rows)
+    if not rows:
+        timing.error = "no rows"
+        return UserAnalytics(timing)
+    if not {"wrapped_json", "graph_json"}.issubset(rows[0].keys()):
+        timing.error = "table schema is missing wrapped_json / graph_json"
+        return UserAnalytics(timing)
+    row_id = rows[0]["id"]
+
+    ner = embedder.ner.stats
+    embedder.reset_graph()
+    df = embedder._sanitize(pd.DataFrame(rows))
+    del rows
+
+    t0, ner0 = time.perf_counter(), ner.seconds
+    rollups = embedder.wrapped_rollups(df)
+    wrapped = rollups.result(email)
+    t1, ner1 = time.perf_counter(), ner.seconds
+    embedder.add_messages_to_graph(df)
+    graph = embedder.graph_summary()
+    t2 = time.perf_counter()
+
+    timing.ner_s = ner.seconds - ner0
+    timing.wrapped_s = (t1 - t0) - (ner1 - ner0)
+    timing.graph_s = (t2 - t1) - (ner.seconds - ner1)
+    save_analytics_state(email, embedder, rollups)
+    return UserAnalytics(timing, analytics_update(row_id, wrapped, graph))
+
+
+def _analyze_in_worker(email: str, table_name: str, fetch_workers: int) -> UserAnalytics:
+    try:
+        return analyze_user(email, _EMBEDDER, table_name, fetch_workers)
+    except Exception as e:
+        return UserAnalytics(UserTiming(email, pid=os.getpid(), error=str(e)))
+
+
+def run_batch_analytics(
+    emails: Optional[Sequence[str]] = None,
+    table_name: str = TABLE_NAME,
+    workers: Optional[int] = None,
+    fetch_workers: int = 4,
+    max_retries: int = 3,
+) -> BatchReport:
+    """
+    Recompute analytics for emails (default: every e-mail in the table) on
+    `workers` processes, then write all of them back in bulk.
+    """
+    wall0 = time.perf_counter()
+    emails = list(emails) if emails is not None else list_emails_in_database(table_name)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(emails) or 1))
+    # Pool workers are daemonic and cannot start spaCy's own NER processes
+    cfg = EmbedConfig(ner_processes=1)
+    print(f"📊 Batch analytics for {len(emails)} users on {workers} worker process(es)")
+
+    report = BatchReport()
+    updates: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cfg,)) as pool:
+        futures = [pool.submit(_analyze_in_worker, email, table_name, fetch_workers)
+                   for email in emails]
+        for done, fut in enumerate(as_completed(futures), 1):
+            result = fut.result()
+            report.users.append(result.timing)
+            if result.update is not None:
+                updates.append(result.update)
+            print(f"   [{done}/{len(emails)}] {result.timing.summary()}")
+
+    print(f"💾 Writing analytics for {len(updates)} users in bulk…")
+    t0 = time.perf_counter()
+    report.stored = store_analytics_updates(updates, table_name, max_retries)
+    report.write_s = time.perf_counter() - t0
+    report.wall_s = time.perf_counter() - wall0
+    print(f"🎉 {report.summary()}")
+    return report
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Recompute wrapped + graph analytics for many users")
+    ap.add_argument("emails", nargs="*", help="users to process (default: every e-mail in the table)")
+    ap.add_argument("--table", default=TABLE_NAME)
+    ap.add_argument("--workers", type=int, default=None,
+                    help="analytics processes (default: one per core)")
+    ap.add_argument("--fetch-workers", type=int, default=4,
+                    help="concurrent page queries per user")
+    args = ap.parse_args()
+
+    run_batch_analytics(args.emails or None, args.table, args.workers, args.fetch_workers)
@@ -0,0 +1,893 @@
+"""
+Ingestion benchmarks.
+
+    python benchmarks.py parse --size-mb 1024
+    python benchmarks.py columnar --messages 100000
+    python benchmarks.py sanitize --rows 500000
+    python benchmarks.py codec --rows 45000
+    python benchmarks.py copy --dsn postgresql://localhost/postgres --rows 100000
+    python benchmarks.py local-embed --texts 5000 --runtime onnx --quantize
+    python benchmarks.py limiter --seconds 10
+    python benchmarks.py ner --messages 20000 --processes 4
+    python benchmarks.py cooccurrence --conversations 2000 --long-mentions 3000
+    python benchmarks.py languages --messages 200000 --terms 2000
+
+Each measured mode runs in its own subprocess so peak RSS is not polluted
+by earlier runs.
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+WORDS = (
+    "python pandas embedding vector query model token batch stream async "
+    "the a of to and in is it for on with as this that error trace function "
+    "react supabase postgres index cluster graph entity spacy voyage claude"
+).split()
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _fake_conversation(rng: random.Random, n_msgs: int, start_ts: float) -> dict:
+    mapping = {}
+    for i in range(n_msgs):
+        node_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        body = " ".join(rng.choices(WORDS, k=rng.randint(5, 400)))
+        mapping[node_id] = {
+            "id": node_id,
+            "message": {
+                "id": node_id,
+                "author": {"role": "user" if i % 2 == 0 else "assistant"},
+                "create_time": start_ts + i * 30,
+                "content": {"content_type": "text", "parts": [body]},
+            },
+        }
+    return {
+        "conversation_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "title": " ".join(rng.choices(WORDS, k=4)),
+        "mapping": mapping,
+    }
+
+
+def make_synthetic_export(path: Path, target_mb: float, seed: int = 0) -> Path:
+    """Write a ChatGPT-style conversations.json of roughly target_mb MB"""
+    rng = random.Random(seed)
+    target = int(target_mb * 1024 * 1024)
+    written = 0
+    with path.open("w", encoding="utf-8") as f:
+        f.write("[")
+        first = True
+        while written < target:
+            conv = _fake_conversation(rng, rng.randint(2, 60), 1.7e9 + written)
+            chunk = ("" if first else ",") + json.dumps(conv)
+            f.write(chunk)
+            written += len(chunk)
+            first = False
+        f.write("]")
+    return path
+
+
+# ── Parse benchmark ────────────────────────────────────────────────
+
+def _parse_worker(mode: str, path: str) -> dict:
+    import claude_parser as cp
+
+    base_rss = _peak_rss_mb()
+    t0 = time.perf_counter()
+    rows = 0
+    if mode == "load":
+        rows = len(cp.conversations_to_dataframe(path, email="bench@example.com"))
+    elif mode == "parallel":
+        rows = len(cp.conversations_to_dataframe(path, email="bench@example.com", parallel=True))
+    elif mode == "stream":
+        for batch in cp.iter_message_batches(path, email="bench@example.com"):
+            rows += len(batch)
+    else:
+        raise ValueError(f"Unknown parse mode: {mode}")
+    return {
+        "mode": mode,
+        "rows": rows,
+        "wall_s": round(time.perf_counter() - t0, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "import_rss_mb": round(base_rss, 1),
+    }
+
+
+def bench_parse(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.export) if args.export else Path(tmp) / "conversations.json"
+        if not args.export:
+            print(f"Generating ~{args.size_mb} MB synthetic export…")
+            make_synthetic_export(path, args.size_mb)
+        print(f"Export: {path} ({path.stat().st_size / 1024 ** 2:.0f} MB)")
+
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, __file__, "_parse-worker", mode, str(path)],
+                capture_output=True, text=True, check=True,
+            )
+            res = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{res['mode']:>8}: {res['rows']:>9} rows  {res['wall_s']:>7.2f}s  "
+                  f"peak RSS {res['peak_rss_mb']:>8.1f} MB "
+                  f"(after import {res['import_rss_mb']:.1f} MB)")
+
+
+# ── Columnar builder benchmark ─────────────────────────────────────
+
+def _legacy_frame(convs, email):
+    """The pre-columnar path: one DataFrame per conversation + concat + cleanup"""
+    import numpy as np
+    import pandas as pd
+    from claude_parser import COLUMN_ORDER, _to_text
+    from datetime import datetime
+
+    dfs = []
+    for conv in convs:
+        rows = []
+        for node in conv.get("mapping", {}).values():
+            msg = node.get("message")
+            if msg is None:
+                continue
+            body = "\n".join(_to_text(p) for p in msg.get("content", {}).get("parts", [])).strip()
+            if not body:
+                continue
+            rows.append({
+                "conversation_id": conv.get("conversation_id"), "email": email,
+                "title": conv.get("title", ""), "body": body, "embeddings_json": None,
+                "created_at": datetime.utcfromtimestamp(msg["create_time"]).isoformat(),
+                "company": "gpt", "author_role": (msg.get("author") or {}).get("role"),
+            })
+        dfs.append(pd.DataFrame(rows)[COLUMN_ORDER])
+    df = pd.concat(dfs, ignore_index=True)
+    df = df[df["body"].str.strip().astype(bool)]
+    df = df.replace([np.inf, -np.inf], np.nan)
+    return df.where(pd.notnull(df), None).reset_index(drop=True)
+
+
+def _columnar_frame(convs, email):
+    from claude_parser import MessageColumns
+
+    cols = MessageColumns(email)
+    for conv in convs:
+        cols.add_conversation(conv)
+    return cols.to_frame()
+
+
+def bench_columnar(args):
+    import tracemalloc
+
+    rng = random.Random(0)
+    convs, n_msgs = [], 0
+    while n_msgs < args.messages:
+        n = rng.randint(2, 2 * args.msgs_per_conv)
+        convs.append(_fake_conversation(rng, n, 1.7e9 + n_msgs))
+        n_msgs += n
+    print(f"{n_msgs} messages in {len(convs)} conversations")
+
+    scale = 100_000 / n_msgs
+    for name, fn in (("legacy", _legacy_frame), ("columnar", _columnar_frame)):
+        t0 = time.perf_counter()
+        fn(convs, "bench@example.com")
+        wall = time.perf_counter() - t0
+
+        tracemalloc.start()
+        df = fn(convs, "bench@example.com")
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+        del df
+        print(f"{name:>9}: {wall * scale:6.2f}s / 100k msgs   "
+              f"peak traced {peak * scale / 1024 ** 2:7.1f} MB / 100k msgs   "
+              f"retained blocks {blocks * scale:>10,.0f} / 100k msgs")
+
+
+# ── Timestamp sanitize benchmark ───────────────────────────────────
+
+def bench_sanitize(args):
+    import pandas as pd
+    from datetime import datetime, timedelta
+    from claude_parser import MiniChatEmbedder
+
+    rng = random.Random(0)
+    start = datetime(2023, 1, 1)
+    stamps = [
+        (start + timedelta(seconds=rng.randint(0, 3e7), microseconds=rng.choice([0, 123456]))).isoformat()
+        for _ in range(args.rows)
+    ]
+    df = pd.DataFrame({
+        "conversation_id": "c", "author_role": "user", "body": "x", "created_at": stamps,
+    })
+    embedder = MiniChatEmbedder.for_parsing()
+
+    t0 = time.perf_counter()
+    clean = embedder._sanitize(df)
+    first = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    embedder._sanitize(clean)
+    repeat = time.perf_counter() - t0
+
+    def per_row(val):
+        return pd.to_datetime(val, errors="coerce", utc=True)
+
+    sample = df["created_at"].head(args.legacy_sample)
+    t0 = time.perf_counter()
+    sample.apply(per_row)
+    legacy = (time.perf_counter() - t0) * args.rows / len(sample)
+
+    print(f"{args.rows} rows: vectorized {first:.3f}s, repeat call {repeat * 1e3:.2f}ms, "
+          f"per-row apply ~{legacy:.1f}s (extrapolated from {len(sample)} rows)")
+
+
+def bench_conversations(args):
+    import collections
+    import tracemalloc
+
+    import numpy as np
+    import pandas as pd
+    from claude_parser import MiniChatEmbedder
+
+    rng = np.random.default_rng(0)
+    n = args.messages
+    df = pd.DataFrame({
+        "conversation_id": pd.Series(rng.integers(0, n // args.msgs_per_conv + 1, n)).map("conv-{}".format),
+        "author_role": rng.choice(["user", "assistant"], n).astype(object),
+        "body": rng.choice(WORDS, n).astype(object),
+        "created_at": pd.to_datetime(rng.integers(0, 10 ** 9, n), unit="s", utc=True),
+    })
+
+    def legacy():
+        grouped = collections.defaultdict(list)
+        for r in df.itertuples(index=False):
+            grouped[r.conversation_id].append({
+                "timestamp": r.created_at, "role": r.author_role, "content": r.body,
+            })
+        out = []
+        for cid, msgs in grouped.items():
+            msgs.sort(key=lambda m: m["timestamp"])
+            out.append("\n\n".join(f"[{m['role'].upper()}] {m['content']}" for m in msgs))
+        return out
+
+    embedder = MiniChatEmbedder.for_parsing()
+    runs = (
+        ("itertuples + per-group sort", legacy),
+        ("vectorized list", lambda: embedder._df_to_conversations(df)),
+        ("vectorized generator", lambda: sum(1 for _ in embedder.iter_df_conversations(df))),
+    )
+    print(f"{n} messages, {df.conversation_id.nunique()} conversations")
+    for label, fn in runs:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn()
+        wall = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        print(f"{label:>27}: {wall:6.2f}s, peak {peak:7.1f} MB")
+
+
+# ── Embedding storage benchmark ────────────────────────────────────
+
+def bench_codec(args):
+    import numpy as np
+    from embedding_codec import decode_many, encode_embedding
+
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((args.rows, args.dim), dtype=np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+
+    legacy = [json.dumps({"conversation": v.tolist()}) for v in vecs]
+
+    def legacy_load(raws):
+        # What server.py used to do: json.loads + list of lists + np.array
+        return np.array([json.loads(r).get("conversation") for r in raws])
+
+    print(f"{args.rows} rows x {args.dim} dims")
+    t0 = time.perf_counter()
+    legacy_load(legacy)
+    base_load = time.perf_counter() - t0
+    base_mb = sum(map(len, legacy)) / 1024 ** 2
+    print(f"{'legacy':>6}: {base_mb:8.1f} MB  {base_mb * 1024 ** 2 / args.rows:7.0f} B/row  "
+          f"load {base_load:6.2f}s")
+
+    for dtype in ("f32", "f16"):
+        encoded = [encode_embedding(v, model="voyage-3-lite", dtype=dtype) for v in vecs]
+        t0 = time.perf_counter()
+        out, _ = decode_many(encoded, args.dim)
+        load = time.perf_counter() - t0
+        mb = sum(map(len, encoded)) / 1024 ** 2
+        cos = np.sum(out * vecs, axis=1) / np.linalg.norm(out, axis=1)
+        print(f"{dtype:>6}: {mb:8.1f} MB  {mb * 1024 ** 2 / args.rows:7.0f} B/row  "
+              f"load {load:6.2f}s  ({base_mb / mb:.1f}x smaller, {base_load / load:.1f}x faster, "
+              f"min cosine to original {cos.min():.6f})")
+
+
+# ── COPY loader benchmark ──────────────────────────────────────────
+
+_BENCH_TABLE_DDL = """
+CREATE TABLE {table} (
+    id bigserial PRIMARY KEY,
+    conversation_id text, email text, title text, body text,
+    embeddings_json text, created_at timestamptz, company text, author_role text,
+    wrapped_json text, graph_json text
+)
+"""
+
+
+def _bench_rows(n: int, seed: int = 0):
+    from embedding_codec import encode_embedding
+
+    rng = random.Random(seed)
+    emb = encode_embedding([0.0] * 512)
+    for i in range(n):
+        yield {
+            "conversation_id": f"conv-{i // 20}",
+            "email": "bench@example.com",
+            "title": "bench",
+            "body": " ".join(rng.choices(WORDS, k=rng.randint(5, 200))),
+            "embeddings_json": emb,
+            "created_at": f"2024-01-01T00:00:{i % 60:02d}",
+            "company": "gpt",
+            "author_role": "user" if i % 2 == 0 else "assistant",
+        }
+
+
+def bench_copy(args):
+    """Needs a scratch Postgres; creates and drops its own table"""
+    import psycopg2
+    from psycopg2.extras import execute_values
+    from pg_loader import CopyLoader
+
+    table = "chat_logs_copy_bench"
+    conn = psycopg2.connect(args.dsn)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {table}")
+        cur.execute(_BENCH_TABLE_DDL.format(table=table))
+    conn.commit()
+
+    try:
+        loader = CopyLoader(args.dsn, table)
+        rows = list(_bench_rows(args.rows))
+        t0 = time.perf_counter()
+        n = loader.load(rows)
+        copy_s = time.perf_counter() - t0
+        print(f"  COPY insert: {n} rows in {copy_s:6.2f}s ({n / copy_s:,.0f} rows/s)")
+
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT id, body FROM {table} ORDER BY id")
+            updates = ({"id": i, "body": b + " (edited)"} for i, b in cur.fetchall())
+        t0 = time.perf_counter()
+        n = loader.load(updates)
+        print(f"  COPY merge:  {n} rows in {time.perf_counter() - t0:6.2f}s (ON CONFLICT (id) DO UPDATE)")
+        loader.close()
+
+        # Baseline: one round trip + commit per batch, like the PostgREST path
+        rows = list(_bench_rows(args.baseline_rows))
+        cols = list(rows[0])
+        t0 = time.perf_counter()
+        with conn.cursor() as cur:
+            for start in range(0, len(rows), args.batch_size):
+                execute_values(
+                    cur, f"INSERT INTO {table} ({', '.join(cols)}) VALUES %s",
+                    [[r[c] for c in cols] for r in rows[start:start + args.batch_size]],
+                )
+                conn.commit()
+        base = time.perf_counter() - t0
+        print(f"  batched INSERT ({args.batch_size}/trip): {len(rows)} rows in {base:6.2f}s "
+              f"({len(rows) / base:,.0f} rows/s) — without HTTP overhead")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.commit()
+        conn.close()
+
+
+# ── Local embedding throughput ─────────────────────────────────────
+
+def bench_local_embed(args):
+    import os
+    from embedding_backends import LocalBackend
+
+    rng = random.Random(0)
+    # Chat-like length mix: mostly short turns, some long pastes
+    texts = [
+        " ".join(rng.choices(WORDS, k=rng.randint(100, 600) if rng.random() < 0.2 else rng.randint(3, 30)))
+        for _ in range(args.texts)
+    ]
+    backend = LocalBackend(
+        model_name=args.model, runtime=args.runtime, quantize=args.quantize,
+        threads=args.threads, processes=args.processes,
+        min_texts_per_process=max(1, args.texts // max(1, args.processes)),
+    )
+    t0 = time.perf_counter()
+    backend.embed_array(texts[:32])
+    print(f"{backend.model_id} ({backend.dim}-d), load + warm-up {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    backend.embed_array(texts)
+    wall = time.perf_counter() - t0
+    cores = max(args.processes, args.threads or 0) or os.cpu_count() or 1
+    print(f"{len(texts)} docs in {wall:.2f}s: {len(texts) / wall:,.0f} docs/s, "
+          f"{len(texts) / wall / cores:,.0f} docs/s/core ({cores} cores)")
+    backend.close()
+
+
+# ── NER throughput ─────────────────────────────────────────────────
+
+def bench_ner(args):
+    import spacy
+    from ner_pipeline import BatchedNER
+
+    rng = random.Random(0)
+    names = ["Python", "Supabase", "London", "Google", "React", "Postgres", "Paris", "OpenAI"]
+    messages = [
+        " ".join(rng.choices(WORDS + names, k=rng.randint(200, 1500) if rng.random() < 0.05
+                             else rng.randint(5, 60))) + "."
+        for _ in range(args.messages)
+    ]
+    transcripts = ["\n\n".join(messages[i:i + args.msgs_per_conv])
+                   for i in range(0, len(messages), args.msgs_per_conv)]
+
+    def load():
+        # As MiniChatEmbedder loads it
+        nlp = spacy.load(args.model, disable=["parser", "lemmatizer"])
+        nlp.add_pipe("sentencizer")
+        return nlp
+
+    nlp = load()
+    print(f"{len(messages)} messages / {len(transcripts)} transcripts, pipeline {nlp.pipe_names}")
+
+    t0 = time.perf_counter()
+    for _ in nlp.pipe(messages, batch_size=128):
+        pass
+    for text in transcripts:
+        nlp(text)
+    legacy = time.perf_counter() - t0
+    print(f"legacy  (full pipeline, 1 core)  : {2 * len(messages) / legacy:8,.0f} msgs/s "
+          f"({legacy:.1f}s for wrapped + graph)")
+
+    for procs in sorted({1, args.processes}):
+        ner = BatchedNER(load(), n_process=procs, min_texts_per_process=1)
+        t0 = time.perf_counter()
+        ner.entities(messages)
+        ner.entities(transcripts)
+        wall = time.perf_counter() - t0
+        rate = 2 * len(messages) / wall
+        print(f"batched (NER only, {procs} process(es)): {rate:8,.0f} msgs/s, "
+              f"{rate / procs:,.0f} msgs/s/core ({wall:.1f}s)")
+
+
+# ── Entity co-occurrence ───────────────────────────────────────────
+
+def bench_cooccurrence(args):
+    import networkx as nx
+    from cooccurrence import EntityCooccurrence
+
+    rng = random.Random(0)
+    vocab = [f"entity{i}" for i in range(args.vocab)]
+    docs = [rng.choices(vocab, k=rng.randint(0, 40)) for _ in range(args.conversations)]
+    # A few very long chats, where the per-pair loop blows up
+    docs += [rng.choices(vocab, k=args.long_mentions) for _ in range(3)]
+    mentions = sum(map(len, docs))
+
+    t0 = time.perf_counter()
+    g = nx.Graph()
+    for entities in docs:
+        g.add_nodes_from(entities)
+        for i, a in enumerate(entities):
+            for b in entities[i + 1:]:
+                if g.has_edge(a, b):
+                    g[a][b]["weight"] += 1
+                else:
+                    g.add_edge(a, b, weight=1)
+    nx.pagerank(g, weight="weight")
+    sorted(g.edges(data=True), key=lambda e: e[2]["weight"], reverse=True)[:10]
+    legacy = time.perf_counter() - t0
+    print(f"{len(docs)} documents, {mentions} mentions, {g.number_of_edges()} edges")
+    print(f"networkx pairs + pagerank : {legacy:7.2f}s")
+
+    for window in (None, args.window):
+        t0 = time.perf_counter()
+        cooc = EntityCooccurrence(window=window)
+        cooc.add_documents(docs)
+        cooc.top_entities(10)
+        cooc.top_edges(10)
+        wall = time.perf_counter() - t0
+        label = f"window {window}" if window else "full"
+        print(f"sparse ({label:>9}) + pagerank: {wall:7.2f}s ({legacy / wall:.0f}x)")
+
+
+# ── Language / term matching ───────────────────────────────────────
+
+def bench_languages(args):
+    import re
+
+    import pandas as pd
+    from term_matcher import DEFAULT_LANGUAGES, TermMatcher
+
+    rng = random.Random(0)
+    vocab = WORDS + ["python", "java", "c++", "rust", "golang", "sql"]
+    bodies = pd.Series([" ".join(rng.choices(vocab, k=rng.randint(5, 120)))
+                        for _ in range(args.messages)])
+    mb = bodies.str.len().sum() / 1e6
+    print(f"{len(bodies)} messages, {mb:.0f} MB")
+
+    t0 = time.perf_counter()
+    for lang in DEFAULT_LANGUAGES:
+        bodies.str.contains(fr"\b{re.escape(lang)}\b", case=False).sum()
+    legacy = time.perf_counter() - t0
+    print(f"{len(DEFAULT_LANGUAGES)} str.contains scans : {legacy:6.2f}s")
+
+    # Synthetic framework/library names on top of the defaults
+    extra = {f"{rng.choice(WORDS)}{rng.choice(WORDS)}{i}": "lib" for i in range(args.terms)}
+    for n_terms, terms in ((len(DEFAULT_LANGUAGES), DEFAULT_LANGUAGES),
+                           (len(DEFAULT_LANGUAGES) + len(extra),
+                            {**{t: t for t in DEFAULT_LANGUAGES}, **extra})):
+        matcher = TermMatcher(terms)
+        t0 = time.perf_counter()
+        matcher.count_documents(bodies)
+        wall = time.perf_counter() - t0
+        print(f"trie matcher, {n_terms:5d} terms: {wall:6.2f}s")
+
+
+# ── Incremental wrapped stats ──────────────────────────────────────
+
+def bench_wrapped(args):
+    import tempfile
+
+    import pandas as pd
+    from term_matcher import DEFAULT_LANGUAGES, TermMatcher
+    from wrapped_stats import AnalyticsStore, AnalyticsState, WrappedRollups
+
+    rng = random.Random(0)
+    vocab = WORDS + ["python", "rust", "sql", "Berlin", "Alice", "Google"]
+    n = args.history + args.new
+    start = pd.Timestamp("2023-01-01", tz="UTC")
+    df = pd.DataFrame({
+        "conversation_id": [f"conv-{rng.randrange(n // 20 + 1)}" for _ in range(n)],
+        "author_role": [rng.choice(("user", "assistant")) for _ in range(n)],
+        "body": [" ".join(rng.choices(vocab, k=rng.randint(3, 60))) for _ in range(n)],
+        "created_at": start + pd.to_timedelta(sorted(rng.randrange(2 * 365 * 86400)
+                                                     for _ in range(n)), unit="s"),
+    })
+    history, new = df.iloc[:args.history], df.iloc[args.history:]
+    languages = TermMatcher(DEFAULT_LANGUAGES)
+
+    def rollups(frame):
+        # Stand-in NER: capitalized words; the real pass is cached per body
+        user = frame.body[frame.author_role.eq("user")]
+        ents = [[(w, "X") for w in t.split() if w[:1].isupper()] for t in user]
+        return WrappedRollups().update(frame, ents, languages)
+
+    t0 = time.perf_counter()
+    rollups(df).result()
+    full = time.perf_counter() - t0
+
+    store = AnalyticsStore(tempfile.mkdtemp())
+    store.save("bench", AnalyticsState(rollups(history)))
+    t0 = time.perf_counter()
+    state = store.load("bench")
+    state.rollups.merge(rollups(new))
+    state.rollups.result()
+    store.save("bench", state)
+    inc = time.perf_counter() - t0
+    print(f"{args.history} stored + {args.new} new messages, {len(state.rollups.months)} months")
+    print(f"full recompute       : {full:6.2f}s")
+    print(f"load + fold + save   : {inc:6.2f}s ({full / inc:.0f}x)")
+
+
+# ── Heavy hitters ──────────────────────────────────────────────────
+
+def bench_topk(args):
+    import collections
+    import tracemalloc
+
+    import numpy as np
+    from heavy_hitters import SpaceSaving
+
+    rng = np.random.default_rng(0)
+    stream = [f"entity-{x}" for x in rng.zipf(args.zipf, args.mentions)]
+    batches = [collections.Counter(stream[i:i + 10_000]) for i in range(0, len(stream), 10_000)]
+    exact_top = None
+    for capacity in (None, args.capacity):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        ss = SpaceSaving(capacity)
+        for batch in batches:
+            ss.update(batch)
+        top = ss.most_common(args.k)
+        wall = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        exact_top = exact_top or [item for item, _ in top]
+        recall = len(set(exact_top) & {item for item, _ in top}) / len(exact_top)
+        label = "exact" if capacity is None else f"capacity {capacity}"
+        print(f"{label:>15}: {len(ss):8d} items, peak {peak:7.1f} MB, {wall:5.2f}s, "
+              f"top-{args.k} recall {recall:.0%}, max error {ss.max_error} "
+              f"(bound {ss.error_bound:.0f}), {len(ss.guaranteed(args.k))} guaranteed")
+
+
+# ── Import / startup time ──────────────────────────────────────────
+
+_HEAVY_MODULES = ("spacy", "llama_index", "anthropic", "supabase")
+
+_STARTUP_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import claude_parser
+t1 = time.perf_counter()
+claude_parser.MiniChatEmbedder.for_parsing()
+claude_parser.MiniChatEmbedder.for_analytics()
+t2 = time.perf_counter()
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print(json.dumps({{"import": t1 - t0, "construct": t2 - t1, "heavy": heavy}}))
+"""
+
+
+def bench_startup(args):
+    """
+    Import claude_parser and build analytics / parsing embedders in fresh
+    interpreters. Exits non-zero if the median import time exceeds
+    --max-import-s or a heavy dependency is imported eagerly, so it can
+    guard against regressions.
+    """
+    import statistics
+
+    probe = _STARTUP_PROBE.format(heavy=_HEAVY_MODULES)
+    runs = []
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", probe], capture_output=True,
+                             text=True, check=True, cwd=Path(__file__).parent)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    imp = statistics.median(r["import"] for r in runs)
+    construct = statistics.median(r["construct"] for r in runs)
+    heavy = runs[-1]["heavy"]
+    print(f"import claude_parser      : {imp:6.3f}s (median of {len(runs)})")
+    print(f"for_parsing + for_analytics: {construct * 1e3:6.2f}ms")
+    print(f"heavy modules after import: {', '.join(heavy) or 'none'}")
+
+    failed = []
+    if imp > args.max_import_s:
+        failed.append(f"import took {imp:.2f}s > {args.max_import_s:.2f}s")
+    if heavy:
+        failed.append(f"imported eagerly: {', '.join(heavy)}")
+    if failed:
+        print("❌ " + "; ".join(failed))
+        sys.exit(1)
+
+
+# ── Rate limiter against a fake provider ───────────────────────────
+
+class _FakeRateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("429 Too Many Requests")
+        self.response = type("Response", (), {"headers": {"retry-after": f"{retry_after:.2f}"}})()
+
+
+class _FakeProvider:
+    """
+    Enforces `rps` requests/second and `max_in_flight` concurrent calls with
+    429s; latency grows once more than `knee` calls are in flight.
+    """
+
+    def __init__(self, rps: float, max_in_flight: int, knee: int, latency_s: float):
+        import threading
+
+        self.rps, self.max_in_flight, self.knee, self.latency_s = rps, max_in_flight, knee, latency_s
+        self._tokens, self._stamp = rps, time.monotonic()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def __call__(self, texts):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rps, self._tokens + (now - self._stamp) * self.rps)
+            self._stamp = now
+            if self._tokens < 1 or self._in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise _FakeRateLimited(retry_after=max(0.0, (1 - self._tokens) / self.rps))
+            self._tokens -= 1
+            self._in_flight += 1
+            load = self._in_flight
+        time.sleep(self.latency_s * (1 + max(0, load - self.knee) / self.knee))
+        with self._lock:
+            self._in_flight -= 1
+        return [[0.0] for _ in texts]
+
+
+def _limiter_run(args, limited: bool) -> dict:
+    import statistics
+    import threading
+
+    from rate_limiter import Priority, ProviderConfig, limiter_for
+
+    provider = _FakeProvider(args.rps, args.max_in_flight, args.knee, args.latency_ms / 1000)
+    # quota_factor > 1 configures more than the real quota; AIMD has to find it from 429s
+    limiter = limiter_for("fake", ProviderConfig(
+        requests_per_minute=args.rps * 60 * args.quota_factor, max_concurrency=args.workers,
+        target_latency_s=3 * args.latency_ms / 1000, max_backoff_s=2.0,
+    ))
+    stop = time.monotonic() + args.seconds
+    done, interactive = [0], []
+
+    def naive(fn, *a):
+        # The old pattern: fixed exponential sleeps, no shared state
+        for attempt in range(1, 8):
+            try:
+                return fn(*a)
+            except _FakeRateLimited:
+                time.sleep(min(2.0, 0.05 * 2 ** attempt))
+        return None
+
+    def call(fn, priority):
+        if limited:
+            try:
+                return limiter.call(fn, ["x"], priority=priority, max_retries=8)
+            except _FakeRateLimited:
+                return None
+        return naive(fn, ["x"])
+
+    def batch_worker():
+        while time.monotonic() < stop:
+            if call(provider, Priority.BATCH) is not None:
+                done[0] += 1
+
+    def interactive_worker():
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            call(provider, Priority.INTERACTIVE)
+            interactive.append(time.perf_counter() - t0)
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=batch_worker) for _ in range(args.workers)]
+    threads.append(threading.Thread(target=interactive_worker))
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    interactive.sort()
+    return {
+        "batch_per_s": done[0] / wall,
+        "rejected": provider.rejected,
+        "interactive_p50_ms": 1000 * statistics.median(interactive) if interactive else 0.0,
+        "interactive_p95_ms": 1000 * interactive[max(0, -(-95 * len(interactive) // 100) - 1)] if interactive else 0.0,
+        "interactive_calls": len(interactive),
+        "limit": limiter.limit if limited else None,
+    }
+
+
+def bench_limiter(args):
+    print(f"fake provider: {args.rps} req/s, {args.max_in_flight} concurrent, "
+          f"{args.latency_ms}ms base latency; {args.workers} batch workers + 1 interactive caller")
+    for limited in (False, True):
+        r = _limiter_run(args, limited)
+        label = "shared limiter" if limited else "fixed sleeps  "
+        extra = f", concurrency limit settled at {r['limit']:.1f}" if limited else ""
+        print(f"{label}: {r['batch_per_s']:6.1f} batch calls/s, {r['rejected']:5d} 429s, "
+              f"{r['interactive_calls']:3d} interactive calls, p50 {r['interactive_p50_ms']:6.0f}ms / "
+              f"p95 {r['interactive_p95_ms']:6.0f}ms{extra}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("parse", help="peak RSS / wall time of load, parallel and stream parsing")
+    p.add_argument("--size-mb", type=float, default=1024)
+    p.add_argument("--export", help="use an existing export instead of a synthetic one")
+    p.add_argument("--modes", nargs="+", default=["load", "parallel", "stream"])
+    p.set_defaults(func=bench_parse)
+
+    c = sub.add_parser("columnar", help="time / allocations of per-conversation frames vs MessageColumns")
+    c.add_argument("--messages", type=int, default=100_000)
+    c.add_argument("--msgs-per-conv", type=int, default=10)
+    c.set_defaults(func=bench_columnar)
+
+    t = sub.add_parser("sanitize", help="vectorized vs per-row created_at parsing")
+    t.add_argument("--rows", type=int, default=500_000)
+    t.add_argument("--legacy-sample", type=int, default=20_000)
+    t.set_defaults(func=bench_sanitize)
+
+    cv = sub.add_parser("conversations", help="vectorized _df_to_conversations vs the itertuples loop")
+    cv.add_argument("--messages", type=int, default=1_000_000)
+    cv.add_argument("--msgs-per-conv", type=int, default=20)
+    cv.set_defaults(func=bench_conversations)
+
+    e = sub.add_parser("codec", help="size / load time of legacy JSON vs v2 binary embeddings")
+    e.add_argument("--rows", type=int, default=45_000)
+    e.add_argument("--dim", type=int, default=512)
+    e.set_defaults(func=bench_codec)
+
+    k = sub.add_parser("copy", help="COPY + merge loader vs per-batch inserts (needs a scratch Postgres)")
+    k.add_argument("--dsn", required=True)
+    k.add_argument("--rows", type=int, default=100_000)
+    k.add_argument("--baseline-rows", type=int, default=10_000)
+    k.add_argument("--batch-size", type=int, default=50)
+    k.set_defaults(func=bench_copy)
+
+    m = sub.add_parser("local-embed", help="docs/sec of the local CPU embedding backend")
+    m.add_argument("--texts", type=int, default=5_000)
+    m.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    m.add_argument("--runtime", choices=["torch", "onnx"], default="torch")
+    m.add_argument("--quantize", action="store_true", help="int8 dynamic quantization")
+    m.add_argument("--threads", type=int, default=None)
+    m.add_argument("--processes", type=int, default=1)
+    m.set_defaults(func=bench_local_embed)
+
+    n = sub.add_parser("ner", help="msgs/sec/core of batched multi-process NER vs per-document parsing")
+    n.add_argument("--messages", type=int, default=20_000)
+    n.add_argument("--msgs-per-conv", type=int, default=10)
+    n.add_argument("--model", default="en_core_web_sm")
+    n.add_argument("--processes", type=int, default=4)
+    n.set_defaults(func=bench_ner)
+
+    g = sub.add_parser("cooccurrence", help="sparse co-occurrence + PageRank vs networkx per-pair updates")
+    g.add_argument("--conversations", type=int, default=2_000)
+    g.add_argument("--vocab", type=int, default=2_000)
+    g.add_argument("--long-mentions", type=int, default=3_000)
+    g.add_argument("--window", type=int, default=20)
+    g.set_defaults(func=bench_cooccurrence)
+
+    lg = sub.add_parser("languages", help="single-pass trie matcher vs one str.contains scan per language")
+    lg.add_argument("--messages", type=int, default=200_000)
+    lg.add_argument("--terms", type=int, default=2_000, help="extra dictionary terms for the scaling run")
+    lg.set_defaults(func=bench_languages)
+
+    ws = sub.add_parser("wrapped", help="full wrapped recompute vs folding new messages into saved rollups")
+    ws.add_argument("--history", type=int, default=200_000)
+    ws.add_argument("--new", type=int, default=2_000)
+    ws.set_defaults(func=bench_wrapped)
+
+    hk = sub.add_parser("topk", help="exact Counter vs bounded SpaceSaving for top entities / queries")
+    hk.add_argument("--mentions", type=int, default=2_000_000)
+    hk.add_argument("--zipf", type=float, default=1.2)
+    hk.add_argument("--capacity", type=int, default=2_000)
+    hk.add_argument("-k", type=int, default=15)
+    hk.set_defaults(func=bench_topk)
+
+    st = sub.add_parser("startup", help="import time of claude_parser and lazy embedder construction")
+    st.add_argument("--repeat", type=int, default=5)
+    st.add_argument("--max-import-s", type=float, default=1.5,
+                    help="fail if the median import takes longer than this")
+    st.set_defaults(func=bench_startup)
+
+    r = sub.add_parser("limiter", help="shared rate limiter vs fixed sleeps against a fake rate-limited provider")
+    r.add_argument("--seconds", type=float, default=10)
+    r.add_argument("--workers", type=int, default=16)
+    r.add_argument("--rps", type=float, default=20)
+    r.add_argument("--max-in-flight", type=int, default=6)
+    r.add_argument("--knee", type=int, default=3)
+    r.add_argument("--latency-ms", type=float, default=100)
+    r.add_argument("--quota-factor", type=float, default=1.0,
+                   help="configured rate limit as a multiple of the fake provider's real one")
+    r.set_defaults(func=bench_limiter)
+
+    w = sub.add_parser("_parse-worker")
+    w.add_argument("mode")
+    w.add_argument("path")
+    w.set_defaults(func=lambda a: print(json.dumps(_parse_worker(a.mode, a.path))))
+
+    args = ap.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,50 @@
+from __future__ import annotations
+
+import functools
 import json
+import operator
+import os
 import time
 import collections
+import hashlib
+import itertools
+import queue
 import re
+import threading
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, Callable, List, Dict, Any, Iterable, Iterator, Set, Tuple
 from datetime import datetime, timedelta
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import pandas as pd
 import numpy as np
-import networkx as nx
-import spacy
-from supabase import create_client
-from anthropic import Anthropic
-
-from llama_index.core import (
-    Document, Settings, VectorStoreIndex, StorageContext,
-)
-from llama_index.core.schema import BaseNode, TextNode, NodeWithScore
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.embeddings.voyageai import VoyageEmbedding
-from llama_index.vector_stores.supabase import SupabaseVectorStore
+
+# spaCy, llama_index, supabase and anthropic take seconds to import and are
+# only needed by some code paths, so they are imported where first used
+if TYPE_CHECKING:
+    import networkx as nx
+    from anthropic import Anthropic
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.core.schema import NodeWithScore
+    from llama_index.vector_stores.supabase import SupabaseVectorStore
+    from supabase import Client
+
+from embedding_backends import EmbeddingBackend, get_backend
+from embedding_cache import EmbeddingCache
+from embedding_codec import encode_embedding
+from token_batcher import TokenBudgetBatcher
+from ingest_journal import IngestJournal, batch_key
+from near_dedup import NearDuplicateIndex
+from cooccurrence import EntityCooccurrence
+from entity_cache import EntityCache, model_version
+from ner_pipeline import BatchedNER, keep_entity, ner_components
+from heavy_hitters import capacity_for_budget
+from term_matcher import DEFAULT_LANGUAGES, TermMatcher, load_terms
+from wrapped_stats import AnalyticsState, AnalyticsStore, WrappedRollups
+from pg_loader import CopyLoader
+import rate_limiter
+from rate_limiter import Priority, estimate_chat_tokens
 
 # ── Configuration ──────────────────────────────────────────────────
 SUPABASE_URL = "https://aqavgmrcggugruedqtzv.supabase.co"
@@ -32,10 +56,49 @@ ANTHROPIC_API_KEY = "sk-ant-REDACTED
 MODEL_NAME = "voyage-3-lite"
 DIMENSION = 512
 TABLE_NAME = "chat_logs_final"
-
-# Initialize clients
-client = create_client(SUPABASE_URL, SUPABASE_KEY)
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
+# Rows per COPY when loading over a direct Postgres connection
+COPY_BATCH_SIZE = 2_000
+# "voyage" (hosted, 512-d) or "local" (sentence-transformers on the CPU)
+EMBEDDING_BACKEND = os.environ.get("WRAPPED_EMBEDDING_BACKEND", "voyage")
+# Minimum estimated Jaccard similarity for bodies to share one embedding;
+# 0 (the default) disables near-dedup, e.g. 0.9 opts in
+DEDUP_THRESHOLD = float(os.environ.get("WRAPPED_DEDUP_THRESHOLD", 0))
+
+# ── Clients (created on first use) ─────────────────────────────────
+_clients_lock = threading.Lock()
+
+def get_client() -> Client:
+    """The Supabase client; assigning claude_parser.client replaces it"""
+    with _clients_lock:
+        if "client" not in globals():
+            from supabase import create_client
+            globals()["client"] = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return globals()["client"]
+
+def get_anthropic_client() -> Anthropic:
+    """The Anthropic client; assigning claude_parser.anthropic_client replaces it"""
+    with _clients_lock:
+        if "anthropic_client" not in globals():
+            from anthropic import Anthropic
+            globals()["anthropic_client"] = Anthropic(api_key=ANTHROPIC_API_KEY)
+        return globals()["anthropic_client"]
+
+def __getattr__(name: str):
+    # `from claude_parser import client` keeps working without an eager client
+    if name == "client":
+        return get_client()
+    if name == "anthropic_client":
+        return get_anthropic_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def make_embedding_backend(name: str | None = None,
+                           batcher: TokenBudgetBatcher | None = None) -> EmbeddingBackend:
+    """The configured embedding backend (EMBEDDING_BACKEND unless name is given)"""
+    name = name or EMBEDDING_BACKEND
+    if name == "voyage":
+        return get_backend(name, model_name=MODEL_NAME, api_key=VOYAGE_KEY,
+                           dimension=DIMENSION, batcher=batcher)
+    return get_backend(name)
 
 @dataclass
 class EmbedConfig:
@@ -44,48 +107,138 @@ class EmbedConfig:
     sent: int = 256
     chunk_ov: int = 100
     sent_ov: int = 20
+    # Batched NER (see ner_pipeline.BatchedNER)
+    ner_processes: int = max(1, (os.cpu_count() or 1) - 1)
+    ner_batch_size: int = 128
+    ner_max_chars: int = 5_000
+    ner_memo_size: int = 200_000
+    # Persist per-message entities across runs (see entity_cache.EntityCache)
+    entity_cache: bool = True
+    # Only count entities at most this many mentions apart as co-occurring
+    cooc_window: int | None = None
+    # JSON {label: [surface forms]} for the languages stat (see term_matcher)
+    language_terms: str | None = os.environ.get("WRAPPED_LANGUAGE_TERMS")
+    # Entities / queries kept per counter for the wrapped top-k (None = exact);
+    # WRAPPED_TOPK_MEMORY_MB sets it as a memory budget
+    top_k_capacity: int | None = (
+        capacity_for_budget(int(float(os.environ["WRAPPED_TOPK_MEMORY_MB"]) * 2**20))
+        if os.environ.get("WRAPPED_TOPK_MEMORY_MB") else None
+    )
 
 class MiniChatEmbedder:
+    """
+    Analytics, chunking and vector-store access for chat exports.
+
+    Components are built on first use: the spaCy pipeline (and the NER
+    runner on top of it), the embedding backend, the sentence splitter and
+    the Supabase vector store. An instance only builds components within
+    its capabilities; for_analytics() and for_parsing() give instances that
+    never load embeddings or open the vector store, and so never touch the
+    network while constructing them.
+    """
     _DAYS_RE = re.compile(r"(\d+)\s+days,\s+([\d:.]+)")
 
-    def __init__(self, cfg: EmbedConfig = None):
+    NLP = "nlp"                     # spaCy: NER, wrapped stats, entity graph
+    EMBEDDINGS = "embeddings"       # embedding backend + sentence splitter
+    VECTOR_STORE = "vector_store"   # Supabase vector collection
+    ALL = frozenset({NLP, EMBEDDINGS, VECTOR_STORE})
+
+    def __init__(self, cfg: EmbedConfig = None, backend: EmbeddingBackend | None = None,
+                 capabilities: Iterable[str] = ALL):
         self.cfg = cfg or EmbedConfig()
-        
-        # Initialize spaCy
-        self.nlp = spacy.load("en_core_web_sm", disable=["parser", "lemmatizer"])
-        self.nlp.add_pipe("sentencizer")
-        
-        # Initialize embedding model
-        Settings.embed_model = VoyageEmbedding(
-            model_name=MODEL_NAME,
-            voyage_api_key=VOYAGE_KEY,
-            input_type="document",
+        self.capabilities = frozenset(capabilities)
+        unknown = self.capabilities - self.ALL
+        if unknown:
+            raise ValueError(f"Unknown capabilities: {sorted(unknown)}")
+        self._backend = backend
+
+        # Languages / frameworks stat, matched in one pass per message
+        self.languages = TermMatcher(
+            load_terms(self.cfg.language_terms) if self.cfg.language_terms else DEFAULT_LANGUAGES
         )
-        
-        # Bootstrap vector collection
+
+        # Entity graph, as a sparse co-occurrence matrix
+        self.cooc = EntityCooccurrence(window=self.cfg.cooc_window)
+
+    @classmethod
+    def for_analytics(cls, cfg: EmbedConfig = None) -> "MiniChatEmbedder":
+        """Wrapped stats and the entity graph only (spaCy, no embeddings or vector store)"""
+        return cls(cfg, capabilities={cls.NLP})
+
+    @classmethod
+    def for_parsing(cls, cfg: EmbedConfig = None) -> "MiniChatEmbedder":
+        """Sanitizing and conversation assembly only (no models, no network)"""
+        return cls(cfg, capabilities=())
+
+    def _require(self, capability: str):
+        if capability not in self.capabilities:
+            raise RuntimeError(
+                f"This MiniChatEmbedder was built without {capability!r} "
+                f"(capabilities: {sorted(self.capabilities) or 'none'})"
+            )
+
+    # ── Lazy components ─────────────────────────────────────────────
+
+    @functools.cached_property
+    def nlp(self):
+        self._require(self.NLP)
+        import spacy
+
+        nlp = spacy.load("en_core_web_sm", disable=["parser", "lemmatizer"])
+        nlp.add_pipe("sentencizer")
+        return nlp
+
+    @functools.cached_property
+    def ner(self) -> BatchedNER:
+        return BatchedNER(
+            self.nlp,
+            n_process=self.cfg.ner_processes,
+            batch_size=self.cfg.ner_batch_size,
+            max_chars=self.cfg.ner_max_chars,
+            memo_size=self.cfg.ner_memo_size,
+            cache=(EntityCache(model_version(self.nlp, self.cfg.ner_max_chars,
+                                             *ner_components(self.nlp)))
+                   if self.cfg.entity_cache else None),
+        )
+
+    @functools.cached_property
+    def backend(self) -> EmbeddingBackend:
+        self._require(self.EMBEDDINGS)
+        from llama_index.core import Settings
+
+        backend = self._backend or make_embedding_backend()
+        Settings.embed_model = backend.as_llama_index()
+        return backend
+
+    @functools.cached_property
+    def parser(self) -> SentenceSplitter:
+        """Splitter for conversations"""
+        self._require(self.EMBEDDINGS)
+        from llama_index.core.node_parser import SentenceSplitter
+
+        return SentenceSplitter(chunk_size=self.cfg.conv_chunk, chunk_overlap=200)
+
+    @functools.cached_property
+    def store(self) -> SupabaseVectorStore:
+        """Vector store for conversations only"""
+        self._require(self.VECTOR_STORE)
+        from llama_index.vector_stores.supabase import SupabaseVectorStore
+
+        self.backend    # queries through the store embed with Settings.embed_model
         self._bootstrap_vector_collection()
-        
-        # Initialize vector store for conversations only
-        self.store = SupabaseVectorStore(
+        return SupabaseVectorStore(
             postgres_connection_string=POSTGRES_CONN,
             collection_name=TABLE_NAME,
             dimension=DIMENSION,
             overwrite_collection=False,
             vector_column="embedding_conv_512",
         )
-        
-        # Initialize parser for conversations
-        self.parser = SentenceSplitter(
-            chunk_size=self.cfg.conv_chunk, 
-            chunk_overlap=200
-        )
-        
-        # Entity graph
-        self.G = nx.Graph()
 
     @staticmethod
     def _bootstrap_vector_collection():
         """Create the vector collection if it doesn't exist"""
+        from llama_index.vector_stores.supabase import SupabaseVectorStore
+
         SupabaseVectorStore(
             postgres_connection_string=POSTGRES_CONN,
             collection_name=TABLE_NAME,
@@ -93,8 +246,16 @@ class MiniChatEmbedder:
             overwrite_collection=False,
         )
 
+    # Set in DataFrame.attrs once a frame has been through _sanitize
+    _SANITIZED_ATTR = "wrapped_sanitized"
+
     def _sanitize(self, df: pd.DataFrame) -> pd.DataFrame:
         """Clean and validate dataframe"""
+        if (df.attrs.get(self._SANITIZED_ATTR)
+                and "created_at" in df
+                and isinstance(df["created_at"].dtype, pd.DatetimeTZDtype)):
+            return df
+
         rename_map = {"create_time": "created_at", "timestamp": "created_at"}
         df = df.rename(columns={k: v for k, v in rename_map.items() if k in df})
 
@@ -103,177 +264,161 @@ class MiniChatEmbedder:
         if missing:
             raise ValueError(f"Missing columns: {missing}")
 
-        df["created_at"] = df["created_at"].apply(self._parse_created_at)
+        df["created_at"] = self._parse_created_at(df["created_at"])
         df = df.dropna(subset=["created_at"])
+        df.attrs[self._SANITIZED_ATTR] = True
         return df
 
-    def _parse_created_at(self, val):
-        """Parse various timestamp formats"""
-        if pd.isna(val):
-            return pd.NaT
-        
-        # Try standard datetime parsing first
-        ts = pd.to_datetime(val, errors="coerce", utc=True)
-        if ts is not pd.NaT:
-            return ts
-        
-        # Try custom format
-        m = self._DAYS_RE.fullmatch(str(val).strip())
-        if m:
-            days, timestr = int(m.group(1)), m.group(2)
-            base = datetime(1970, 1, 1, tzinfo=pd.Timestamp.utcnow().tz)
-            return base + timedelta(days=days) + pd.to_timedelta(timestr)
-        
-        return pd.NaT
+    @classmethod
+    def _parse_created_at(cls, col: pd.Series) -> pd.Series:
+        """Parse various timestamp formats into UTC datetimes, column-wise"""
+        if not pd.api.types.is_object_dtype(col) and not pd.api.types.is_string_dtype(col):
+            # Already datetimes (or epoch numbers): a single conversion does it
+            return pd.to_datetime(col, errors="coerce", utc=True)
+
+        # Fast path: everything we write ourselves is ISO 8601
+        out = pd.to_datetime(col, errors="coerce", utc=True, format="ISO8601")
+        todo = out.isna() & col.notna()
+        if not todo.any():
+            return out
+
+        # Other free-form date strings
+        rest = col[todo]
+        out[todo] = pd.to_datetime(rest, errors="coerce", utc=True, format="mixed")
+        todo &= out.isna()
+        if not todo.any():
+            return out
+
+        # Custom "N days, HH:MM:SS" offsets from the epoch
+        parts = col[todo].astype(str).str.strip().str.extract(f"^{cls._DAYS_RE.pattern}$")
+        offset = (
+            pd.to_timedelta(pd.to_numeric(parts[0]), unit="D")
+            + pd.to_timedelta(parts[1], errors="coerce")
+        )
+        out[todo] = pd.Timestamp(0, tz="UTC") + offset
+        return out
 
     def _df_to_conversations(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
         """Convert dataframe to conversation format"""
-        grouped = collections.defaultdict(list)
-        for r in df.itertuples(index=False):
-            grouped[r.conversation_id].append({
-                "timestamp": r.created_at,
-                "role": r.author_role,
-                "content": r.body
-            })
-        
-        convs = []
-        for cid, msgs in grouped.items():
-            msgs.sort(key=lambda m: m["timestamp"])
-            text = "\n\n".join(f"[{m['role'].upper()}] {m['content']}" for m in msgs)
-            convs.append({
+        return list(self.iter_df_conversations(df))
+
+    @staticmethod
+    def iter_df_conversations(df: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one {"id", "text", "meta"} conversation at a time, in order of
+        first appearance, with messages ordered by created_at.
+
+        One stable lexsort orders the rows by (conversation, created_at);
+        the "[ROLE] " prefixes are built column-wise and each transcript is
+        joined from its slice between group boundaries, so only the
+        transcript being yielded is materialized.
+        """
+        if df.empty:
+            return
+        codes, uniques = pd.factorize(df["conversation_id"], use_na_sentinel=False)
+        # .values keeps tz-aware timestamps as datetime64 (UTC), not Timestamp objects
+        order = np.lexsort((df["created_at"].values, codes))
+        codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)]
+
+        # Few distinct roles: format each prefix once and gather by role code
+        role_codes, roles = pd.factorize(df["author_role"], use_na_sentinel=False)
+        role_prefixes = np.array([f"[{str(r).upper()}] " for r in roles], dtype=object)
+        prefixes = role_prefixes[role_codes][order]
+        bodies = df["body"].astype(str).to_numpy()[order]
+        # factorize turns a missing id into NaN; keep it None (JSON null)
+        ids = [None if pd.isna(u) else u for u in uniques.tolist()]
+        for a, b in zip(starts.tolist(), ends.tolist()):
+            cid = ids[codes[a]]
+            yield {
                 "id": cid,
-                "text": text,
-                "meta": {"conversation_id": cid}
-            })
-        return convs
+                "text": "\n\n".join(map(operator.add, prefixes[a:b], bodies[a:b])),
+                "meta": {"conversation_id": cid},
+            }
 
     def build_entity_graph(self, texts: List[str]):
         """Build entity co-occurrence graph"""
-        for text in texts:
-            doc = self.nlp(text)
-            entities = [
-                ent.text.strip() for ent in doc.ents
-                if len(ent.text.strip()) >= 3 
-                and not ent.text.strip().isdigit()
-                and not re.fullmatch(r"[#\\d/_.]+", ent.text.strip())
-                and ent.label_ not in {"DATE", "TIME"}
-            ]
-            
-            # Add nodes and edges
-            for ent in entities:
-                if not self.G.has_node(ent):
-                    self.G.add_node(ent)
-            
-            # Add co-occurrence edges
-            for i, ent1 in enumerate(entities):
-                for ent2 in entities[i+1:]:
-                    if self.G.has_edge(ent1, ent2):
-                        self.G[ent1][ent2]["weight"] += 1
-                    else:
-                        self.G.add_edge(ent1, ent2, weight=1)
+        self.add_entities_to_graph(self.ner.entities(texts))
+
+    def add_entities_to_graph(self, entity_lists: Iterable[List[tuple]],
+                              keys: Iterable[str] | None = None):
+        """
+        Add one co-occurrence group per (text, label) entity list to the
+        graph; groups sharing a key (conversation id) extend each other.
+        """
+        keys = itertools.repeat(None) if keys is None else keys
+        for ents, key in zip(entity_lists, keys):
+            self.cooc.add_document([
+                txt for txt, label in ents
+                if keep_entity(txt) and label not in {"DATE", "TIME"}
+            ], key=key)
+
+    def reset_graph(self):
+        """Start an empty entity graph (e.g. before the next user's analytics)"""
+        self.cooc = EntityCooccurrence(window=self.cfg.cooc_window)
+
+    @property
+    def G(self) -> nx.Graph:
+        """The entity graph as networkx, built on each access"""
+        return self.cooc.to_networkx()
 
     def process_for_analytics_only(self, df: pd.DataFrame):
         """Process dataframe for analytics without creating vector index"""
         df = self._sanitize(df)
         convs = self._df_to_conversations(df)
-        
-        # Just build entity graph for analytics
-        for conv in convs:
-            self.build_entity_graph([conv["text"]])
-        
+        self.add_messages_to_graph(df)
         return convs
 
-    def spotify_wrapped(self, df: pd.DataFrame, user_id: str = None) -> Dict[str, Any]:
-        """Generate Spotify-like wrapped statistics"""
+    def add_messages_to_graph(self, df: pd.DataFrame):
+        """Add a sanitized frame's messages to the entity graph"""
+        # Entity graph from per-message entities (one NER pass, cached by
+        # body), grouped per conversation in message order
+        ordered = df.sort_values(["conversation_id", "created_at"], kind="stable")
+        per_message = self.ner.entities(ordered.body.fillna("").astype(str).tolist())
+        by_conv = collections.defaultdict(list)
+        for cid, ents in zip(ordered.conversation_id, per_message):
+            by_conv[cid].extend(ents)
+        if self.cooc.window is None:
+            self.add_entities_to_graph(by_conv.values(), keys=by_conv.keys())
+        else:
+            self.add_entities_to_graph(by_conv.values())
+
+    def wrapped_rollups(self, df: pd.DataFrame) -> WrappedRollups:
+        """Per-month mergeable wrapped statistics for df"""
         df = self._sanitize(df)
+        user_bodies = df.body[df.author_role.eq("user")].tolist()
+        rollups = WrappedRollups(capacity=self.cfg.top_k_capacity)
+        return rollups.update(df, self.ner.entities(user_bodies), self.languages)
 
-        num_chats = df.conversation_id.nunique()
-        num_messages = len(df)
-
-        user_df = df[df.author_role.eq("user")]
-        assistant_df = df[df.author_role.eq("assistant")]
-
-        # Entity extraction
-        ent_counter = collections.Counter()
-        for doc in self.nlp.pipe(user_df.body.tolist(), batch_size=128):
-            for ent in doc.ents:
-                txt = ent.text.strip()
-                if (len(txt) >= 3 and 
-                    not txt.isdigit() and 
-                    not re.fullmatch(r"[#\\d/_.]+", txt)):
-                    ent_counter[txt] += 1
-
-        top_entities = ent_counter.most_common(15)
-
-        # Top queries
-        queries = (
-            user_df.body
-            .map(lambda t: " ".join(t.strip().split()[:8]).lower())
-            .value_counts()
-            .head(10)
-            .to_dict()
-        )
-
-        # Response tokens
-        response_tokens = int(assistant_df.body.str.split().map(len).sum())
-
-        # Programming languages
-        langs = ["python", "javascript", "typescript", "c++", "c", "java", 
-                "go", "rust", "ruby", "php", "scala", "sql"]
-        lang_counts = {
-            lang: int(df.body.str.contains(fr"\b{re.escape(lang)}\b", case=False).sum())
-            for lang in langs
-        }
-        most_common_languages = {
-            k: v for k, v in sorted(lang_counts.items(), key=lambda p: p[1], reverse=True) 
-            if v > 0
-        }
-
-        # Most active hour
-        most_active_hour = (
-            int(df.created_at.dt.hour.value_counts().idxmax()) 
-            if not df.empty else None
-        )
-
-        return {
-            "year": datetime.utcnow().year,
-            "user_id": user_id or "default",
-            "num_chats": num_chats,
-            "num_messages": num_messages,
-            "response_tokens": response_tokens,
-            "top_entities": top_entities,
-            "top_queries": queries,
-            "languages": most_common_languages,
-            "most_active_hour": most_active_hour,
-            "generated_at": datetime.utcnow().isoformat(),
-        }
+    def spotify_wrapped(self, df: pd.DataFrame, user_id: str = None) -> Dict[str, Any]:
+        """Generate Spotify-like wrapped statistics"""
+        return self.wrapped_rollups(df).result(user_id)
 
     def graph_summary(self, top_k: int = 10) -> Dict[str, Any]:
         """Generate graph statistics"""
-        if self.G.number_of_nodes() == 0:
+        if len(self.cooc) == 0:
             return {}
         
-        pr = nx.pagerank(self.G, weight="weight")
-        top_nodes = sorted(pr.items(), key=lambda x: x[1], reverse=True)[:top_k]
-        bridge_edges = sorted(
-            self.G.edges(data=True), 
-            key=lambda e: e[2]["weight"], 
-            reverse=True
-        )[:top_k]
-        
         return {
-            "pagerank_top": top_nodes,
-            "bridge_edges": [(s, t, d["weight"]) for s, t, d in bridge_edges],
+            "pagerank_top": self.cooc.top_entities(top_k),
+            "bridge_edges": self.cooc.top_edges(top_k),
         }
 
 class ChatGraphBackend:
     """Vector search + Anthropic API wrapper"""
     
     def __init__(self, embedder: MiniChatEmbedder):
+        from llama_index.core import StorageContext, VectorStoreIndex
+
         storage_ctx = StorageContext.from_defaults(vector_store=embedder.store)
         self.vector_idx = VectorStoreIndex([], storage_context=storage_ctx)
-        self.entity_graph = embedder.G
-        self.anthropic_client = anthropic_client
+        self.embedder = embedder
+        self.anthropic_client = get_anthropic_client()
+
+    @property
+    def entity_graph(self) -> nx.Graph:
+        return self.embedder.G
 
     def retrieve(self, query: str, k: int = 8) -> List[NodeWithScore]:
         """Retrieve k context nodes"""
@@ -292,11 +437,15 @@ class ChatGraphBackend:
         
         prompt = f"Context:\n---\n{context}\n---\n\nQuestion: {query}\nAnswer:"
         
-        response = self.anthropic_client.messages.create(
+        messages = [{"role": "user", "content": prompt}]
+        response = rate_limiter.call(
+            "anthropic", self.anthropic_client.messages.create,
+            tokens=estimate_chat_tokens(messages, 300) + len(system_prompt) // 4,
+            priority=Priority.INTERACTIVE,
             model="claude-3-haiku-20240307",
             max_tokens=300,
             system=system_prompt,
-            messages=[{"role": "user", "content": prompt}]
+            messages=messages
         )
         
         return response.content[0].text.strip()
@@ -312,6 +461,69 @@ def load_conversations(path: str | Path) -> List[Dict[str, Any]]:
         raise ValueError(f"Expected list, got {type(conversations).__name__}")
     return conversations
 
+def iter_conversations(path: str | Path, chunk_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """
+    Yield conversations one at a time from the top-level JSON array.
+
+    Only the current conversation (plus one read buffer) is held in memory,
+    so peak usage depends on the largest conversation, not the export size.
+    """
+    decoder = json.JSONDecoder()
+    path = Path(path)
+    with path.open("r", encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill(min_chars: int) -> bool:
+            nonlocal buf, pos, eof
+            data = f.read(max(chunk_size, min_chars))
+            if not data:
+                eof = True
+                return False
+            buf = buf[pos:] + data
+            pos = 0
+            return True
+
+        def next_token() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if not fill(chunk_size):
+                    return ""
+
+        if next_token() != "[":
+            raise ValueError(f"Expected list at top level of {path.name}")
+        pos += 1
+
+        expect_item = True
+        while True:
+            tok = next_token()
+            if tok == "]":
+                return
+            if tok == "":
+                raise ValueError(f"Unterminated JSON array in {path.name}")
+            if not expect_item:
+                if tok != ",":
+                    raise ValueError(f"Malformed JSON array in {path.name} at offset {pos}")
+                pos += 1
+                expect_item = True
+                continue
+
+            # Decode one element; on a truncated buffer read more and retry.
+            # Growing reads by the buffer size keeps huge conversations linear.
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    break
+                except json.JSONDecodeError:
+                    if eof or not fill(len(buf)):
+                        raise
+            pos = end
+            expect_item = False
+            yield obj
+
 def _to_text(part: Any) -> str:
     """Convert message part to text"""
     if isinstance(part, str):
@@ -320,75 +532,308 @@ def _to_text(part: Any) -> str:
         return part["text"]
     return json.dumps(part, ensure_ascii=False)
 
+COLUMN_ORDER = [
+    "conversation_id", "email", "title", "body",
+    "embeddings_json", "created_at", "company", "author_role",
+]
+
+def _finite_or_none(val: Any) -> Any:
+    """Map NaN/inf (valid in Python's JSON dialect) to None"""
+    if isinstance(val, float) and not np.isfinite(val):
+        return None
+    return val
+
+class MessageColumns:
+    """
+    Append-only columnar storage for parsed ChatGPT messages.
+
+    Messages are appended straight into per-column lists across all
+    conversations and materialized as a single DataFrame at the end.
+    Conversation-level values (id, title) are stored once with a row
+    count and constant columns are only expanded in to_frame().
+    """
+
+    def __init__(self, email: str):
+        self.email = email
+        self.conversation_id: List[Any] = []
+        self.title: List[Any] = []
+        self.n_rows: List[int] = []
+        self.body: List[str] = []
+        self.created_at: List[str] = []
+        self.author_role: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.body)
+
+    def add_conversation(self, conv: Dict[str, Any]) -> int:
+        """Append every non-empty message of a conversation; returns rows added"""
+        n = 0
+        for node in conv.get("mapping", {}).values():
+            msg = node.get("message")
+            if msg is None:
+                continue
+
+            parts = msg.get("content", {}).get("parts", [])
+            body = "\n".join(_to_text(p) for p in parts).strip()
+            if not body:
+                continue
+
+            self.body.append(body)
+            self.created_at.append(datetime.utcfromtimestamp(msg["create_time"]).isoformat())
+            self.author_role.append(_finite_or_none((msg.get("author") or {}).get("role")))
+            n += 1
+
+        if n:
+            self.conversation_id.append(_finite_or_none(conv.get("conversation_id")))
+            self.title.append(_finite_or_none(conv.get("title", "")))
+            self.n_rows.append(n)
+        return n
+
+    def to_chunk(self) -> Dict[str, list]:
+        """Compact picklable form, used to ship results out of pool workers"""
+        return {
+            "conversation_id": self.conversation_id, "title": self.title,
+            "n_rows": self.n_rows, "body": self.body,
+            "created_at": self.created_at, "author_role": self.author_role,
+        }
+
+    def extend(self, chunk: Dict[str, list]):
+        """Append a chunk produced by to_chunk()"""
+        for key, values in chunk.items():
+            getattr(self, key).extend(values)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Materialize all rows as one DataFrame in COLUMN_ORDER"""
+        n = len(self.body)
+        counts = np.asarray(self.n_rows, dtype=np.int64)
+
+        def per_conv(values):
+            return np.repeat(np.array(values, dtype=object), counts).tolist()
+
+        return pd.DataFrame({
+            "conversation_id": per_conv(self.conversation_id),
+            "email": [self.email] * n,
+            "title": per_conv(self.title),
+            "body": self.body,
+            "embeddings_json": [None] * n,
+            "created_at": self.created_at,
+            "company": ["gpt"] * n,
+            "author_role": self.author_role,
+        }, columns=COLUMN_ORDER)
+
 def parse_chatgpt_json(conv: Dict[str, Any], email: str) -> pd.DataFrame:
     """Parse ChatGPT conversation format"""
-    rows = []
-    conv_id = conv.get("conversation_id")
-    title = conv.get("title", "")
-
-    for node in conv.get("mapping", {}).values():
-        msg = node.get("message")
-        if msg is None:
-            continue
-
-        parts = msg.get("content", {}).get("parts", [])
-        body = "\n".join(_to_text(p) for p in parts).strip()
-        if not body:
-            continue
-
-        rows.append({
-            "conversation_id": conv_id,
-            "email": email,
-            "title": title,
-            "body": body,
-            "embeddings_json": None,
-            "created_at": datetime.utcfromtimestamp(msg["create_time"]).isoformat(),
-            "company": "gpt",
-            "author_role": (msg.get("author") or {}).get("role"),
-        })
-
-    col_order = [
-        "conversation_id", "email", "title", "body",
-        "embeddings_json", "created_at", "company", "author_role",
-    ]
-    return pd.DataFrame(rows)[col_order]
+    cols = MessageColumns(email)
+    cols.add_conversation(conv)
+    return cols.to_frame()
+
+def _parse_shard(convs: List[Dict[str, Any]], email: str) -> Dict[str, list]:
+    """Parse a shard of conversations into compact columns (process-pool worker)"""
+    cols = MessageColumns(email)
+    for conv in convs:
+        cols.add_conversation(conv)
+    return cols.to_chunk()
+
+def _parse_parallel(
+    path: str | Path,
+    email: str,
+    workers: int,
+    shard_size: int = 256,
+) -> pd.DataFrame:
+    """Shard conversations across a process pool, keeping results in order"""
+    cols = MessageColumns(email)
+    convs = iter_conversations(path)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Bound in-flight shards so a huge export is not queued all at once
+        pending = collections.deque()
+        while True:
+            shard = list(itertools.islice(convs, shard_size))
+            if not shard:
+                break
+            pending.append(pool.submit(_parse_shard, shard, email))
+            if len(pending) >= 2 * workers:
+                cols.extend(pending.popleft().result())
+        for fut in pending:
+            cols.extend(fut.result())
+    return cols.to_frame()
 
 def conversations_to_dataframe(
     path: str | Path,
     email: str,
     drop_empty: bool = True,
     drop_empty_convs: bool = True,
+    parallel: bool = False,
+    workers: int | None = None,
 ) -> pd.DataFrame:
-    """Convert conversations file to dataframe"""
-    convs = load_conversations(path)
-    dfs = [parse_chatgpt_json(c, email) for c in convs]
-    df = pd.concat(dfs, ignore_index=True)
+    """
+    Convert conversations file to dataframe
 
-    if drop_empty:
-        df = df[df["body"].str.strip().astype(bool)]
+    Empty bodies and non-finite values are cleaned while parsing, so
+    drop_empty / drop_empty_convs are always in effect and only kept for
+    backwards compatibility. With parallel=True conversations are parsed on
+    a process pool of `workers` processes (default: one per core); the
+    result matches the serial path row for row.
+    """
+    if parallel:
+        return _parse_parallel(path, email, workers or os.cpu_count() or 1)
 
-    if drop_empty_convs:
-        df = df[df["conversation_id"].isin(df["conversation_id"].unique())]
+    cols = MessageColumns(email)
+    for conv in iter_conversations(path):
+        cols.add_conversation(conv)
+    return cols.to_frame()
 
-    # Clean up infinite values
-    df = df.replace([np.inf, -np.inf], np.nan)
-    clean_df = df.where(pd.notnull(df), None)
+def iter_message_batches(
+    path: str | Path,
+    email: str,
+    batch_size: int = 5_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream a conversations file as DataFrames of about batch_size rows.
 
-    return clean_df.reset_index(drop=True)
+    Batches are cut at conversation boundaries, so a conversation is never
+    split across batches. Rows come out in the same order as
+    conversations_to_dataframe, but only one batch is held in memory.
+    """
+    cols = MessageColumns(email)
+    for conv in iter_conversations(path):
+        cols.add_conversation(conv)
+        if len(cols) >= batch_size:
+            yield cols.to_frame()
+            cols = MessageColumns(email)
+    if len(cols):
+        yield cols.to_frame()
+
+class RecordEmbedder:
+    """
+    Fills `embeddings_json` on row dicts using the embedding backend,
+    behind the local cache.
+
+    With Voyage, cache misses are packed into requests by TokenBudgetBatcher;
+    a failing request is bisected rather than replayed row by row, and rows
+    that still fail on their own get a zero vector so the insert can proceed.
+    With a NearDuplicateIndex, only one body per near-duplicate group is
+    embedded and its vector is copied to the rest of the group.
+    """
+
+    def __init__(
+        self,
+        cache: EmbeddingCache | None = None,
+        use_cache: bool = True,
+        batcher: TokenBudgetBatcher | None = None,
+        backend: EmbeddingBackend | None = None,
+        dedup: NearDuplicateIndex | None = None,
+    ):
+        self.backend = backend or make_embedding_backend(batcher=batcher)
+        if use_cache and cache is None:
+            cache = EmbeddingCache(self.backend.model_id)
+        self.cache = cache
+        self.dedup = dedup
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float] | None]:
+        return self.backend.embed(texts)
+
+    def _embed(self, texts: List[str]) -> List[List[float] | None]:
+        if self.cache is None:
+            return self._embed_uncached(texts)
+        return self.cache.embed(texts, self._embed_uncached)
+
+    def _embed_deduplicated(self, texts: List[str]) -> List[List[float] | None]:
+        """Embed one text per near-duplicate group and fan the vector out"""
+        embeddings: List[List[float] | None] = [None] * len(texts)
+        pending: Dict[int, List[int]] = {}
+        for i, text in enumerate(texts):
+            group, _ = self.dedup.assign(text)
+            vec = self.dedup.vector(group)
+            if vec is not None:
+                embeddings[i] = vec
+            else:
+                pending.setdefault(group, []).append(i)
+
+        leaders = [rows[0] for rows in pending.values()]
+        vectors = self._embed([texts[i] for i in leaders]) if leaders else []
+        for (group, rows), vec in zip(pending.items(), vectors):
+            if vec is not None:
+                self.dedup.set_vector(group, vec)
+            for i in rows:
+                embeddings[i] = vec
+        self.dedup.record_saved(len(texts) - len(leaders))
+        return embeddings
+
+    def embed_records(self, chunk: List[Dict[str, Any]]):
+        """Embed every record's body in place"""
+        texts_to_embed = [r["body"] for r in chunk]
+
+        if self.dedup is not None:
+            embeddings = self._embed_deduplicated(texts_to_embed)
+        else:
+            embeddings = self._embed(texts_to_embed)
+
+        for r, emb in zip(chunk, embeddings):
+            if emb is None:
+                # Failure was already reported by the batcher
+                emb = [0.0] * self.backend.dim
+            r["embeddings_json"] = encode_embedding(emb, model=self.backend.model_id)
+
+    def report(self):
+        self.backend.report()
+        if self.dedup is not None:
+            print(f"🧬 Near-duplicates: {self.dedup.stats.summary()}")
+        if self.cache is not None:
+            print(f"🗄️  Embedding cache: {self.cache.stats.summary()}")
+
+def make_dedup_index(threshold: float | None = None) -> NearDuplicateIndex | None:
+    """A NearDuplicateIndex at threshold (DEDUP_THRESHOLD if None); None when disabled"""
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    return NearDuplicateIndex(threshold=threshold) if threshold > 0 else None
+
+def _with_retry(fn: Callable[..., Any], *args: Any, max_retries: int = 3,
+                label: str = "Request") -> Any:
+    """Call fn(*args), retrying with exponential backoff; re-raises after max_retries"""
+    attempt = 0
+    while True:
+        try:
+            return fn(*args)
+        except Exception as err:
+            attempt += 1
+            if attempt > max_retries:
+                print(f"❌ {label} failed after {max_retries} retries: {err}")
+                raise
+            wait = 2 ** attempt
+            print(f"⚠️  {label} failed ({err}); retry {attempt}/{max_retries} in {wait}s")
+            time.sleep(wait)
+
+def _upsert_with_retry(tbl, chunk: List[Dict[str, Any]], max_retries: int = 3):
+    """Upsert one chunk, retrying with exponential backoff"""
+    _with_retry(lambda: tbl.upsert(chunk).execute(), max_retries=max_retries, label="Insert")
+    print(f"✓ Inserted {len(chunk)} rows")
+
+def _copy_with_retry(loader: CopyLoader, chunk: List[Dict[str, Any]], max_retries: int = 3):
+    """COPY one chunk through the direct-Postgres loader, retrying with backoff"""
+    _with_retry(loader.load, chunk, max_retries=max_retries, label="Copy")
+    print(f"✓ Copied {len(chunk)} rows")
 
 def batched_embed_and_insert(
     df: pd.DataFrame,
     table_name: str,
     batch_size: int = 100,  # Smaller batches for embedding API
     max_retries: int = 3,
+    cache: EmbeddingCache | None = None,
+    use_cache: bool = True,
+    backend: EmbeddingBackend | None = None,
+    dedup_threshold: float | None = None,
 ):
-    """Generate embeddings and insert data in batches"""
-    embed_model = VoyageEmbedding(
-        model_name=MODEL_NAME,
-        voyage_api_key=VOYAGE_KEY
-    )
-    
-    tbl = client.table(table_name)
+    """
+    Generate embeddings and insert data in batches
+
+    Bodies already embedded with the same model are served from the local
+    EmbeddingCache (pass use_cache=False to always call the API). backend
+    defaults to EMBEDDING_BACKEND. Near-duplicate bodies above
+    dedup_threshold (default DEDUP_THRESHOLD, 0 disables) share one
+    embedding.
+    """
+    embedder = RecordEmbedder(cache=cache, use_cache=use_cache, backend=backend,
+                              dedup=make_dedup_index(dedup_threshold))
+    tbl = get_client().table(table_name)
     records = df.to_dict(orient="records")
     
     print(f"Processing {len(records)} records in batches of {batch_size}...")
@@ -399,88 +844,299 @@ def batched_embed_and_insert(
         print(f"Processing batch {start//batch_size + 1}/{(len(records)-1)//batch_size + 1} "
               f"(rows {start}-{start+len(chunk)-1})")
 
-        # Generate embeddings for this batch
-        texts_to_embed = [r["body"] for r in chunk]
-        
+        embedder.embed_records(chunk)
+        _upsert_with_retry(tbl, chunk, max_retries)
+
+    embedder.report()
+
+# ── Pipelined ingestion ─────────────────────────────────────────────
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    batches: int = 0
+    rows: int = 0
+    busy_s: float = 0.0
+    skipped_rows: int = 0
+
+    def summary(self, wall_s: float) -> str:
+        rate = self.rows / wall_s if wall_s else 0.0
+        util = self.busy_s / (wall_s * self.workers) if wall_s else 0.0
+        skipped = f", {self.skipped_rows} already done" if self.skipped_rows else ""
+        return (f"{self.name:>7}: {self.rows} rows in {self.batches} batches, "
+                f"{rate:.1f} rows/s, {util:.0%} busy ({self.workers} workers){skipped}")
+
+_STOP = object()
+
+def pipelined_embed_and_insert(
+    frames: Iterable[pd.DataFrame],
+    table_name: str,
+    batch_size: int = 50,
+    embed_workers: int = 4,
+    upsert_workers: int = 2,
+    queue_size: int = 8,
+    max_retries: int = 3,
+    cache: EmbeddingCache | None = None,
+    use_cache: bool = True,
+    journal: IngestJournal | None = None,
+    loader: CopyLoader | None = None,
+    backend: EmbeddingBackend | None = None,
+    dedup_threshold: float | None = None,
+) -> Dict[str, StageStats]:
+    """
+    Embed and insert rows with the parse, embed and upsert stages overlapped.
+
+    `frames` is consumed lazily (e.g. iter_message_batches), cut into chunks
+    of batch_size rows, embedded by embed_workers threads and written by
+    upsert_workers threads. Stages are connected by bounded queues, so a
+    slow stage backs up the ones before it instead of buffering the whole
+    upload. Retry semantics match batched_embed_and_insert; an upsert that
+    still fails after max_retries aborts the pipeline and is re-raised.
+
+    With a journal, chunks it already lists are skipped and every chunk is
+    recorded once its upsert succeeds, so a rerun resumes where it stopped.
+    With a loader, chunks are written with COPY over a direct Postgres
+    connection instead of PostgREST upserts (use a larger batch_size, e.g.
+    COPY_BATCH_SIZE). Near-duplicate bodies share one embedding as in
+    batched_embed_and_insert; the index spans the whole stream.
+    """
+    embedder = RecordEmbedder(cache=cache, use_cache=use_cache, backend=backend,
+                              dedup=make_dedup_index(dedup_threshold))
+    tbl = get_client().table(table_name)
+
+    embed_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    upsert_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    abort = threading.Event()
+    errors: List[BaseException] = []
+    stats = {
+        "parse": StageStats("parse", 1),
+        "embed": StageStats("embed", embed_workers),
+        "upsert": StageStats("upsert", upsert_workers),
+    }
+    lock = threading.Lock()
+
+    def put(q, item):
+        # Blocking put that gives up once another stage has failed
+        while not abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def record(stage, chunk, t0):
+        with lock:
+            st = stats[stage]
+            st.batches += 1
+            st.rows += len(chunk)
+            st.busy_s += time.perf_counter() - t0
+
+    def fail(err):
+        with lock:
+            errors.append(err)
+        abort.set()
+
+    def parse_stage():
         try:
-            # Batch embed all texts at once (more efficient)
-            embeddings = embed_model.get_text_embedding_batch(texts_to_embed)
-            
-            # Add embeddings to records
-            for i, r in enumerate(chunk):
-                r["embeddings_json"] = json.dumps({"conversation": embeddings[i]})
-                
-        except Exception as e:
-            print(f"⚠️  Embedding batch failed, falling back to individual embeds: {e}")
-            # Fallback to individual embeddings
-            for r in chunk:
+            it = iter(frames)
+            while not abort.is_set():
+                t0 = time.perf_counter()
+                df = next(it, None)
+                if df is None:
+                    break
+                records = df.to_dict(orient="records")
+                for start in range(0, len(records), batch_size):
+                    chunk = records[start:start + batch_size]
+                    key = batch_key(chunk) if journal is not None else None
+                    if key is not None and journal.is_done(key):
+                        with lock:
+                            stats["parse"].skipped_rows += len(chunk)
+                        continue
+                    record("parse", chunk, t0)
+                    if not put(embed_q, (key, chunk)):
+                        return
+                    t0 = time.perf_counter()
+        except BaseException as err:
+            fail(err)
+        finally:
+            for _ in range(embed_workers):
+                put(embed_q, _STOP)
+
+    def embed_stage():
+        try:
+            while not abort.is_set():
                 try:
-                    conv_emb = embed_model.get_text_embedding(r["body"])
-                    r["embeddings_json"] = json.dumps({"conversation": conv_emb})
-                except Exception as embed_err:
-                    print(f"⚠️  Failed to embed text: {embed_err}")
-                    r["embeddings_json"] = json.dumps({"conversation": [0.0] * DIMENSION})
-
-        # Insert batch into database with retry logic
-        attempt = 0
-        while True:
-            try:
-                resp = tbl.upsert(chunk).execute()
-                print(f"✓ Inserted {len(chunk)} rows")
-                break
-            except Exception as err:
-                attempt += 1
-                if attempt > max_retries:
-                    print(f"❌ Failed to insert batch after {max_retries} retries: {err}")
-                    raise
-                wait = 2 ** attempt
-                print(f"⚠️  Insert failed ({err}); retry {attempt} in {wait}s")
-                time.sleep(wait)
-        
-        # Small delay between batches to be nice to the APIs
-        time.sleep(0.5)
+                    chunk = embed_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if chunk is _STOP:
+                    break
+                key, chunk = chunk
+                t0 = time.perf_counter()
+                embedder.embed_records(chunk)
+                record("embed", chunk, t0)
+                if not put(upsert_q, (key, chunk)):
+                    return
+        except BaseException as err:
+            fail(err)
+
+    def upsert_stage():
+        try:
+            while not abort.is_set():
+                try:
+                    chunk = upsert_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if chunk is _STOP:
+                    break
+                key, chunk = chunk
+                t0 = time.perf_counter()
+                if loader is not None:
+                    _copy_with_retry(loader, chunk, max_retries)
+                else:
+                    _upsert_with_retry(tbl, chunk, max_retries)
+                record("upsert", chunk, t0)
+                if key is not None:
+                    journal.mark_done(key, len(chunk))
+        except BaseException as err:
+            fail(err)
+
+    wall0 = time.perf_counter()
+    producer = threading.Thread(target=parse_stage, name="ingest-parse", daemon=True)
+    embedders = [threading.Thread(target=embed_stage, name=f"ingest-embed-{i}", daemon=True)
+                 for i in range(embed_workers)]
+    writers = [threading.Thread(target=upsert_stage, name=f"ingest-upsert-{i}", daemon=True)
+               for i in range(upsert_workers)]
+    for t in (producer, *embedders, *writers):
+        t.start()
+
+    producer.join()
+    for t in embedders:
+        t.join()
+    for _ in writers:
+        put(upsert_q, _STOP)
+    for t in writers:
+        t.join()
+    wall = time.perf_counter() - wall0
+
+    print(f"⏱️  Pipeline finished in {wall:.1f}s")
+    for st in stats.values():
+        print(f"   {st.summary(wall)}")
+    embedder.report()
+
+    if errors:
+        raise errors[0]
+    return stats
+
+def analytics_update(row_id: Any, wrapped: Dict[str, Any], graph: Dict[str, Any]) -> Dict[str, Any]:
+    """The upsert payload that stores a user's analytics in row_id"""
+    return {
+        "id": row_id,
+        "wrapped_json": json.dumps(wrapped),
+        "graph_json":   json.dumps(graph),
+    }
+
+def store_analytics_updates(updates: List[Dict[str, Any]],
+                            table_name: str = TABLE_NAME,
+                            max_retries: int = 3,
+                            chunk_size: int = 100) -> int:
+    """Upsert analytics payloads in chunks, with retries; returns how many were stored"""
+    stored = 0
+    for i in range(0, len(updates), chunk_size):
+        chunk = updates[i:i + chunk_size]
+        try:
+            _with_retry(lambda: get_client().table(table_name).upsert(chunk).execute(),
+                        max_retries=max_retries, label="Update")
+        except Exception:
+            return stored
+        stored += len(chunk)
+    if stored:
+        print("✅ Analytics stored successfully")
+    return stored
+
+def _has_analytics_columns(row: Dict[str, Any]) -> bool:
+    required_cols = {"wrapped_json", "graph_json"}
+    if not required_cols.issubset(row.keys()):
+        print(f"⚠️  Table schema hasn't refreshed yet "
+              f"(missing {required_cols - row.keys()}). "
+              "Wait ~60 s and retry.")
+        return False
+    return True
+
+def save_analytics_state(email: str, embedder: "MiniChatEmbedder", rollups: WrappedRollups):
+    # Windowed co-occurrence cannot be extended later, so it is not kept
+    if embedder.cooc.window is None:
+        AnalyticsStore().save(email, AnalyticsState(rollups, embedder.cooc))
 
 def update_analytics_for_email(email: str,
                                table_name: str = TABLE_NAME,
-                               max_retries: int = 3):
+                               max_retries: int = 3,
+                               new_rows: pd.DataFrame | None = None,
+                               known_messages: int | None = None):
     """
-    Pull *all* rows for a user, compute wrapped + graph analytics,
-    and store them only in the first row (oldest message).
+    Compute wrapped + graph analytics for a user and store them only in
+    the first row (oldest message).
+
+    Per-month wrapped rollups and the entity incidence are kept in an
+    AnalyticsStore. When new_rows (messages just added) are given and the
+    saved state covers exactly known_messages (the count stored before
+    them), only new_rows are processed; otherwise *all* rows are pulled
+    and the state is rebuilt.
     """
 
     print(f"📊 Updating user-level analytics for email: {email}")
 
-    # 1) Pull data in pages (no time-out)
-    print("📥 Fetching existing data from Supabase (paged)…")
-    rows = fetch_rows_for_email(email, table_name)
-    if not rows:
+    state = AnalyticsStore().load(email) if new_rows is not None else None
+    if state is not None and state.rollups.messages != known_messages:
+        print(f"♻️  Saved analytics cover {state.rollups.messages} messages, "
+              f"{known_messages} stored; rebuilding")
+        state = None
+    if state is not None and state.rollups.capacity != EmbedConfig().top_k_capacity:
+        print("♻️  Top-k capacity changed since the analytics were saved; rebuilding")
+        state = None
+
+    if state is not None:
+        print(f"➕ Folding {len(new_rows)} new messages into saved analytics")
+        first_row = fetch_first_row_for_email(email, table_name)
+        df = new_rows
+    else:
+        # 1) Pull data in pages (no time-out)
+        print("📥 Fetching existing data from Supabase (paged)…")
+        rows = fetch_rows_for_email(email, table_name)
+        first_row = rows[0] if rows else None
+        df = pd.DataFrame(rows)
+        if rows:
+            print(f"✅ Found {len(rows)} rows for {email}")
+
+    if first_row is None:
         print(f"❌ No data found for email: {email}")
         return
-
-    first_row = rows[0]
-    print(f"✅ Found {len(rows)} rows for {email}")
     print(f"📍 Will write analytics to row ID: {first_row.get('id', 'unknown')}")
 
     # 2) Tiny guard in case PostgREST cache still missing columns
-    required_cols = {"wrapped_json", "graph_json"}
-    if not required_cols.issubset(first_row.keys()):
-        print(f"⚠️  Table schema hasn't refreshed yet "
-              f"(missing {required_cols - first_row.keys()}). "
-              "Wait ~60 s and retry.")
+    if not _has_analytics_columns(first_row):
         return
 
-    # 3) Build DataFrame & run analytics
-    df = pd.DataFrame(rows)
-
+    # 3) Run analytics on df, on top of the saved state if there is one
     print("🔄 Initializing analytics processor…")
-    embedder = MiniChatEmbedder()
+    embedder = MiniChatEmbedder.for_analytics()
+    rollups = WrappedRollups(capacity=embedder.cfg.top_k_capacity)
+    if state is not None:
+        embedder.cooc = state.cooc
+        rollups = state.rollups
 
+    failed = False
     print("📊 Calculating wrapped analytics…")
     try:
-        wrapped = embedder.spotify_wrapped(df, user_id=email)
+        # Sanitize once; the tagged frame makes the later calls no-ops
+        df = embedder._sanitize(df)
+        rollups.merge(embedder.wrapped_rollups(df))
+        wrapped = rollups.result(email)
     except Exception as e:
         print(f"❌ Failed to compute wrapped: {e}")
-        wrapped = {}
+        wrapped, failed = {}, True
 
     print("🕸️  Calculating graph analytics…")
     try:
@@ -488,32 +1144,62 @@ def update_analytics_for_email(email: str,
         graph = embedder.graph_summary()
     except Exception as e:
         print(f"❌ Failed to compute graph analytics: {e}")
-        graph = {}
+        graph, failed = {}, True
+    print(f"🏷️  NER: {embedder.ner.stats.summary()}")
 
-    # 4) Update just the first row
-    update_data = {
-        "id": first_row["id"],
-        "wrapped_json": json.dumps(wrapped),
-        "graph_json":   json.dumps(graph),
-    }
+    if not failed:
+        save_analytics_state(email, embedder, rollups)
+    else:
+        # A partial state would be extended as if it were whole
+        AnalyticsStore().clear(email)
 
-    attempt = 0
-    while True:
-        try:
-            client.table(table_name).upsert([update_data]).execute()
-            print("✅ Analytics stored successfully")
-            break
-        except Exception as err:
-            attempt += 1
-            if attempt > max_retries:
-                print(f"❌ Update failed after {max_retries} retries: {err}")
-                return
-            wait = 2 ** attempt
-            print(f"⚠️  Update failed ({err}); retry {attempt}/{max_retries} in {wait}s")
-            time.sleep(wait)
+    # 4) Update just the first row
+    if not store_analytics_updates([analytics_update(first_row["id"], wrapped, graph)],
+                                   table_name, max_retries):
+        return
 
     print(f"🎉 Finished analytics for {email}\n")
 
+class StreamingAnalytics:
+    """
+    Wrapped rollups and the entity graph folded in batch by batch while an
+    upload streams past, so a first upload needs no second read of the
+    stored rows. With EmbedConfig.top_k_capacity set, the top entity and
+    query counters stay within that budget however long the history is.
+    """
+
+    def __init__(self, embedder: MiniChatEmbedder):
+        self.embedder = embedder
+        self.rollups = WrappedRollups(capacity=embedder.cfg.top_k_capacity)
+        self.failed = False
+
+    def tap(self, frames: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Yield frames unchanged after folding each into the analytics"""
+        for df in frames:
+            if not self.failed:
+                try:
+                    clean = self.embedder._sanitize(df)
+                    self.rollups.merge(self.embedder.wrapped_rollups(clean))
+                    self.embedder.add_messages_to_graph(clean)
+                except Exception as e:
+                    print(f"❌ Streaming analytics failed ({e}); "
+                          "they will be computed from the stored rows")
+                    self.failed = True
+            yield df
+
+    def publish(self, email: str, table_name: str = TABLE_NAME, max_retries: int = 3):
+        """Store the analytics in the user's first row and save the state"""
+        first_row = fetch_first_row_for_email(email, table_name)
+        if first_row is None or not _has_analytics_columns(first_row):
+            return
+        wrapped = self.rollups.result(email)
+        graph = self.embedder.graph_summary()
+        print(f"🏷️  NER: {self.embedder.ner.stats.summary()}")
+        save_analytics_state(email, self.embedder, self.rollups)
+        if store_analytics_updates([analytics_update(first_row["id"], wrapped, graph)],
+                                   table_name, max_retries):
+            print(f"🎉 Finished analytics for {email}\n")
+
 def list_emails_in_database(
     table_name: str = TABLE_NAME,
     page_size: int = 1_000,
@@ -529,7 +1215,7 @@ def list_emails_in_database(
 
         try:
             resp = (
-                client
+                get_client()
                 .table(table_name)
                 .select("email")
                 .range(start, end)
@@ -555,47 +1241,387 @@ def list_emails_in_database(
 
     return sorted(emails)
     
+def fetch_first_row_for_email(email: str,
+                              table_name: str = TABLE_NAME) -> Dict[str, Any] | None:
+    """The user's oldest message row (the one carrying the analytics), or None"""
+    resp = (get_client().table(table_name)
+                  .select("id, wrapped_json, graph_json")
+                  .eq("email", email)
+                  .order("created_at")
+                  .limit(1)
+                  .execute())
+    rows = resp.data or []
+    return rows[0] if rows else None
+
+def count_rows_for_email(email: str, table_name: str = TABLE_NAME) -> int:
+    """Number of rows stored for an e-mail (an exact count, no rows transferred)"""
+    resp = (get_client().table(table_name)
+                  .select("id", count="exact")
+                  .eq("email", email)
+                  .limit(1)
+                  .execute())
+    return resp.count or 0
+
 def fetch_rows_for_email(email: str,
                          table_name: str = TABLE_NAME,
-                         page_size: int = 1_000) -> List[Dict[str, Any]]:
+                         page_size: int = 1_000,
+                         workers: int = 1) -> List[Dict[str, Any]]:
     """
     Fetch *all* rows for a given e-mail using ≤1 000-row pages.
+
+    With workers > 1 the rows are counted first and the pages are fetched
+    concurrently on a thread pool; pages are ordered by (created_at, id)
+    so concurrent offsets never overlap or skip rows.
     """
-    out, start = [], 0
-    while True:
-        end   = start + page_size - 1
-        resp  = (client.table(table_name)
+    def page(start: int) -> List[Dict[str, Any]]:
+        resp  = (get_client().table(table_name)
                        .select("*")
                        .eq("email", email)
                        .order("created_at")
-                       .range(start, end)
+                       .order("id")
+                       .range(start, start + page_size - 1)
                        .execute())
-        chunk = resp.data or []
+        return resp.data or []
+
+    if workers > 1:
+        total = count_rows_for_email(email, table_name)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pages = pool.map(page, range(0, total, page_size))
+            out = [row for chunk in pages for row in chunk]
+        # Rows added while paging fall past the counted range; pick them up
+        start = len(out)
+    else:
+        out, start = [], 0
+    while True:
+        chunk = page(start)
         out.extend(chunk)
         if len(chunk) < page_size:
             break
         start += page_size
     return out
 
-def process_uploaded_json(file_path: str, email: str):
-    """Main function to process and insert data"""
-    
+# ── Incremental re-upload ───────────────────────────────────────────
+
+def _body_hash(body: Any) -> str:
+    return hashlib.sha1(str(body).encode("utf-8", "surrogatepass")).hexdigest()
+
+def _message_slots(df: pd.DataFrame) -> List[tuple]:
+    """(conversation_id, created_at in µs since epoch) per row; None if unparseable"""
+    ts = MiniChatEmbedder._parse_created_at(df["created_at"])
+    us = ((ts - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(1, "us")).astype("Int64")
+    return list(zip(df["conversation_id"], us.astype(object).where(us.notna(), None)))
+
+@dataclass
+class StoredMessages:
+    """What is already in the table for one user, keyed for diffing"""
+    # (conversation_id, created_at µs) -> [(row id, sha1 of the stored body)];
+    # a list because messages of one conversation can share a timestamp
+    slots: Dict[tuple, List[Tuple[Any, str]]]
+    # Row ids already matched to an export row during this upload
+    claimed: Set[Any] = field(default_factory=set)
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.slots.values())
+
+def fetch_stored_messages(email: str,
+                          table_name: str = TABLE_NAME,
+                          page_size: int = 1_000) -> StoredMessages:
+    """
+    Fetch the message keys and body hashes stored for a user.
+
+    Only id, conversation_id, created_at and body are selected (no
+    embeddings or analytics blobs); bodies are hashed client-side and
+    dropped page by page.
+    """
+    slots: Dict[tuple, List[Tuple[Any, str]]] = {}
+    start = 0
+    while True:
+        end = start + page_size - 1
+        resp = (get_client().table(table_name)
+                      .select("id, conversation_id, created_at, body")
+                      .eq("email", email)
+                      .order("id")
+                      .range(start, end)
+                      .execute())
+        chunk = resp.data or []
+        if chunk:
+            page = pd.DataFrame(chunk)
+            for slot, row_id, body in zip(_message_slots(page), page["id"], page["body"]):
+                if slot[1] is None:
+                    continue
+                slots.setdefault(slot, []).append((row_id, _body_hash(body)))
+        if len(chunk) < page_size:
+            break
+        start += page_size
+    return StoredMessages(slots)
+
+@dataclass
+class DeltaStats:
+    new: int = 0
+    edited: int = 0
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> int:
+        return self.new + self.edited
+
+    def summary(self) -> str:
+        return f"{self.new} new, {self.edited} edited, {self.unchanged} unchanged messages"
+
+def diff_messages(df: pd.DataFrame, stored: StoredMessages,
+                  stats: DeltaStats | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split parsed export rows into (new, edited) against what is stored.
+
+    A message's slot is (conversation_id, created_at). Within a slot, rows
+    are first matched to stored rows with the same body hash and dropped;
+    a row left without a match takes a remaining stored row of its slot
+    and is returned in `edited` carrying that `id`, so the upsert
+    overwrites it in place. Rows with no stored row left in their slot, or
+    without a parseable timestamp, are new. Each stored row is matched at
+    most once per upload (see StoredMessages.claimed).
+    """
+    slots = _message_slots(df)
+    row_ids: List[Any] = [None] * len(df)
+    unchanged = np.zeros(len(df), dtype=bool)
+
+    by_slot: Dict[tuple, List[int]] = {}
+    for i, slot in enumerate(slots):
+        if slot[1] is not None and slot in stored.slots:
+            by_slot.setdefault(slot, []).append(i)
+
+    bodies = df["body"].to_numpy()
+    for slot, rows in by_slot.items():
+        free = [(rid, h) for rid, h in stored.slots[slot] if rid not in stored.claimed]
+        unmatched = []
+        for i in rows:
+            h = _body_hash(bodies[i])
+            match = next((j for j, (_, sh) in enumerate(free) if sh == h), None)
+            if match is None:
+                unmatched.append(i)
+                continue
+            rid, _ = free.pop(match)
+            stored.claimed.add(rid)
+            row_ids[i] = rid
+            unchanged[i] = True
+        for i, (rid, _) in zip(unmatched, free):
+            stored.claimed.add(rid)
+            row_ids[i] = rid
+
+    is_new = np.array([rid is None for rid in row_ids], dtype=bool)
+    keep = ~unchanged
+    new = df[is_new].reset_index(drop=True)
+    edited = df[keep & ~is_new].copy()
+    # PostgREST bulk upserts need the same keys on every row, so edited
+    # rows (with id) and new rows (without) travel in separate frames
+    edited.insert(0, "id", [r for r, k, n in zip(row_ids, keep, is_new) if k and not n])
+    edited = edited.reset_index(drop=True)
+
+    if stats is not None:
+        stats.new += len(new)
+        stats.edited += len(edited)
+        stats.unchanged += int(unchanged.sum())
+    return new, edited
+
+def iter_delta_frames(frames: Iterable[pd.DataFrame], stored: StoredMessages,
+                      stats: DeltaStats) -> Iterator[pd.DataFrame]:
+    """Filter a stream of parsed frames down to new and edited messages"""
+    for df in frames:
+        for part in diff_messages(df, stored, stats):
+            if len(part):
+                yield part
+
+def process_uploaded_json_delta(
+    file_path: str,
+    email: str,
+    batch_size: int = 5_000,
+    journal: IngestJournal | None = None,
+    loader: CopyLoader | None = None,
+) -> DeltaStats:
+    """
+    Re-upload an export, embedding and upserting only what changed.
+
+    The export is streamed and diffed against the user's stored messages
+    (see diff_messages). Analytics are only touched if at least one message
+    was added or edited: new messages are folded into the saved analytics
+    state, while edits (whose old bodies are gone) trigger a rebuild from
+    the stored rows.
+    """
+    print(f"🔎 Fetching stored messages for {email}…")
+    stored = fetch_stored_messages(email)
+    print(f"✅ {len(stored)} messages already stored")
+
+    stats = DeltaStats()
+    new_parts: List[pd.DataFrame] = []
+
+    def keep_new(frames: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        for part in frames:
+            if "id" not in part:    # edited rows carry their stored id
+                new_parts.append(part[["conversation_id", "author_role",
+                                       "body", "created_at"]].copy())
+            yield part
+
+    frames = keep_new(iter_delta_frames(
+        iter_message_batches(file_path, email, batch_size=batch_size), stored, stats,
+    ))
+    pipelined_embed_and_insert(
+        frames, TABLE_NAME, journal=journal, loader=loader,
+        batch_size=COPY_BATCH_SIZE if loader is not None else 50,
+    )
+    print(f"📦 Delta: {stats.summary()}")
+
+    if stats.edited:
+        update_analytics_for_email(email)
+    elif stats.new:
+        update_analytics_for_email(email, new_rows=pd.concat(new_parts, ignore_index=True),
+                                   known_messages=len(stored))
+    else:
+        print("✨ Nothing changed since the last upload; analytics left as they are.")
+    if journal is not None:
+        journal.finish()
+    return stats
+
+def _count_messages(file_path: str, email: str) -> int:
+    """Count the rows an export will produce, one conversation at a time"""
+    total = 0
+    for conv in iter_conversations(file_path):
+        total += MessageColumns(email).add_conversation(conv)
+    return total
+
+def process_uploaded_json_streaming(
+    file_path: str,
+    email: str,
+    batch_size: int = 5_000,
+    journal: IngestJournal | None = None,
+    loader: CopyLoader | None = None,
+):
+    """
+    Constant-memory variant of process_uploaded_json.
+
+    Conversations are parsed, embedded and inserted batch by batch through
+    the ingestion pipeline, so the export is never fully materialized.
+    Analytics need the whole history: for a user's first, uninterrupted
+    upload the stream is that history and analytics are folded in on the
+    way (see StreamingAnalytics); otherwise they are computed afterwards
+    from the stored rows (see update_analytics_for_email). Either way they
+    are written to the user's first row.
+    """
+    print(f"Streaming conversations from {file_path} for user {email}...")
+    if journal is not None and journal.header.get("total_rows") is None:
+        journal.set_total(_count_messages(file_path, email))
+
+    frames = iter_message_batches(file_path, email, batch_size=batch_size)
+    analytics = None
+    resumed = journal is not None and bool(journal.done)
+    if not resumed and fetch_first_row_for_email(email) is None:
+        embedder = MiniChatEmbedder.for_analytics()
+        if embedder.cooc.window is None:
+            analytics = StreamingAnalytics(embedder)
+            frames = analytics.tap(frames)
+
+    stats = pipelined_embed_and_insert(
+        frames, TABLE_NAME,
+        journal=journal, loader=loader,
+        batch_size=COPY_BATCH_SIZE if loader is not None else 50,
+    )
+    total = stats["upsert"].rows + stats["parse"].skipped_rows
+
+    if not total:
+        print(f"❌ No messages found in {file_path}")
+        return
+
+    if analytics is not None and not analytics.failed:
+        analytics.publish(email)
+    else:
+        update_analytics_for_email(email)
+    if journal is not None:
+        journal.finish()
+    print(f"✅ Complete! Streamed {total} messages into Supabase with embeddings.")
+
+def process_uploaded_json(
+    file_path: str,
+    email: str,
+    stream: bool = False,
+    parallel: bool = False,
+    workers: int | None = None,
+    resume: bool = False,
+    delta: bool = False,
+    copy: bool = False,
+    journaled: bool = False,
+):
+    """
+    Main function to process and insert data
+
+    With journaled=True progress is journaled per batch; with resume=True a
+    rerun for the same file and e-mail skips every batch that a journaled
+    run already inserted. Without either the upload is neither hashed nor
+    journaled. With delta=True only messages that are new or edited
+    compared to what is already stored are embedded and upserted. With copy=True rows are
+    bulk-loaded over POSTGRES_CONN with COPY instead of PostgREST upserts.
+    """
+    journal = None
+    if resume or journaled:
+        journal = IngestJournal.open(file_path, email, resume=resume,
+                                     stream=stream, delta=delta, copy=copy)
+    if journal is not None and journal.finished:
+        print(f"✅ Upload of {file_path} for {email} already completed; nothing to resume.")
+        return
+    if resume and journal.done:
+        # Keep the original batch boundaries so finished batches match up
+        stream = journal.header.get("stream", stream)
+        delta = journal.header.get("delta", delta)
+        copy = journal.header.get("copy", copy)
+        print(f"⏩ Resuming job {journal.path.stem}: "
+              f"{sum(journal.done.values())} rows already inserted")
+
+    loader = CopyLoader(POSTGRES_CONN, TABLE_NAME) if copy else None
+    try:
+        if delta:
+            process_uploaded_json_delta(file_path, email, journal=journal, loader=loader)
+        elif stream:
+            process_uploaded_json_streaming(file_path, email, journal=journal, loader=loader)
+        else:
+            _process_full_upload(file_path, email, journal, parallel, workers, loader)
+    finally:
+        if loader is not None:
+            loader.close()
+
+def _process_full_upload(
+    file_path: str,
+    email: str,
+    journal: IngestJournal | None,
+    parallel: bool = False,
+    workers: int | None = None,
+    loader: CopyLoader | None = None,
+):
+    """Load the whole export, compute analytics up front, then embed and insert"""
+
     # Load and process data
     print(f"Loading conversations from {file_path} for user {email}...")
-    full_df = conversations_to_dataframe(file_path, email=email)
+    full_df = conversations_to_dataframe(
+        file_path, email=email, parallel=parallel, workers=workers,
+    )
     print(f"Loaded {len(full_df)} messages from {full_df.conversation_id.nunique()} conversations")
+    if journal is not None and journal.header.get("total_rows") is None:
+        journal.set_total(len(full_df))
     
     # Initialize embedder for analytics
     print("Initializing embedder...")
-    embedder = MiniChatEmbedder()
+    embedder = MiniChatEmbedder.for_analytics()
     
     print("Processing conversations for analytics...")
-    embedder.process_for_analytics_only(full_df)
+    # Timestamps are parsed once here; full_df keeps ISO strings for insert
+    analytics_df = embedder._sanitize(full_df)
+    embedder.process_for_analytics_only(analytics_df)
     
     # Generate analytics
     print("Generating analytics...")
-    wrapped = embedder.spotify_wrapped(full_df, user_id=email)
+    rollups = embedder.wrapped_rollups(analytics_df)
+    wrapped = rollups.result(email)
     graph = embedder.graph_summary()
+    print(f"🏷️  NER: {embedder.ner.stats.summary()}")
+    # Later delta uploads extend this state instead of re-reading everything
+    save_analytics_state(email, embedder, rollups)
     
     # Add analytics to dataframe
     print("Adding analytics to records...")
@@ -606,7 +1632,12 @@ def process_uploaded_json(file_path: str, email: str):
     
     # Generate embeddings and insert in batches
     print("Generating embeddings and inserting into database...")
-    batched_embed_and_insert(full_df, TABLE_NAME, batch_size=50)
+    pipelined_embed_and_insert(
+        [full_df], TABLE_NAME, journal=journal, loader=loader,
+        batch_size=COPY_BATCH_SIZE if loader is not None else 50,
+    )
+    if journal is not None:
+        journal.finish()
     
     print("✅ Complete! Your data is now in Supabase with embeddings.")
     print(f"Analytics summary for {email}:")
@@ -614,13 +1645,68 @@ def process_uploaded_json(file_path: str, email: str):
     print(f"  - {wrapped.get('num_messages', 0)} messages")
     print(f"  - {wrapped.get('response_tokens', 0)} response tokens")
 
+def print_job_status(file_path: str, email: str):
+    """Print progress and ETA of the ingestion job for this file and e-mail"""
+    journal = IngestJournal.find(file_path, email)
+    if journal is None:
+        print(f"❌ No ingestion job found for {file_path} / {email}")
+        return
+
+    st = journal.status()
+    total = st["total_rows"]
+    pct = f" ({st['rows_done'] / total:.1%})" if total else ""
+    print(f"📋 Job {st['job']} for {st['email']}")
+    print(f"   File:     {st['file']}")
+    print(f"   State:    {'finished' if st['finished'] else 'incomplete'}")
+    print(f"   Progress: {st['rows_done']}/{total if total is not None else '?'} rows{pct} "
+          f"in {st['batches_done']} batches")
+    if st["rows_per_s"]:
+        print(f"   Rate:     {st['rows_per_s']:.1f} rows/s")
+    if st["eta_s"] is not None and not st["finished"]:
+        print(f"   ETA:      {timedelta(seconds=int(st['eta_s']))}")
+    if st["last_update"]:
+        print(f"   Updated:  {datetime.fromtimestamp(st['last_update']).isoformat(timespec='seconds')}")
+
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) != 3:
-        print("Usage: python claude_parser.py <path_to_json_file> <user_email>")
-        sys.exit(1)
-    
-    file_path = sys.argv[1]
-    user_email = sys.argv[2]
-    
-    process_uploaded_json(file_path, user_email)
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Parse a ChatGPT export and load it into Supabase")
+    ap.add_argument("file_path", help="path to conversations.json")
+    ap.add_argument("user_email")
+    ap.add_argument("--stream", action="store_true",
+                    help="parse and insert batch by batch with bounded memory")
+    ap.add_argument("--parallel", action="store_true",
+                    help="parse conversations on a process pool")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="parser processes for --parallel (default: one per core)")
+    ap.add_argument("--delta", action="store_true",
+                    help="only embed and insert messages that are new or edited since the last upload")
+    ap.add_argument("--copy", action="store_true",
+                    help="bulk-load rows over a direct Postgres connection (COPY) instead of PostgREST")
+    ap.add_argument("--backend", choices=["voyage", "local"], default=None,
+                    help="embedding backend (default: $WRAPPED_EMBEDDING_BACKEND or voyage)")
+    ap.add_argument("--dedup-threshold", type=float, default=None,
+                    help="Jaccard similarity above which bodies share an embedding "
+                         "(default: $WRAPPED_DEDUP_THRESHOLD or 0, which disables it)")
+    ap.add_argument("--journal", action="store_true",
+                    help="record finished batches so an interrupted upload can be resumed")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue an interrupted --journal upload, skipping finished batches")
+    ap.add_argument("--status", action="store_true",
+                    help="show progress and ETA of the upload job and exit")
+    args = ap.parse_args()
+
+    if args.backend:
+        EMBEDDING_BACKEND = args.backend
+    if args.dedup_threshold is not None:
+        DEDUP_THRESHOLD = args.dedup_threshold
+
+    if args.status:
+        print_job_status(args.file_path, args.user_email)
+    else:
+        process_uploaded_json(
+            args.file_path, args.user_email,
+            stream=args.stream, parallel=args.parallel, workers=args.workers,
+            resume=args.resume, delta=args.delta, copy=args.copy,
+            journaled=args.journal,
+        )
@@ -0,0 +1,197 @@
+"""
+Sparse entity co-occurrence.
+
+EntityCooccurrence interns entity strings to integer ids and collects one
+row per document (a conversation's entity mentions) in a sparse incidence
+matrix A (documents x entities, mention counts). The co-occurrence graph is
+then one sparse product instead of a Python loop over every pair:
+
+    W = A^T A, with the diagonal replaced by (diag - mentions) / 2
+
+which gives, for every pair of mentions in a document, weight 1 on their
+edge, the same weights the old per-pair networkx updates produced
+(repeated mentions of one entity become a self-loop). With `window` set,
+only mentions at most `window` positions apart co-occur; those pairs are
+generated with numpy per offset and summed as a sparse matrix.
+
+PageRank and the top-edge ranking run on the CSR matrix; to_networkx()
+builds a networkx Graph only when one is asked for.
+
+Documents can be given a key (a conversation id): mentions added later
+under the same key land in the same incidence row, so the matrix can be
+built up from new messages only and saved with state() / from_state().
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class EntityCooccurrence:
+    """Incremental document-entity incidence and its co-occurrence matrix"""
+
+    def __init__(self, window: Optional[int] = None):
+        if window is not None and window < 1:
+            raise ValueError(f"window must be >= 1, got {window}")
+        self.window = window
+        self.vocab: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.documents = 0
+        self.keys: Dict[str, int] = {}
+        # COO parts: incidence (doc, entity) without a window, pairs (a, b) with one
+        self._rows: List[np.ndarray] = []
+        self._cols: List[np.ndarray] = []
+        self._weights: Optional[sp.csr_matrix] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # ── Building ────────────────────────────────────────────────────
+
+    def _intern(self, entities: Sequence[str]) -> np.ndarray:
+        ids = np.empty(len(entities), dtype=np.int64)
+        for i, ent in enumerate(entities):
+            idx = self.vocab.get(ent)
+            if idx is None:
+                idx = self.vocab[ent] = len(self.names)
+                self.names.append(ent)
+            ids[i] = idx
+        return ids
+
+    def add_document(self, entities: Sequence[str], key: Optional[str] = None):
+        """
+        Add one document's entity mentions, in order. With a key already
+        seen, the mentions extend that document instead (no window only).
+        """
+        ids = self._intern(entities)
+        if self.window is None:
+            row = self.documents
+            if key is not None:
+                row = self.keys.setdefault(str(key), self.documents)
+            if row == self.documents:
+                self.documents += 1
+            self._rows.append(np.full(len(ids), row, dtype=np.int64))
+            self._cols.append(ids)
+        else:
+            if key is not None:
+                raise ValueError("keyed documents are not supported when a window is set")
+            for offset in range(1, min(self.window, len(ids) - 1) + 1):
+                self._rows.append(ids[:-offset])
+                self._cols.append(ids[offset:])
+            self.documents += 1
+        self._weights = None
+
+    def add_documents(self, docs: Iterable[Sequence[str]]):
+        for entities in docs:
+            self.add_document(entities)
+
+    # ── Persistence ─────────────────────────────────────────────────
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays that from_state() rebuilds this object from (no window only)"""
+        if self.window is not None:
+            raise ValueError("state() is not kept when a window is set")
+        rows, cols = self._concat()
+        keys = sorted(self.keys.items(), key=lambda kv: kv[1])
+        return {
+            "names": np.array(self.names, dtype=str),
+            "rows": rows,
+            "cols": cols,
+            "documents": np.array(self.documents, dtype=np.int64),
+            "keys": np.array([k for k, _ in keys], dtype=str),
+            "key_rows": np.array([r for _, r in keys], dtype=np.int64),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray]) -> "EntityCooccurrence":
+        out = cls()
+        out.names = [str(n) for n in state["names"]]
+        out.vocab = {n: i for i, n in enumerate(out.names)}
+        out.documents = int(state["documents"])
+        out.keys = {str(k): int(r) for k, r in zip(state["keys"], state["key_rows"])}
+        if len(state["rows"]):
+            out._rows = [state["rows"].astype(np.int64)]
+            out._cols = [state["cols"].astype(np.int64)]
+        return out
+
+    # ── Matrices ────────────────────────────────────────────────────
+
+    def _concat(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self._rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows, cols = np.concatenate(self._rows), np.concatenate(self._cols)
+        # Keep the COO parts compact for the next incremental add
+        self._rows, self._cols = [rows], [cols]
+        return rows, cols
+
+    def incidence(self) -> sp.csr_matrix:
+        """Documents x entities mention counts (only without a window)"""
+        if self.window is not None:
+            raise ValueError("incidence() is not kept when a window is set")
+        rows, cols = self._concat()
+        data = np.ones(len(rows), dtype=np.int64)
+        return sp.csr_matrix((data, (rows, cols)), shape=(self.documents, len(self.names)))
+
+    def weights(self) -> sp.csr_matrix:
+        """Symmetric entity x entity co-occurrence weights; the diagonal holds self-loops"""
+        if self._weights is not None:
+            return self._weights
+        n = len(self.names)
+        if self.window is None:
+            a = self.incidence()
+            w = a.T @ a
+            mentions = np.asarray(a.sum(axis=0)).ravel()
+            # diag - (diag - mentions) / 2 leaves the self-loop weight
+            w = (w - sp.diags((w.diagonal() + mentions) // 2, dtype=np.int64)).tocsr()
+        else:
+            rows, cols = self._concat()
+            pairs = sp.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(n, n))
+            w = (pairs + pairs.T - sp.diags(pairs.diagonal(), dtype=np.int64)).tocsr()
+        w.eliminate_zeros()
+        self._weights = w
+        return w
+
+    # ── Analytics ───────────────────────────────────────────────────
+
+    def pagerank(self, alpha: float = 0.85, max_iter: int = 100, tol: float = 1e-6) -> np.ndarray:
+        """
+        Weighted PageRank by power iteration on the CSR matrix; matches
+        networkx.pagerank on the equivalent Graph (uniform teleport, dangling
+        nodes spread uniformly).
+        """
+        w = self.weights().astype(np.float64)
+        n = w.shape[0]
+        if n == 0:
+            return np.zeros(0)
+        out_weight = np.asarray(w.sum(axis=1)).ravel()
+        dangling = out_weight == 0
+        inv = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+        transition = sp.diags(inv, dtype=np.float64) @ w
+
+        x = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            last = x
+            x = alpha * (x @ transition + x[dangling].sum() / n) + (1 - alpha) / n
+            if np.abs(x - last).sum() < n * tol:
+                break
+        return x
+
+    def top_entities(self, k: int = 10) -> List[Tuple[str, float]]:
+        pr = self.pagerank()
+        order = np.argsort(-pr, kind="stable")[:k]
+        return [(self.names[i], float(pr[i])) for i in order]
+
+    def top_edges(self, k: int = 10) -> List[Tuple[str, str, int]]:
+        """Heaviest edges (self-loops included), ties in first-seen order"""
+        upper = sp.triu(self.weights()).tocoo()
+        order = np.lexsort((upper.col, upper.row, -upper.data))[:k]
+        return [(self.names[upper.row[i]], self.names[upper.col[i]], int(upper.data[i]))
+                for i in order]
+
+    def to_networkx(self):
+        """The co-occurrence graph as a networkx Graph with `weight` edges"""
+        import networkx as nx
+
+        g = nx.from_scipy_sparse_array(self.weights())
+        g.add_nodes_from(range(len(self.names)))
+        return nx.relabel_nodes(g, dict(enumerate(self.names)), copy=False)
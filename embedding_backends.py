@@ -0,0 +1,322 @@
+"""
+Pluggable embedding backends.
+
+Everything that turns text into vectors goes through an EmbeddingBackend:
+
+  * VoyageBackend - the hosted voyage-3-lite model (512-d), with requests
+    packed by TokenBudgetBatcher and paced by the shared "voyage" limiter;
+  * LocalBackend  - a sentence-transformers model on the CPU (default
+    all-MiniLM-L6-v2, 384-d), with length-sorted token-budget batching,
+    optional ONNX Runtime / int8 dynamic quantization, a thread count and
+    optional multi-process sharding for whole-export offline runs.
+
+Backends are picked by name with get_backend("voyage" | "local", ...).
+`model_id` identifies the vectors a backend produces (model, runtime,
+quantization) and is what EmbeddingCache and the stored envelope are keyed
+by, so vectors from different backends never mix.
+"""
+import os
+import platform
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from rate_limiter import Priority, ProviderLimiter, limiter_for
+from token_batcher import TokenBudgetBatcher
+
+
+class EmbeddingBackend:
+    """Interface: embed documents in bulk and single queries"""
+
+    name: str = ""
+    model_id: str = ""
+
+    @property
+    def dim(self) -> int:
+        raise NotImplementedError
+
+    def embed(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Document embeddings; None for any text that could not be embedded"""
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        raise NotImplementedError
+
+    def as_llama_index(self):
+        """A llama-index embed model for Settings.embed_model"""
+        raise NotImplementedError
+
+    def report(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class VoyageBackend(EmbeddingBackend):
+    name = "voyage"
+
+    def __init__(
+        self,
+        model_name: str = "voyage-3-lite",
+        api_key: Optional[str] = None,
+        dimension: int = 512,
+        batcher: Optional[TokenBudgetBatcher] = None,
+        limiter: Optional[ProviderLimiter] = None,
+    ):
+        from llama_index.embeddings.voyageai import VoyageEmbedding
+
+        self.model_name = self.model_id = model_name
+        self.api_key = api_key or os.environ.get("VOYAGE_API_KEY")
+        self._dim = dimension
+        self.batcher = batcher or TokenBudgetBatcher()
+        self.model = VoyageEmbedding(model_name=model_name, voyage_api_key=self.api_key)
+        self.limiter = limiter or limiter_for("voyage")
+        self._embed_batch = self.limiter.wrap(
+            self.model.get_text_embedding_batch,
+            cost=lambda texts: sum(map(self.batcher.estimate_tokens, texts)),
+        )
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def embed(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        return self.batcher.embed(texts, self._embed_batch)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        vec = self.limiter.call(self.model.get_query_embedding, text,
+                                tokens=self.batcher.estimate_tokens(text),
+                                priority=Priority.INTERACTIVE)
+        return np.asarray(vec, dtype=np.float32)
+
+    def as_llama_index(self):
+        from llama_index.embeddings.voyageai import VoyageEmbedding
+
+        return VoyageEmbedding(
+            model_name=self.model_name,
+            voyage_api_key=self.api_key,
+            input_type="document",
+        )
+
+    def report(self):
+        print(f"📐 Embedding batcher: {self.batcher.stats.summary()} "
+              f"(budget now {self.batcher.budget} tokens/request)")
+        print(f"🚦 Voyage limiter: {self.limiter.stats.summary()}")
+
+
+class LocalBackend(EmbeddingBackend):
+    """
+    sentence-transformers on the CPU.
+
+    Texts are sorted by length and cut into batches whose padded size
+    (texts x longest text, in estimated tokens) stays under
+    max_tokens_per_batch, so short messages go through in large batches
+    and long ones in small batches without padding waste. With
+    processes > 1, large inputs are sharded across worker processes.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        runtime: str = "torch",
+        quantize: bool = False,
+        threads: Optional[int] = None,
+        max_tokens_per_batch: int = 16_384,
+        max_batch_size: int = 256,
+        max_seq_length: int = 256,
+        processes: int = 1,
+        min_texts_per_process: int = 2_000,
+        onnx_file: Optional[str] = None,
+        chars_per_token: float = 4.0,
+    ):
+        if runtime not in ("torch", "onnx"):
+            raise ValueError(f"runtime must be 'torch' or 'onnx', got {runtime!r}")
+        self.model_name = model_name
+        self.runtime = runtime
+        self.quantize = quantize
+        self.threads = threads
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_batch_size = max_batch_size
+        self.max_seq_length = max_seq_length
+        self.processes = processes
+        self.min_texts_per_process = min_texts_per_process
+        self.onnx_file = onnx_file
+        self.chars_per_token = chars_per_token
+
+        tags = [runtime] + (["int8"] if quantize else [])
+        self.model_id = f"local:{model_name}:{'-'.join(tags)}"
+
+        self._model = None
+        self._pool = None
+        # Re-entrant: the pool is started under the lock via self.model
+        self._lock = threading.RLock()
+
+    # ── Model loading ───────────────────────────────────────────────
+
+    def _default_onnx_file(self) -> str:
+        # Pre-quantized exports shipped with the sentence-transformers models
+        if platform.machine().lower() in ("arm64", "aarch64"):
+            return "onnx/model_qint8_arm64.onnx"
+        return "onnx/model_quint8_avx2.onnx"
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        kwargs: Dict[str, Any] = {"device": "cpu"}
+        if self.runtime == "onnx":
+            model_kwargs: Dict[str, Any] = {"provider": "CPUExecutionProvider"}
+            if self.threads:
+                import onnxruntime as ort
+
+                opts = ort.SessionOptions()
+                opts.intra_op_num_threads = self.threads
+                model_kwargs["session_options"] = opts
+            if self.quantize:
+                model_kwargs["file_name"] = self.onnx_file or self._default_onnx_file()
+            kwargs.update(backend="onnx", model_kwargs=model_kwargs)
+        elif self.threads:
+            import torch
+
+            torch.set_num_threads(self.threads)
+
+        model = SentenceTransformer(self.model_name, **kwargs)
+        model.max_seq_length = self.max_seq_length
+
+        if self.runtime == "torch" and self.quantize:
+            import torch
+
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+            return self._model
+
+    @property
+    def dim(self) -> int:
+        model = self.model
+        # Renamed in sentence-transformers 6
+        get_dim = getattr(model, "get_embedding_dimension", None) or model.get_sentence_embedding_dimension
+        return get_dim()
+
+    # ── Encoding ────────────────────────────────────────────────────
+
+    def _batches(self, texts: Sequence[str], order: Sequence[int]) -> List[List[int]]:
+        """Cut length-sorted (longest first) indices by padded token budget"""
+        batches, batch, longest = [], [], 0
+        for i in order:
+            cost = min(self.max_seq_length, max(1, int(len(texts[i]) / self.chars_per_token)))
+            longest = max(longest, cost)
+            if batch and ((len(batch) + 1) * longest > self.max_tokens_per_batch
+                          or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, longest = [], cost
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _encode(self, texts: Sequence[str], batch_size: int) -> np.ndarray:
+        return self.model.encode(
+            list(texts), batch_size=batch_size, convert_to_numpy=True,
+            normalize_embeddings=True, show_progress_bar=False,
+        )
+
+    def embed_array(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts into an (n, dim) float32 array in input order"""
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+
+        if self.processes > 1 and len(texts) >= self.min_texts_per_process * self.processes:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = self.model.start_multi_process_pool(["cpu"] * self.processes)
+            sorted_texts = [texts[i] for i in order]
+            if hasattr(self.model, "encode_multi_process"):
+                vecs = self.model.encode_multi_process(
+                    sorted_texts, self._pool,
+                    batch_size=self.max_batch_size, normalize_embeddings=True,
+                )
+            else:
+                vecs = self.model.encode(
+                    sorted_texts, pool=self._pool, batch_size=self.max_batch_size,
+                    convert_to_numpy=True, normalize_embeddings=True,
+                )
+            out[order] = vecs
+            return out
+
+        for batch in self._batches(texts, order):
+            out[batch] = self._encode([texts[i] for i in batch], batch_size=len(batch))
+        return out
+
+    def embed(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._encode([text], batch_size=1)[0].astype(np.float32)
+
+    def as_llama_index(self):
+        return _llama_index_adapter(self)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+
+_ADAPTER_CLS = None
+
+
+def _llama_index_adapter(backend: EmbeddingBackend):
+    """Wrap a backend as a llama-index BaseEmbedding"""
+    global _ADAPTER_CLS
+    if _ADAPTER_CLS is None:
+        from llama_index.core.base.embeddings.base import BaseEmbedding
+        from llama_index.core.bridge.pydantic import PrivateAttr
+
+        class BackendEmbedding(BaseEmbedding):
+            _backend: Any = PrivateAttr()
+
+            def __init__(self, backend, **kwargs):
+                super().__init__(model_name=backend.model_id, **kwargs)
+                self._backend = backend
+
+            def _get_query_embedding(self, query: str) -> List[float]:
+                return self._backend.embed_query(query).tolist()
+
+            async def _aget_query_embedding(self, query: str) -> List[float]:
+                return self._get_query_embedding(query)
+
+            def _get_text_embedding(self, text: str) -> List[float]:
+                return self._backend.embed([text])[0]
+
+            def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+                return self._backend.embed(texts)
+
+        _ADAPTER_CLS = BackendEmbedding
+    return _ADAPTER_CLS(backend)
+
+
+BACKENDS = {
+    VoyageBackend.name: VoyageBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+
+def get_backend(name: str = "voyage", **kwargs: Any) -> EmbeddingBackend:
+    """Instantiate a backend by name ("voyage" or "local")"""
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown embedding backend {name!r}; choose from {sorted(BACKENDS)}")
+    return cls(**kwargs)
@@ -0,0 +1,137 @@
+"""
+Persistent, content-addressed cache for embedding vectors.
+
+Vectors are stored in a local SQLite file keyed by
+sha256(model name, input_type, text), so re-uploads of the same export and
+repeated boilerplate messages ("continue", "thanks", pasted stack traces)
+are only sent to the embedding API once.
+"""
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from sqlite_lru import SQLiteLRU
+
+DEFAULT_CACHE_DIR = os.environ.get("WRAPPED_CACHE_DIR", ".cache")
+DEFAULT_MAX_ENTRIES = 2_000_000
+
+# voyage-3-lite list price, used only for the "dollars saved" estimate
+USD_PER_MTOK = 0.02
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    requests: int = 0
+    requests_saved: int = 0
+    tokens_saved: int = 0
+    evicted: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def dollars_saved(self) -> float:
+        return self.tokens_saved / 1e6 * USD_PER_MTOK
+
+    def summary(self) -> str:
+        return (f"{self.hits} hits / {self.misses} misses ({self.hit_rate:.1%}), "
+                f"{self.requests_saved}/{self.requests} API requests saved, "
+                f"~{self.tokens_saved:,} tokens (~${self.dollars_saved:.4f}) saved")
+
+
+class EmbeddingCache:
+    """Embedding cache on a SQLiteLRU store (vectors as float32 bytes)"""
+
+    def __init__(
+        self,
+        model_name: str,
+        input_type: Optional[str] = None,
+        cache_dir: str | Path | None = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.model_name = model_name
+        self.input_type = input_type
+        self.stats = CacheStats()
+        self.store = SQLiteLRU(
+            Path(cache_dir or DEFAULT_CACHE_DIR) / "embeddings.sqlite3",
+            table="embeddings", value_column="vec", value_type="BLOB",
+            max_entries=max_entries,
+        )
+        # One cache serves the pipeline's embed threads; guards self.stats
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> bytes:
+        h = hashlib.sha256()
+        h.update(f"{self.model_name}\0{self.input_type}\0".encode())
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Bulk lookup; returns None for every text that is not cached"""
+        keys = [self.key(t) for t in texts]
+        found = self.store.get_many(keys)
+        return [
+            np.frombuffer(found[k], dtype=np.float32).tolist() if k in found else None
+            for k in keys
+        ]
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Store vectors for texts, evicting least-recently-used entries if full"""
+        evicted = self.store.put_many(
+            (self.key(t), np.asarray(v, dtype=np.float32).tobytes())
+            for t, v in zip(texts, vectors)
+        )
+        with self._lock:
+            self.stats.evicted += evicted
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        embed_batch: Callable[[List[str]], List[Optional[List[float]]]],
+    ) -> List[Optional[List[float]]]:
+        """
+        Return embeddings for texts, calling embed_batch only for cache misses.
+
+        Duplicate texts inside the batch are sent once. embed_batch may
+        return None for texts it could not embed; those are passed through
+        as None and never stored, and neither is anything from a call that
+        raises.
+        """
+        out = self.get_many(texts)
+        misses = [t for t, v in zip(texts, out) if v is None]
+        missing = list(dict.fromkeys(misses))
+
+        # Cached texts and in-batch duplicates are both tokens we don't pay for
+        saved = sum(estimate_tokens(t) for t in texts) - sum(estimate_tokens(t) for t in missing)
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.hits += len(texts) - len(misses)
+            self.stats.misses += len(misses)
+            self.stats.tokens_saved += saved
+            if not missing:
+                self.stats.requests_saved += 1
+        if not missing:
+            return out
+
+        vectors = embed_batch(missing)
+        ok = [(t, v) for t, v in zip(missing, vectors) if v is not None]
+        self.put_many([t for t, _ in ok], [v for _, v in ok])
+        fresh = dict(zip(missing, vectors))
+        return [v if v is not None else fresh[t] for t, v in zip(texts, out)]
+
+    def close(self):
+        self.store.close()
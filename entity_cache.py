@@ -0,0 +1,95 @@
+"""
+Persistent per-message cache of NER results.
+
+Entity lists are stored in a local SQLite file keyed by
+sha256(model version, body), next to the embedding cache. Wrapped stats and
+the entity graph are both assembled from these per-message lists, so a
+message is parsed by spaCy once per model version, and re-running analytics
+after a small upload only parses the new messages.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from embedding_cache import DEFAULT_CACHE_DIR
+from sqlite_lru import SQLiteLRU
+
+DEFAULT_MAX_ENTRIES = 5_000_000
+
+Entity = Tuple[str, str]        # (text, label)
+
+
+def model_version(nlp, *extra) -> str:
+    """Identifies the entities a pipeline produces, e.g. "en_core_web_sm-3.8.0" """
+    meta = getattr(nlp, "meta", {}) or {}
+    parts = [f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}"]
+    parts += [str(e) for e in extra]
+    return ":".join(parts)
+
+
+@dataclass
+class EntityCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evicted: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> str:
+        return f"{self.hits} hits / {self.misses} misses ({self.hit_rate:.1%})"
+
+
+class EntityCache:
+    """Message -> entities cache on a SQLiteLRU store (entity lists as JSON)"""
+
+    def __init__(
+        self,
+        model_version: str,
+        cache_dir: str | Path | None = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.model_version = model_version
+        self.stats = EntityCacheStats()
+        self.store = SQLiteLRU(
+            Path(cache_dir or DEFAULT_CACHE_DIR) / "entities.sqlite3",
+            table="entities", value_column="ents", value_type="TEXT",
+            max_entries=max_entries,
+        )
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> bytes:
+        h = hashlib.sha256()
+        h.update(f"{self.model_version}\0".encode())
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[Entity]]]:
+        """Bulk lookup; returns None for every text that is not cached"""
+        keys = [self.key(t) for t in texts]
+        found = self.store.get_many(keys)
+        hits = sum(1 for k in keys if k in found)
+        with self._lock:
+            self.stats.hits += hits
+            self.stats.misses += len(keys) - hits
+        return [
+            [tuple(e) for e in json.loads(found[k])] if k in found else None
+            for k in keys
+        ]
+
+    def put_many(self, texts: Sequence[str], entity_lists: Sequence[Sequence[Entity]]):
+        """Store entity lists for texts, evicting least-recently-used entries if full"""
+        evicted = self.store.put_many(
+            (self.key(t), json.dumps([list(e) for e in ents]))
+            for t, ents in zip(texts, entity_lists)
+        )
+        with self._lock:
+            self.stats.evicted += evicted
+
+    def close(self):
+        self.store.close()
@@ -0,0 +1,145 @@
+"""
+Bounded-memory heavy hitters for the top entities / top queries stats.
+
+SpaceSaving monitors at most `capacity` items. Counts are merged the way
+mergeable summaries are (Agarwal et al., "Mergeable Summaries"): an item
+one side does not monitor is assumed to have that side's `floor`, the
+largest count it could have had there, and after a merge only the
+`capacity` largest counts are kept. As a result:
+
+  * a reported count never underestimates, and overestimates by at most
+    its `error`, which is at most n / capacity for n counted occurrences;
+  * any item not monitored occurred at most `floor` times, so every item
+    with more than `floor` occurrences is reported;
+  * updates are batch merges, and summaries of separate batches, months or
+    processes merge into the same guarantees.
+
+With capacity=None nothing is dropped and the counts are exact, which is
+how spotify_wrapped behaves unless a budget is configured.
+"""
+import heapq
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+# Rough per-item cost of a monitored string (dict slots, str, int, error)
+_BYTES_PER_ITEM = 200
+
+
+def capacity_for_budget(memory_bytes: int, bytes_per_item: int = _BYTES_PER_ITEM) -> int:
+    """Number of monitored items that fit in memory_bytes"""
+    return max(1, memory_bytes // bytes_per_item)
+
+
+class SpaceSaving:
+    """Mergeable top-k counter holding at most `capacity` items (exact if None)"""
+
+    def __init__(self, capacity: Optional[int] = None):
+        if capacity is not None and capacity < 1:
+            raise ValueError(f"capacity must be >= 1, got {capacity}")
+        self.capacity = capacity
+        self.n = 0                  # occurrences counted
+        self.floor = 0              # upper bound on any unmonitored item's count
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def update(self, items: Union[Mapping[str, int], Iterable[str]]) -> "SpaceSaving":
+        """Count items (an iterable of items, or item -> count)"""
+        if not isinstance(items, Mapping):
+            batch: Dict[str, int] = {}
+            for item in items:
+                batch[item] = batch.get(item, 0) + 1
+            items = batch
+        for item, count in items.items():
+            if item in self.counts:
+                self.counts[item] += count
+            else:
+                # Not monitored: it may already have occurred up to floor times
+                self.counts[item] = self.floor + count
+                if self.floor:
+                    self.errors[item] = self.floor
+            self.n += count
+        self._truncate()
+        return self
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """Fold other into self (self's capacity is kept)"""
+        for item in self.counts.keys() - other.counts.keys():
+            self.counts[item] += other.floor
+            if other.floor:
+                self.errors[item] = self.errors.get(item, 0) + other.floor
+        for item, count in other.counts.items():
+            error = other.errors.get(item, 0)
+            if item in self.counts:
+                self.counts[item] += count
+            else:
+                self.counts[item] = self.floor + count
+                error += self.floor
+            if error:
+                self.errors[item] = self.errors.get(item, 0) + error
+        self.n += other.n
+        self.floor += other.floor
+        self._truncate()
+        return self
+
+    def _truncate(self):
+        if self.capacity is None or len(self.counts) <= self.capacity:
+            return
+        keep = heapq.nlargest(self.capacity, self.counts.items(), key=lambda kv: kv[1])
+        kept = dict(keep)
+        dropped = max(c for item, c in self.counts.items() if item not in kept)
+        self.floor = max(self.floor, dropped)
+        # Rebuild in the original order so ties keep first-seen order
+        self.counts = {item: c for item, c in self.counts.items() if item in kept}
+        self.errors = {item: e for item, e in self.errors.items() if item in kept}
+
+    # ── Queries ─────────────────────────────────────────────────────
+
+    def estimate(self, item: str) -> Tuple[int, int]:
+        """(count, error): the true count lies in [count - error, count]"""
+        if item in self.counts:
+            return self.counts[item], self.errors.get(item, 0)
+        return self.floor, self.floor
+
+    @property
+    def max_error(self) -> int:
+        return max(self.errors.values(), default=0)
+
+    @property
+    def error_bound(self) -> float:
+        """Guaranteed bound on any count's overestimate, n / capacity (0 if exact)"""
+        return self.n / self.capacity if self.capacity else 0.0
+
+    def most_common(self, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Largest estimated counts, ties in first-seen order (like Counter)"""
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        return ranked if k is None else ranked[:k]
+
+    def guaranteed(self, k: int) -> List[Tuple[str, int]]:
+        """The part of most_common(k) that is provably in the true top k"""
+        top = self.most_common(k + 1)
+        if len(top) <= k and not self.floor:
+            return top
+        threshold = max(top[k][1] if len(top) > k else 0, self.floor)
+        return [(item, c) for item, c in top[:k] if c - self.errors.get(item, 0) >= threshold]
+
+    # ── Persistence ─────────────────────────────────────────────────
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "n": self.n,
+            "floor": self.floor,
+            "counts": self.counts,
+            "errors": self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        out = cls(data["capacity"])
+        out.n = data["n"]
+        out.floor = data["floor"]
+        out.counts = dict(data["counts"])
+        out.errors = dict(data["errors"])
+        return out
@@ -0,0 +1,197 @@
+"""
+Durable journal of completed ingestion batches.
+
+A job is identified by the content hash of the uploaded file and the user's
+e-mail. Every batch that has been embedded *and* upserted is appended to
+`<jobs dir>/<job id>.jsonl` (fsync'd), keyed by a stable hash of its row
+keys, so a restarted upload can skip finished batches instead of paying to
+re-embed them.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from embedding_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_JOBS_DIR = os.environ.get("WRAPPED_JOBS_DIR", os.path.join(DEFAULT_CACHE_DIR, "jobs"))
+# Superseded journals kept per job when a fresh one is started
+KEEP_ARCHIVED = 3
+
+
+def file_digest(path: str | Path, chunk_size: int = 1 << 20) -> str:
+    """sha256 of a file's contents, read in chunks"""
+    h = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def batch_key(chunk: List[Dict[str, Any]]) -> str:
+    """Stable hash of the (conversation_id, created_at, body) keys of a batch"""
+    h = hashlib.sha256()
+    for r in chunk:
+        h.update(f"{r.get('conversation_id')}\0{r.get('created_at')}\0".encode())
+        h.update(hashlib.sha1(str(r.get("body")).encode("utf-8", "surrogatepass")).digest())
+    return h.hexdigest()
+
+
+class IngestJournal:
+    """Append-only record of finished batches for one (file, email) job"""
+
+    def __init__(self, path: Path, header: Dict[str, Any], done: Dict[str, int],
+                 times: List[tuple], finished: bool):
+        self.path = path
+        self.header = header
+        self.done = done
+        self.finished = finished
+        self._times = times          # (timestamp, rows) per completed batch
+        self._lock = threading.Lock()
+        self._fh = None
+
+    @staticmethod
+    def job_id(file_path: str | Path, email: str) -> str:
+        return hashlib.sha256(f"{file_digest(file_path)}\0{email}".encode()).hexdigest()[:20]
+
+    @classmethod
+    def open(
+        cls,
+        file_path: str | Path,
+        email: str,
+        resume: bool = False,
+        jobs_dir: str | Path | None = None,
+        keep_archived: int = KEEP_ARCHIVED,
+        **settings: Any,
+    ) -> "IngestJournal":
+        """
+        Open the journal for this job.
+
+        With resume=True an existing journal is loaded and its recorded
+        settings take precedence; otherwise any previous journal for the
+        same job is archived and a fresh one is started. Only the newest
+        keep_archived archives of a job are kept.
+        """
+        jobs = Path(jobs_dir or DEFAULT_JOBS_DIR)
+        jobs.mkdir(parents=True, exist_ok=True)
+        job = cls.job_id(file_path, email)
+        path = jobs / f"{job}.jsonl"
+
+        if path.exists() and resume:
+            return cls._load(path)
+        if path.exists():
+            path.rename(path.with_suffix(f".{time.time_ns()}.jsonl"))
+            cls._prune_archives(jobs, job, keep_archived)
+
+        header = {
+            "type": "job", "file": str(file_path), "email": email,
+            "started_at": time.time(), **settings,
+        }
+        journal = cls(path, header, {}, [], False)
+        journal._append(header)
+        return journal
+
+    @staticmethod
+    def _prune_archives(jobs: Path, job: str, keep: int):
+        archived = sorted(jobs.glob(f"{job}.*.jsonl"),
+                          key=lambda p: int(p.suffixes[-2][1:]), reverse=True)
+        for old in archived[keep:]:
+            old.unlink(missing_ok=True)
+
+    @classmethod
+    def find(cls, file_path: str | Path, email: str,
+             jobs_dir: str | Path | None = None) -> Optional["IngestJournal"]:
+        """Load an existing journal read-only, or None"""
+        path = Path(jobs_dir or DEFAULT_JOBS_DIR) / f"{cls.job_id(file_path, email)}.jsonl"
+        return cls._load(path) if path.exists() else None
+
+    @classmethod
+    def _load(cls, path: Path) -> "IngestJournal":
+        header: Dict[str, Any] = {}
+        done: Dict[str, int] = {}
+        times: List[tuple] = []
+        finished = False
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn line from a crash
+                kind = entry.get("type")
+                if kind == "job":
+                    header.update(entry)
+                elif kind == "batch":
+                    done[entry["key"]] = entry["rows"]
+                    times.append((entry["t"], entry["rows"]))
+                elif kind == "total":
+                    header["total_rows"] = entry["rows"]
+                elif kind == "done":
+                    finished = True
+        return cls(path, header, done, times, finished)
+
+    def _append(self, entry: Dict[str, Any]):
+        with self._lock:
+            if self._fh is None:
+                self._fh = self.path.open("a+", encoding="utf-8")
+                if self._fh.tell():
+                    # Terminate a torn line left by a crash before appending
+                    self._fh.seek(self._fh.tell() - 1)
+                    if self._fh.read(1) != "\n":
+                        self._fh.write("\n")
+            self._fh.write(json.dumps(entry) + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    # ── Progress ────────────────────────────────────────────────────
+
+    def set_total(self, rows: int):
+        self.header["total_rows"] = rows
+        self._append({"type": "total", "rows": rows})
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def mark_done(self, key: str, rows: int):
+        now = time.time()
+        self._append({"type": "batch", "key": key, "rows": rows, "t": now})
+        with self._lock:
+            self.done[key] = rows
+            self._times.append((now, rows))
+
+    def finish(self):
+        self._append({"type": "done", "t": time.time()})
+        self.finished = True
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    def status(self, window: int = 50) -> Dict[str, Any]:
+        """Rows done, total and an ETA from the rate of the last `window` batches"""
+        rows_done = sum(self.done.values())
+        total = self.header.get("total_rows")
+        recent = self._times[-window:]
+        rate = None
+        if len(recent) >= 2 and recent[-1][0] > recent[0][0]:
+            rate = sum(r for _, r in recent[1:]) / (recent[-1][0] - recent[0][0])
+        eta = None
+        if rate and total is not None:
+            eta = max(0.0, (total - rows_done) / rate)
+        return {
+            "job": self.path.stem,
+            "file": self.header.get("file"),
+            "email": self.header.get("email"),
+            "finished": self.finished,
+            "batches_done": len(self.done),
+            "rows_done": rows_done,
+            "total_rows": total,
+            "rows_per_s": rate,
+            "eta_s": eta,
+            "last_update": recent[-1][0] if recent else self.header.get("started_at"),
+        }
@@ -0,0 +1,81 @@
+"""
+One-shot migration of embeddings_json to the compact v2 encoding.
+
+    python migrate_embeddings.py --dry-run     # report the size savings only
+    python migrate_embeddings.py               # rewrite legacy rows in place
+
+Rows are walked in id order with keyset pagination, so the migration can be
+interrupted and rerun; rows already in the v2 format are skipped.
+"""
+import argparse
+import time
+
+from claude_parser import client, MODEL_NAME, TABLE_NAME
+from embedding_codec import encoded_sizes, is_current, reencode
+
+
+def migrate(table_name: str = TABLE_NAME, page_size: int = 500, dtype: str = "f16",
+            dry_run: bool = False, max_retries: int = 3):
+    tbl = client.table(table_name)
+    last_id = None
+    seen = converted = skipped = unreadable = 0
+    bytes_before = bytes_after = 0
+    t0 = time.perf_counter()
+
+    while True:
+        query = tbl.select("id, embeddings_json").order("id").limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        seen += len(rows)
+
+        updates = []
+        for r in rows:
+            raw = r.get("embeddings_json")
+            if raw is None or is_current(raw):
+                skipped += 1
+                continue
+            new = reencode(raw, model=MODEL_NAME, dtype=dtype)
+            if new is None:
+                unreadable += 1
+                continue
+            bytes_before += sum(encoded_sizes([raw]))
+            bytes_after += len(new)
+            updates.append({"id": r["id"], "embeddings_json": new})
+
+        if updates and not dry_run:
+            attempt = 0
+            while True:
+                try:
+                    tbl.upsert(updates).execute()
+                    break
+                except Exception as err:
+                    attempt += 1
+                    if attempt > max_retries:
+                        raise
+                    wait = 2 ** attempt
+                    print(f"⚠️  Update failed ({err}); retry {attempt}/{max_retries} in {wait}s")
+                    time.sleep(wait)
+        converted += len(updates)
+        print(f"   {seen} rows scanned, {converted} converted (last id {last_id})")
+
+    verb = "would convert" if dry_run else "converted"
+    print(f"✅ {seen} rows scanned in {time.perf_counter() - t0:.1f}s: {verb} {converted}, "
+          f"{skipped} already current or empty, {unreadable} unreadable")
+    if converted:
+        print(f"📦 embeddings_json: {bytes_before / 1024 ** 2:.1f} MB -> "
+              f"{bytes_after / 1024 ** 2:.1f} MB "
+              f"({bytes_before / max(1, bytes_after):.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Convert embeddings_json to the v2 binary encoding")
+    ap.add_argument("--table", default=TABLE_NAME)
+    ap.add_argument("--page-size", type=int, default=500)
+    ap.add_argument("--dtype", choices=["f16", "f32"], default="f16")
+    ap.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = ap.parse_args()
+    migrate(args.table, page_size=args.page_size, dtype=args.dtype, dry_run=args.dry_run)
@@ -0,0 +1,211 @@
+"""
+Near-duplicate suppression for embedding.
+
+Exports are full of near-identical bodies: regenerated answers, repeated
+system prompts, the same code block pasted into several conversations.
+NearDuplicateIndex groups them with MinHash signatures over byte 5-gram
+shingles of the lowercased, whitespace-collapsed UTF-8 text (so symbols
+count: "2+2" and "2*2", "c++" and "c#" differ) and banded LSH: each body either becomes a new group
+representative or joins the group of an earlier representative whose
+estimated Jaccard similarity is at least `threshold`. Only representatives
+are embedded; their vectors are fanned out to the members.
+
+The index is incremental (bodies can arrive batch by batch) and bounded:
+at most `max_groups` representatives are kept, least recently matched
+first out, so memory stays flat on arbitrarily large uploads.
+
+Sharing a vector changes what is stored for the members, so ingestion only
+deduplicates when a threshold is configured (WRAPPED_DEDUP_THRESHOLD).
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Universal hashing (a*x + b) mod p over 32-bit shingle hashes; a < 2**31
+# keeps a*x + b inside uint64
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# Fibonacci hashing folds a packed n-gram (up to 8 bytes) to 32 bits
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _lsh_params(threshold: float, num_perm: int,
+                fp_weight: float = 0.1, fn_weight: float = 0.9) -> Tuple[int, int]:
+    """
+    Bands x rows (b * r <= num_perm) minimizing the weighted false positive
+    and false negative areas around threshold. Candidates are verified
+    against the full signature, so false positives only cost a comparison
+    and misses are weighted higher.
+    """
+    def area(f, lo, hi, steps=200):
+        xs = np.linspace(lo, hi, steps)
+        return float(np.mean(f(xs)) * (hi - lo))
+
+    best, best_err = (1, num_perm), float("inf")
+    for b in range(1, num_perm + 1):
+        for r in range(1, num_perm // b + 1):
+            fp = area(lambda s: 1 - (1 - s ** r) ** b, 0.0, threshold)
+            fn = area(lambda s: (1 - s ** r) ** b, threshold, 1.0)
+            err = fp_weight * fp + fn_weight * fn
+            if err < best_err:
+                best, best_err = (b, r), err
+    return best
+
+
+@dataclass
+class DedupStats:
+    texts: int = 0
+    exact: int = 0
+    near: int = 0
+    groups: int = 0
+    evicted: int = 0
+    saved: int = 0      # embedding inputs served by fan-out instead of the model
+
+    def summary(self) -> str:
+        rate = self.saved / self.texts if self.texts else 0.0
+        return (f"{self.saved}/{self.texts} embeddings saved by fan-out ({rate:.1%}); "
+                f"{self.exact} exact + {self.near} near duplicates in {self.groups} groups")
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash-LSH grouping of texts.
+
+    assign() returns a group id per text; fan out vectors with
+    set_vector() / vector(). Thread-safe.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        max_groups: int = 50_000,
+        seed: int = 1,
+    ):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        if not 1 <= shingle_size <= 8:
+            raise ValueError(f"shingle_size must be in [1, 8] bytes, got {shingle_size}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_groups = max_groups
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2 ** 31, size=num_perm, dtype=np.uint64)
+
+        self.stats = DedupStats()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._exact: Dict[bytes, int] = {}                 # body digest -> group
+        self._buckets: List[Dict[bytes, int]] = [{} for _ in range(self.bands)]
+        self._groups: "OrderedDict[int, tuple]" = OrderedDict()  # group -> (sig, digest, band keys)
+        self._vectors: Dict[int, np.ndarray] = {}
+
+    # ── Signatures ──────────────────────────────────────────────────
+
+    def _shingles(self, text: str) -> np.ndarray:
+        """32-bit hashes of the distinct byte n-grams of the normalized text"""
+        data = " ".join(text.lower().split()).encode("utf-8", "surrogatepass")
+        k = self.shingle_size
+        if len(data) < k:
+            data = data.ljust(k, b"\0")
+        b = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+        n = len(b) - k + 1
+        packed = np.zeros(n, dtype=np.uint64)
+        for j in range(k):
+            packed |= b[j:j + n] << np.uint64(8 * j)
+        return np.unique((packed * _GOLDEN) >> np.uint64(32))
+
+    def signature(self, text: str) -> np.ndarray:
+        x = self._shingles(text)[:, None]
+        hashed = (x * self._a + self._b) % _PRIME & _MAX_HASH
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        r = self.rows
+        return [sig[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    # ── Grouping ────────────────────────────────────────────────────
+
+    def assign(self, text: str) -> Tuple[int, bool]:
+        """Group id for text and whether text founded the group"""
+        digest = hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+        with self._lock:
+            self.stats.texts += 1
+            group = self._match_exact(digest)
+            if group is not None:
+                return group, False
+
+        # Signing is the expensive part and needs no shared state
+        sig = self.signature(text)
+        keys = self._band_keys(sig)
+        # Lookup and insert in one critical section, so concurrent callers
+        # with the same text cannot both found a group; another thread may
+        # have added it (or a near copy) while we were signing
+        with self._lock:
+            group = self._match_exact(digest)
+            if group is not None:
+                return group, False
+            seen = set()
+            for band, key in enumerate(keys):
+                group = self._buckets[band].get(key)
+                if group is None or group in seen:
+                    continue
+                seen.add(group)
+                rep_sig = self._groups[group][0]
+                if np.mean(rep_sig == sig) >= self.threshold:
+                    self.stats.near += 1
+                    self._groups.move_to_end(group)
+                    return group, False
+
+            group = self._next_id
+            self._next_id += 1
+            self._groups[group] = (sig, digest, keys)
+            self._exact[digest] = group
+            for band, key in enumerate(keys):
+                self._buckets[band].setdefault(key, group)
+            self.stats.groups += 1
+            if len(self._groups) > self.max_groups:
+                self._evict()
+            return group, True
+
+    def _match_exact(self, digest: bytes) -> Optional[int]:
+        """Group of an identical text, if any (call with the lock held)"""
+        group = self._exact.get(digest)
+        if group is not None:
+            self.stats.exact += 1
+            self._groups.move_to_end(group)
+        return group
+
+    def _evict(self):
+        group, (_, digest, keys) = self._groups.popitem(last=False)
+        self._exact.pop(digest, None)
+        for band, key in enumerate(keys):
+            if self._buckets[band].get(key) == group:
+                del self._buckets[band][key]
+        self._vectors.pop(group, None)
+        self.stats.evicted += 1
+
+    # ── Vector fan-out ──────────────────────────────────────────────
+
+    def set_vector(self, group: int, vec: Sequence[float]):
+        with self._lock:
+            if group in self._groups:
+                self._vectors[group] = np.asarray(vec, dtype=np.float32)
+
+    def vector(self, group: int) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._vectors.get(group)
+        return None if vec is None else vec.tolist()
+
+    def record_saved(self, n: int):
+        with self._lock:
+            self.stats.saved += n
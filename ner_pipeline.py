@@ -0,0 +1,208 @@
+"""
+Batched named-entity recognition for the analytics pass.
+
+Wrapped statistics and the entity graph both need entities for thousands of
+messages. BatchedNER runs them through one `nlp.pipe` call:
+
+  * components known not to affect entities (tagger, parser, lemmatizer,
+    attribute_ruler, senter, sentencizer, morphologizer) are skipped;
+    everything else runs, including entity_ruler / span_ruler and custom
+    entity components a configured model relies on;
+  * texts longer than max_chars are split at paragraph, then sentence,
+    then whitespace boundaries, so no single doc blows up a batch and the
+    pieces' entities are merged back per text;
+  * with n_process > 1, large inputs are sharded across worker processes
+    by spaCy (each worker gets its own copy of the pipeline);
+  * results are memoized by body digest, so a text seen earlier in the
+    process is not parsed again, and optionally persisted in an
+    EntityCache, so it is not parsed again by later runs either.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from entity_cache import Entity, EntityCache
+
+# Factories whose output NER does not read; all other components stay on
+SKIPPED_FACTORIES = frozenset({
+    "tagger", "parser", "lemmatizer", "trainable_lemmatizer", "attribute_ruler",
+    "senter", "sentencizer", "morphologizer",
+})
+
+# Entities that are only digits, hashes, paths, ... are noise for analytics
+_JUNK_ENTITY_RE = re.compile(r"[#\\d/_.]+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def keep_entity(text: str) -> bool:
+    return len(text) >= 3 and not text.isdigit() and not _JUNK_ENTITY_RE.fullmatch(text)
+
+
+def split_for_ner(text: str, max_chars: int) -> List[str]:
+    """
+    Cut text into pieces of at most max_chars, preferring paragraph, then
+    sentence, then whitespace boundaries. Short texts come back whole.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces: List[str] = []
+    buf = ""
+
+    def add(unit: str, sep: str):
+        nonlocal buf
+        if buf and len(buf) + len(sep) + len(unit) > max_chars:
+            pieces.append(buf)
+            buf = ""
+        buf = f"{buf}{sep}{unit}" if buf else unit
+
+    for paragraph in _PARAGRAPH_RE.split(text):
+        sep = "\n\n"
+        units = [paragraph] if len(paragraph) <= max_chars else _SENTENCE_RE.split(paragraph)
+        for unit in units:
+            while len(unit) > max_chars:
+                cut = unit.rfind(" ", 0, max_chars)
+                if cut < max_chars // 2:
+                    cut = max_chars
+                add(unit[:cut], sep)
+                unit = unit[cut:].lstrip()
+                sep = " "
+            if unit:
+                add(unit, sep)
+            sep = " "
+    if buf:
+        pieces.append(buf)
+    return pieces
+
+
+@dataclass
+class NERStats:
+    texts: int = 0
+    memo_hits: int = 0
+    cache_hits: int = 0
+    pieces: int = 0
+    chars: int = 0
+    seconds: float = 0.0
+    processes: int = 1
+
+    def summary(self) -> str:
+        rate = self.texts / self.seconds if self.seconds else 0.0
+        return (f"{self.texts} texts ({self.memo_hits} memoized, {self.cache_hits} cached, "
+                f"{self.pieces} pieces parsed, "
+                f"{self.chars / 1e6:.1f}M chars) in {self.seconds:.1f}s: {rate:,.0f} msgs/s, "
+                f"{rate / max(1, self.processes):,.0f} msgs/s/core on {self.processes} process(es)")
+
+
+def ner_relevant(nlp, name: str) -> bool:
+    """Whether pipeline component `name` can affect the entities"""
+    return nlp.get_pipe_meta(name).factory not in SKIPPED_FACTORIES
+
+
+def ner_components(nlp) -> List[str]:
+    """Names of the components BatchedNER runs, e.g. for cache keys"""
+    return [name for name in nlp.pipe_names if ner_relevant(nlp, name)]
+
+
+class BatchedNER:
+    """Entities for many texts through one batched, optionally multi-process nlp.pipe"""
+
+    def __init__(
+        self,
+        nlp,
+        n_process: int = 1,
+        batch_size: int = 128,
+        max_chars: int = 5_000,
+        min_texts_per_process: int = 1_000,
+        memo_size: int = 200_000,
+        cache: Optional[EntityCache] = None,
+    ):
+        self.nlp = nlp
+        self.n_process = max(1, n_process)
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.min_texts_per_process = min_texts_per_process
+        self.memo_size = memo_size
+        self.cache = cache
+        self.stats = NERStats()
+        self._memo: "OrderedDict[bytes, List[Entity]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def disabled(self) -> List[str]:
+        return [name for name in self.nlp.pipe_names if not ner_relevant(self.nlp, name)]
+
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+
+    def _remember(self, key: bytes, ents: List[Entity]):
+        with self._lock:
+            self._memo[key] = ents
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def entities(self, texts: Sequence[str]) -> List[List[Entity]]:
+        """(text, label) entities per input text, in input order"""
+        t0 = time.perf_counter()
+        out: List[List[Entity]] = [[] for _ in texts]
+        keys = [self._digest(t or "") for t in texts]
+
+        todo: Dict[bytes, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                hit = self._memo.get(key)
+                if hit is not None:
+                    self._memo.move_to_end(key)
+                    out[i] = list(hit)
+                else:
+                    todo.setdefault(key, []).append(i)
+
+        cache_hits = 0
+        if self.cache is not None and todo:
+            cached = self.cache.get_many([texts[idx[0]] or "" for idx in todo.values()])
+            for (key, idx), ents in zip(list(todo.items()), cached):
+                if ents is None:
+                    continue
+                self._remember(key, ents)
+                for i in idx:
+                    out[i] = list(ents)
+                cache_hits += len(idx)
+                del todo[key]
+
+        pieces: List[str] = []
+        owner: List[bytes] = []
+        for key, idx in todo.items():
+            for piece in split_for_ner(texts[idx[0]] or "", self.max_chars):
+                pieces.append(piece)
+                owner.append(key)
+
+        found: Dict[bytes, List[Entity]] = {key: [] for key in todo}
+        n_process = self.n_process if len(pieces) >= self.min_texts_per_process * self.n_process else 1
+        docs = self.nlp.pipe(pieces, batch_size=self.batch_size,
+                             n_process=n_process, disable=self.disabled)
+        for key, doc in zip(owner, docs):
+            found[key].extend((ent.text.strip(), ent.label_) for ent in doc.ents)
+
+        for key, ents in found.items():
+            self._remember(key, ents)
+            for i in todo[key]:
+                out[i] = list(ents)
+        if self.cache is not None and found:
+            self.cache.put_many([texts[todo[key][0]] or "" for key in found], list(found.values()))
+
+        with self._lock:
+            s = self.stats
+            s.texts += len(texts)
+            s.cache_hits += cache_hits
+            s.memo_hits += len(texts) - cache_hits - sum(len(idx) for idx in todo.values())
+            s.pieces += len(pieces)
+            s.chars += sum(map(len, pieces))
+            s.seconds += time.perf_counter() - t0
+            s.processes = max(s.processes, n_process)
+        return out
@@ -10,6 +10,8 @@ import tensorflow as tf
 from tensorboard.plugins import projector
 import random
 
+from embedding_codec import decode_embedding
+
 # Set random seed for reproducibility
 np.random.seed(42)
 random.seed(42)
@@ -53,11 +55,9 @@ def fetch_embeddings_from_supabase():
         embedding_json = r.get("embeddings_json")
         if embedding_json is not None:
             try:
-                import json
-                embedding_data = json.loads(embedding_json)
-                if isinstance(embedding_data, dict) and 'conversation' in embedding_data:
-                    conversation_embedding = embedding_data['conversation']
-                    embeddings.append(conversation_embedding)
+                conversation_embedding = decode_embedding(embedding_json)
+                if conversation_embedding is not None:
+                    embeddings.append(conversation_embedding.tolist())
                 else:
                     seed_value = hash(f"{emails[-1]}_{titles[-1]}_{i}") % (2**32)
                     local_random = np.random.RandomState(seed_value)
@@ -9,11 +9,15 @@ from supabase import create_client, Client
 import tensorflow as tf
 from tensorboard.plugins import projector
 import random
+
+from embedding_codec import decode_embedding
 from sklearn.cluster import KMeans
 from collections import Counter
 import re
 import anthropic
-import time
+
+import rate_limiter
+from rate_limiter import Priority
 
 # Set random seed for reproducibility
 np.random.seed(42)
@@ -58,7 +62,12 @@ Just return the cluster title, nothing else."""
 
         for attempt in range(max_retries):
             try:
-                message = client.messages.create(
+                # A 429 puts the shared limiter into cool-down before the next attempt
+                message = rate_limiter.call(
+                    "anthropic", client.messages.create,
+                    tokens=len(prompt) // 4 + 50,
+                    priority=Priority.BATCH,
+                    max_retries=0,
                     model="claude-3-haiku-20240307",  # Using Haiku for speed and cost efficiency
                     max_tokens=50,
                     messages=[
@@ -78,8 +87,6 @@ Just return the cluster title, nothing else."""
                 
             except Exception as e:
                 print(f"Attempt {attempt + 1} failed for cluster {cluster_id}: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(1)  # Brief delay before retry
                 continue
         
         # Fallback if all attempts fail
@@ -212,11 +219,9 @@ def fetch_embeddings_from_supabase():
         embedding_json = r.get("embeddings_json")
         if embedding_json is not None:
             try:
-                import json
-                embedding_data = json.loads(embedding_json)
-                if isinstance(embedding_data, dict) and 'conversation' in embedding_data:
-                    conversation_embedding = embedding_data['conversation']
-                    embeddings.append(conversation_embedding)
+                conversation_embedding = decode_embedding(embedding_json)
+                if conversation_embedding is not None:
+                    embeddings.append(conversation_embedding.tolist())
                 else:
                     seed_value = hash(f"{emails[-1]}_{titles[-1]}_{i}") % (2**32)
                     local_random = np.random.RandomState(seed_value)
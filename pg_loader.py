@@ -0,0 +1,161 @@
+"""
+Direct-Postgres bulk loader for chat_logs_final.
+
+PostgREST upserts cost one HTTP round trip per 50-100 rows. CopyLoader
+instead streams rows over a plain Postgres connection with
+`COPY ... FROM STDIN` into a temporary staging table and merges them with a
+single `INSERT ... SELECT ... ON CONFLICT` per load:
+
+  * rows carrying an `id` update the existing row (ON CONFLICT (id) DO UPDATE),
+    matching what a PostgREST upsert with ids does;
+  * rows without one are inserted, skipping any that hit a unique constraint.
+
+Rows are encoded to CSV lazily as COPY reads them, so `load()` accepts any
+iterable (e.g. a generator over iter_message_batches) without building the
+whole upload in memory. Point `dsn` at a local Postgres to try it out; see
+`python benchmarks.py copy --dsn ...`.
+"""
+import io
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import psycopg2
+from psycopg2 import sql
+
+# Bytes handed to COPY per read; larger reads mean fewer Python round trips
+_COPY_READ_SIZE = 1 << 16
+
+
+class _CsvStream(io.TextIOBase):
+    """File-like view over rows, CSV-encoded on demand for copy_expert"""
+
+    def __init__(self, rows: Iterator[Dict[str, Any]], columns: Sequence[str]):
+        self._rows = rows
+        self._columns = columns
+        self._pending = ""
+        self.rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _encode(self, row: Dict[str, Any]) -> str:
+        # NULL is an unquoted empty field; everything else is quoted, so
+        # empty strings stay empty strings. Postgres text cannot hold NUL.
+        fields = []
+        for col in self._columns:
+            val = row.get(col)
+            if val is None:
+                fields.append("")
+            else:
+                text = str(val).replace("\x00", "").replace('"', '""')
+                fields.append(f'"{text}"')
+        return ",".join(fields) + "\n"
+
+    def read(self, size: int = -1) -> str:
+        parts, n = [self._pending], len(self._pending)
+        while size < 0 or n < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = self._encode(row)
+            parts.append(line)
+            n += len(line)
+            self.rows += 1
+        out = "".join(parts)
+        if size < 0 or len(out) <= size:
+            self._pending = ""
+            return out
+        out, self._pending = out[:size], out[size:]
+        return out
+
+
+class CopyLoader:
+    """
+    Bulk loader over a direct Postgres connection.
+
+    Safe to share between threads: each thread gets its own connection,
+    and each load() runs in its own transaction.
+    """
+
+    def __init__(self, dsn: str, table_name: str, key: str = "id"):
+        self.dsn = dsn
+        self.table_name = table_name
+        self.key = key
+        self._local = threading.local()
+        self._conns: List[Any] = []
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = psycopg2.connect(self.dsn)
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def load(self, rows: Iterable[Dict[str, Any]],
+             columns: Optional[Sequence[str]] = None) -> int:
+        """
+        COPY rows into staging and merge them into the table; returns the row count.
+
+        Columns default to the keys of the first row; every row must carry
+        the same keys (as with a PostgREST bulk upsert).
+        """
+        it = iter(rows)
+        if columns is None:
+            first = next(it, None)
+            if first is None:
+                return 0
+            columns = list(first.keys())
+            it = _chain_first(first, it)
+        columns = list(columns)
+
+        table = sql.Identifier(self.table_name)
+        staging = sql.Identifier(f"_{self.table_name}_staging")
+        cols = sql.SQL(", ").join(map(sql.Identifier, columns))
+        if self.key in columns:
+            updates = sql.SQL(", ").join(
+                sql.SQL("{c} = EXCLUDED.{c}").format(c=sql.Identifier(c))
+                for c in columns if c != self.key
+            )
+            conflict = sql.SQL("ON CONFLICT ({k}) DO UPDATE SET {u}").format(
+                k=sql.Identifier(self.key), u=updates,
+            )
+        else:
+            conflict = sql.SQL("ON CONFLICT DO NOTHING")
+
+        stream = _CsvStream(it, columns)
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                # Column types only: no NOT NULL / identity constraints on staging
+                cur.execute(sql.SQL(
+                    "CREATE TEMP TABLE {s} ON COMMIT DROP AS "
+                    "SELECT {c} FROM {t} WITH NO DATA"
+                ).format(s=staging, c=cols, t=table))
+                cur.copy_expert(
+                    sql.SQL("COPY {s} ({c}) FROM STDIN WITH (FORMAT csv)")
+                    .format(s=staging, c=cols).as_string(conn),
+                    stream, size=_COPY_READ_SIZE,
+                )
+                cur.execute(sql.SQL(
+                    "INSERT INTO {t} ({c}) SELECT {c} FROM {s} {conflict}"
+                ).format(t=table, c=cols, s=staging, conflict=conflict))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return stream.rows
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                if not conn.closed:
+                    conn.close()
+            self._conns.clear()
+
+
+def _chain_first(first: Dict[str, Any], rest: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    yield first
+    yield from rest
@@ -0,0 +1,329 @@
+"""
+Client-side rate limiting and concurrency control for outbound API calls.
+
+Every call to Voyage, Anthropic or Groq goes through a ProviderLimiter, so
+workers, request handlers and batch jobs in one process draw from one
+quota per provider instead of each backing off on 429s independently:
+
+  * token buckets for requests/minute and tokens/minute;
+  * an AIMD concurrency limit: +1/limit per fast success, x0.9 when a call
+    is slower than the provider's latency target, x0.5 and a shared
+    cool-down (Retry-After when the provider sends one) on a 429;
+  * priority classes: waiting callers are admitted strictly by priority,
+    and BATCH callers leave a slice of each bucket to INTERACTIVE ones,
+    so a chat request never queues behind a re-embedding job.
+
+Use it through the module registry:
+
+    reply = rate_limiter.call("anthropic", claude.messages.create,
+                              tokens=..., priority=Priority.INTERACTIVE, **kw)
+    embed = limiter_for("voyage").wrap(model.get_text_embedding_batch, cost=...)
+
+metrics() returns per-provider counters; report() prints them. Limits come
+from PROVIDER_DEFAULTS and can be overridden with
+WRAPPED_RATE_<PROVIDER>_RPM / _TPM / _CONCURRENCY.
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field, replace
+from enum import IntEnum
+from typing import Any, Callable, Dict, Optional, Sequence, TypeVar
+
+from token_batcher import is_rate_limited
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Refills at `rate` units per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait_time(self, n: float = 1.0, reserve: float = 0.0) -> float:
+        """
+        Seconds until n units can be taken while leaving reserve x capacity behind.
+
+        Requests larger than the capacity wait for a full bucket and leave
+        it in debt, so later callers pay for the overshoot.
+        """
+        need = min(n + reserve * self.capacity, self.capacity)
+        with self._lock:
+            self._refill()
+            return max(0.0, (need - self._tokens) / self.rate)
+
+    def take(self, n: float = 1.0):
+        with self._lock:
+            self._refill()
+            self._tokens -= n
+
+    def acquire(self, n: float = 1.0) -> float:
+        """Take n units, blocking until they are available; returns seconds waited"""
+        waited = 0.0
+        while True:
+            pause = self.wait_time(n)
+            if pause <= 0:
+                self.take(n)
+                return waited
+            time.sleep(pause)
+            waited += pause
+
+
+class Priority(IntEnum):
+    """Lower values are admitted first"""
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+@dataclass
+class ProviderConfig:
+    requests_per_minute: float
+    tokens_per_minute: Optional[float] = None
+    max_concurrency: int = 4
+    min_concurrency: int = 1
+    target_latency_s: float = 10.0
+    # Share of each bucket BATCH callers leave for INTERACTIVE ones
+    batch_reserve: float = 0.2
+    max_backoff_s: float = 30.0
+
+
+# Conservative first-tier limits; override per deployment via the environment
+PROVIDER_DEFAULTS: Dict[str, ProviderConfig] = {
+    "voyage": ProviderConfig(requests_per_minute=300, tokens_per_minute=1_000_000,
+                             max_concurrency=8, target_latency_s=10.0),
+    "anthropic": ProviderConfig(requests_per_minute=50, tokens_per_minute=50_000,
+                                max_concurrency=4, target_latency_s=20.0),
+    "groq": ProviderConfig(requests_per_minute=30, tokens_per_minute=6_000,
+                           max_concurrency=4, target_latency_s=5.0),
+}
+
+
+@dataclass
+class ProviderStats:
+    calls: int = 0
+    ok: int = 0
+    rate_limited: int = 0
+    errors: int = 0
+    retries: int = 0
+    waited_s: float = 0.0
+    latency_ewma_s: float = 0.0
+    peak_in_flight: int = 0
+    decreases: int = 0
+    by_priority: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        return (f"{self.calls} calls ({self.ok} ok, {self.rate_limited} rate-limited, "
+                f"{self.errors} errors, {self.retries} retries), "
+                f"{self.waited_s:.1f}s queued, ~{self.latency_ewma_s:.2f}s latency, "
+                f"peak {self.peak_in_flight} in flight")
+
+
+def _retry_after(err: BaseException) -> Optional[float]:
+    """Retry-After seconds from an SDK error's response headers, if present"""
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderLimiter:
+    """Buckets, adaptive concurrency and priority admission for one provider"""
+
+    def __init__(self, name: str, config: ProviderConfig):
+        self.name = name
+        self.config = config
+        self.requests = TokenBucket(config.requests_per_minute / 60.0,
+                                    capacity=max(1.0, config.requests_per_minute / 60.0))
+        self.tokens = (TokenBucket(config.tokens_per_minute / 60.0,
+                                   capacity=config.tokens_per_minute / 60.0)
+                       if config.tokens_per_minute else None)
+        self.limit = float(config.max_concurrency)
+        self.in_flight = 0
+        self.stats = ProviderStats()
+        self._cooldown_until = 0.0
+        self._waiting: list = []            # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+
+    # ── Admission ───────────────────────────────────────────────────
+
+    def _bucket_wait(self, tokens: float, priority: Priority) -> float:
+        reserve = self.config.batch_reserve if priority > Priority.INTERACTIVE else 0.0
+        pause = self.requests.wait_time(1, reserve)
+        if self.tokens is not None and tokens:
+            pause = max(pause, self.tokens.wait_time(tokens, reserve))
+        return pause
+
+    def acquire(self, tokens: float = 0.0, priority: Priority = Priority.BATCH) -> float:
+        """Block until admitted (a concurrency slot plus quota); returns seconds waited"""
+        t0 = time.monotonic()
+        entry = (int(priority), next(self._tickets))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    pause = None
+                    if self._waiting[0] == entry and self.in_flight < max(1, int(self.limit)):
+                        pause = self._cooldown_until - time.monotonic()
+                        if pause <= 0:
+                            pause = self._bucket_wait(tokens, priority)
+                            if pause <= 0:
+                                break
+                    self._cond.wait(pause)
+                heapq.heappop(self._waiting)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+
+            self.requests.take(1)
+            if self.tokens is not None and tokens:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            waited = time.monotonic() - t0
+            s = self.stats
+            s.calls += 1
+            s.waited_s += waited
+            s.peak_in_flight = max(s.peak_in_flight, self.in_flight)
+            s.by_priority[priority.name] = s.by_priority.get(priority.name, 0) + 1
+            self._cond.notify_all()
+        return waited
+
+    def release(self, latency_s: float, err: Optional[BaseException] = None, attempt: int = 0):
+        """Return a slot and adapt the concurrency limit to the outcome"""
+        cfg = self.config
+        with self._cond:
+            self.in_flight -= 1
+            s = self.stats
+            if err is None:
+                s.ok += 1
+                s.latency_ewma_s = latency_s if s.ok == 1 else 0.8 * s.latency_ewma_s + 0.2 * latency_s
+                if latency_s > cfg.target_latency_s:
+                    self.limit = max(cfg.min_concurrency, self.limit * 0.9)
+                    s.decreases += 1
+                else:
+                    self.limit = min(cfg.max_concurrency, self.limit + 1.0 / self.limit)
+            elif is_rate_limited(err):
+                s.rate_limited += 1
+                s.decreases += 1
+                self.limit = max(cfg.min_concurrency, self.limit * 0.5)
+                wait = _retry_after(err)
+                if wait is None:
+                    wait = min(cfg.max_backoff_s, 2 ** attempt) * random.uniform(0.75, 1.25)
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + wait)
+            else:
+                s.errors += 1
+            self._cond.notify_all()
+
+    # ── Calling ─────────────────────────────────────────────────────
+
+    def call(self, fn: Callable[..., T], *args: Any, tokens: float = 0.0,
+             priority: Priority = Priority.BATCH, max_retries: int = 3, **kwargs: Any) -> T:
+        """
+        Run fn(*args, **kwargs) under this limiter.
+
+        Rate-limited calls wait out the shared cool-down and are retried up
+        to max_retries times; other exceptions propagate immediately.
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens, priority)
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as err:
+                attempt += 1
+                self.release(time.perf_counter() - t0, err, attempt)
+                if is_rate_limited(err) and attempt <= max_retries:
+                    with self._cond:
+                        self.stats.retries += 1
+                    continue
+                raise
+            self.release(time.perf_counter() - t0)
+            return result
+
+    def wrap(self, fn: Callable[..., T], cost: Callable[..., float] = lambda *a, **k: 0.0,
+             priority: Priority = Priority.BATCH, max_retries: int = 3) -> Callable[..., T]:
+        """fn gated by this limiter; cost(*args, **kwargs) estimates the tokens per call"""
+        def limited(*args, **kwargs):
+            return self.call(fn, *args, tokens=cost(*args, **kwargs), priority=priority,
+                             max_retries=max_retries, **kwargs)
+        return limited
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            out = asdict(self.stats)
+            out.update(limit=round(self.limit, 2), in_flight=self.in_flight,
+                       queued=len(self._waiting))
+        return out
+
+
+# ── Registry ────────────────────────────────────────────────────────
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def _config_from_env(name: str) -> ProviderConfig:
+    cfg = PROVIDER_DEFAULTS.get(name, ProviderConfig(requests_per_minute=60))
+    prefix = f"WRAPPED_RATE_{name.upper()}_"
+    overrides: Dict[str, Any] = {}
+    if os.environ.get(prefix + "RPM"):
+        overrides["requests_per_minute"] = float(os.environ[prefix + "RPM"])
+    if os.environ.get(prefix + "TPM"):
+        overrides["tokens_per_minute"] = float(os.environ[prefix + "TPM"])
+    if os.environ.get(prefix + "CONCURRENCY"):
+        overrides["max_concurrency"] = int(os.environ[prefix + "CONCURRENCY"])
+    return replace(cfg, **overrides)
+
+
+def limiter_for(provider: str, config: Optional[ProviderConfig] = None) -> ProviderLimiter:
+    """The process-wide limiter for provider, created on first use"""
+    with _registry_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None or config is not None:
+            limiter = ProviderLimiter(provider, config or _config_from_env(provider))
+            _limiters[provider] = limiter
+        return limiter
+
+
+def call(provider: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Shorthand for limiter_for(provider).call(fn, *args, **kwargs)"""
+    return limiter_for(provider).call(fn, *args, **kwargs)
+
+
+def estimate_chat_tokens(messages: Sequence[Dict[str, Any]], max_tokens: int = 0) -> int:
+    """Rough prompt + completion tokens of a chat request (~4 characters per token)"""
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return max(1, chars // 4) + max_tokens
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.metrics() for name, limiter in limiters.items()}
+
+
+def report():
+    with _registry_lock:
+        limiters = dict(_limiters)
+    for name, limiter in limiters.items():
+        print(f"🚦 {name}: {limiter.stats.summary()}, concurrency limit {limiter.limit:.1f}")
@@ -0,0 +1,258 @@
+"""
+Re-embed the rows whose stored embedding needs work, for one or many users.
+
+A row needs work if its embeddings_json is missing, unreadable, all zeros,
+the wrong size or from another model than the configured embedding backend
+(the SQL form of embedding_codec.needs_reembedding). Users are processed concurrently
+and share one backend (so one "voyage" limiter and TokenBudgetBatcher) and
+one EmbeddingCache.
+
+    python reembed.py                          # every e-mail in the table
+    python reembed.py a@x.com b@y.com --workers 8
+    python reembed.py --missing-only           # only rows with no embedding
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+import rate_limiter
+from claude_parser import (
+    TABLE_NAME, _with_retry, get_client, list_emails_in_database, make_embedding_backend,
+)
+from embedding_backends import EmbeddingBackend
+from embedding_cache import EmbeddingCache
+from embedding_codec import encode_embedding
+
+@dataclass
+class TenantProgress:
+    email: str
+    needs_work: int = 0
+    updated: int = 0
+    failed: int = 0
+    started: float = 0.0
+    finished: float = 0.0
+    error: str = ""
+
+    def line(self) -> str:
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+        state = "error" if self.error else "done" if self.finished else "running"
+        return (f"{self.email}: {state}, "
+                f"{self.updated}/{self.needs_work} re-embedded, {self.failed} failed, "
+                f"{elapsed:.0f}s")
+
+
+def _keyset_pages(query_for, page_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Pages of query_for() ordered by id, walked with id > last id"""
+    last_id = None
+    while True:
+        query = query_for().order("id").limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield rows
+        if len(rows) < page_size:
+            return
+
+
+def _stale_filter(model: str, dim: int) -> str:
+    """PostgREST or=() filter matching stored embeddings from another model, size or all zeros"""
+    zeros = [json.loads(encode_embedding(np.zeros(dim), dtype=dt))["b64"] for dt in ("f16", "f32")]
+    return ",".join([
+        # Legacy {"conversation": [...]} rows and unreadable values carry no model tag
+        "embeddings_json->>model.is.null",
+        f'embeddings_json->>model.neq."{model}"',
+        f'embeddings_json->>dim.neq.{dim}',
+        f'embeddings_json->>b64.in.({",".join(zeros)})',
+    ])
+
+
+def iter_rows_needing_embeddings(
+    email: str,
+    model: str,
+    dim: int,
+    table_name: str = TABLE_NAME,
+    page_size: int = 1_000,
+    missing_only: bool = False,
+    progress: Optional[TenantProgress] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield pages of {id, body} for a user's rows whose embedding needs work.
+
+    Rows are walked in id order with keyset pagination (id > last id), so
+    pages stay cheap however large the user is. Both passes filter in SQL
+    and only transfer candidates: first rows with no embedding, then
+    (unless missing_only) rows whose stored embedding has another model,
+    the wrong size or an all-zero payload. Rows with an empty body are
+    never selected, as there is nothing to embed.
+    """
+    tbl = get_client().table(table_name)
+    base = lambda: tbl.select("id, body").eq("email", email).neq("body", "")
+
+    missing = lambda: base().is_("embeddings_json", "null")
+    stale_filter = _stale_filter(model, dim)
+    stale = lambda: base().not_.is_("embeddings_json", "null").or_(stale_filter)
+
+    for query_for in (missing,) if missing_only else (missing, stale):
+        for rows in _keyset_pages(query_for, page_size):
+            if progress is not None:
+                progress.needs_work += len(rows)
+            yield rows
+
+
+def update_embeddings_for_email(
+    email: str,
+    table_name: str = TABLE_NAME,
+    batch_size: int = 50,
+    max_retries: int = 3,
+    backend: Optional[EmbeddingBackend] = None,
+    cache: Optional[EmbeddingCache] = None,
+    missing_only: bool = False,
+    progress: Optional[TenantProgress] = None,
+    verbose: bool = True,
+) -> TenantProgress:
+    """
+    Re-embed the rows of one email that need it and write them back.
+
+    Rows whose stored embedding is already a non-zero vector from the
+    backend's model are left alone (see iter_rows_needing_embeddings).
+    backend defaults to the configured one (EMBEDDING_BACKEND); backend and
+    cache may be shared across concurrent calls (see
+    bulk_update_embeddings_by_emails).
+    """
+    progress = progress or TenantProgress(email)
+    progress.started = time.time()
+    if verbose:
+        print(f"🔄 Updating embeddings for email: {email}")
+
+    backend = backend or make_embedding_backend()
+    cache = cache or EmbeddingCache(backend.model_id)
+    tbl = get_client().table(table_name)
+
+    pages = iter_rows_needing_embeddings(email, backend.model_id, backend.dim, table_name,
+                                         missing_only=missing_only, progress=progress)
+    for page in pages:
+        for start in range(0, len(page), batch_size):
+            batch = page[start:start + batch_size]
+            texts_to_embed = [r["body"] for r in batch]
+
+            # Cached bodies skip the API; failing requests are bisected
+            embeddings = cache.embed(texts_to_embed, backend.embed)
+
+            updates = []
+            for row, embedding in zip(batch, embeddings):
+                if embedding is None:
+                    progress.failed += 1
+                    continue
+                updates.append({
+                    "id": row["id"],
+                    "embeddings_json": encode_embedding(embedding, model=backend.model_id)
+                })
+            if not updates:
+                continue
+
+            try:
+                _with_retry(lambda: tbl.upsert(updates).execute(),
+                            max_retries=max_retries, label=f"{email}: update")
+            except Exception as err:
+                progress.error = f"update failed after {max_retries} retries: {err}"
+                progress.finished = time.time()
+                print("🛑 Stopping this email to avoid data inconsistency")
+                return progress
+            progress.updated += len(updates)
+
+            if verbose:
+                print(f"   {progress.line()}")
+
+    progress.finished = time.time()
+    if verbose:
+        print(f"🎉 {progress.line()}")
+    return progress
+
+
+def bulk_update_embeddings_by_emails(
+    emails: List[str],
+    table_name: str = TABLE_NAME,
+    batch_size: int = 50,
+    workers: int = 4,
+    missing_only: bool = False,
+    report_every_s: float = 30.0,
+) -> Dict[str, TenantProgress]:
+    """
+    Re-embed every email's stale rows with a pool of workers.
+
+    Emails are processed concurrently (one worker per email at a time),
+    all drawing from one configured backend (with Voyage: the shared
+    "voyage" limiter at batch priority, so chat traffic in the same process
+    goes first, and one TokenBudgetBatcher) and one EmbeddingCache.
+    Progress for every tenant is printed every report_every_s seconds and
+    at the end.
+    """
+    print(f"🔄 Bulk updating embeddings for {len(emails)} emails with {workers} workers...")
+    backend = make_embedding_backend()
+    cache = EmbeddingCache(backend.model_id)
+    progress = {email: TenantProgress(email) for email in emails}
+
+    def run(email: str) -> TenantProgress:
+        p = progress[email]
+        try:
+            return update_embeddings_for_email(
+                email, table_name, batch_size, backend=backend, cache=cache,
+                missing_only=missing_only, progress=p, verbose=False,
+            )
+        except Exception as e:
+            p.error = str(e)
+            p.finished = time.time()
+            print(f"❌ Failed to process {email}: {e}")
+            return p
+
+    done = threading.Event()
+
+    def reporter():
+        while not done.wait(report_every_s):
+            active = [p for p in progress.values() if p.started and not p.finished]
+            finished = sum(1 for p in progress.values() if p.finished)
+            print(f"\n📈 {finished}/{len(emails)} emails finished, "
+                  f"{sum(p.updated for p in progress.values())} rows re-embedded")
+            for p in active:
+                print(f"   {p.line()}")
+
+    threading.Thread(target=reporter, name="reembed-progress", daemon=True).start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for p in pool.map(run, emails):
+                print(f"✅ {p.line()}")
+    finally:
+        done.set()
+
+    print(f"\n🎉 Bulk update complete for {len(emails)} emails!")
+    print(f"   {sum(p.updated for p in progress.values())} rows re-embedded, "
+          f"{sum(p.failed for p in progress.values())} failed, "
+          f"{sum(1 for p in progress.values() if p.error)} emails with errors")
+    backend.report()
+    print(f"🗄️  Embedding cache: {cache.stats.summary()}")
+    rate_limiter.report()
+    return progress
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Re-embed rows whose stored embedding needs work")
+    ap.add_argument("emails", nargs="*", help="users to process (default: every e-mail in the table)")
+    ap.add_argument("--table", default=TABLE_NAME)
+    ap.add_argument("--workers", type=int, default=4, help="users processed concurrently")
+    ap.add_argument("--batch-size", type=int, default=50, help="rows per embed + update")
+    ap.add_argument("--missing-only", action="store_true",
+                    help="only rows with no embedding (skips the stale-vector pass)")
+    args = ap.parse_args()
+
+    emails = args.emails or list_emails_in_database(args.table)
+    bulk_update_embeddings_by_emails(emails, args.table, args.batch_size, args.workers,
+                                     args.missing_only)
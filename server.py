@@ -14,13 +14,19 @@ from sklearn.metrics.pairwise import cosine_similarity
 import random
 from supabase import create_client, Client
 import anthropic
-from sentence_transformers import SentenceTransformer
 from urllib.parse import unquote as decodeURIComponent
 from groq import Groq
 
+import rate_limiter
+from activity_rollups import ActivityRollup
+from claude_parser import make_embedding_backend
+from embedding_codec import decode_many
+from rate_limiter import Priority, estimate_chat_tokens
+
 # --- Model Loading ---
-# Load the sentence transformer model globally so it's not reloaded on every request
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+# Query embeddings come from the backend ingestion stored them with
+# (WRAPPED_EMBEDDING_BACKEND), so queries and rows share one vector space
+embedding_backend = make_embedding_backend()
 
 # --- Setup ---
 CHAT_LOG_DIR = "chat_sessions"
@@ -59,18 +65,22 @@ Here are the conversation titles in this cluster:
 {titles_text}
 
 Please generate a very short (2-4 words) descriptive title... DO NOT give anything more or else. only say 2-4 words starting now!"""
-    
-    for attempt in range(max_retries):
-        try:
-            message = claude.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=6,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return message.content[0].text.strip().replace('"', '').replace("'", "")
-        except Exception as e:
-            print(f"Claude API call failed, falling back to keyword extraction. Error: {e}")
-            time.sleep(1)
+    messages = [{"role": "user", "content": prompt}]
+
+    # Rate-limited calls are retried by the limiter; anything else falls back
+    try:
+        message = rate_limiter.call(
+            "anthropic", claude.messages.create,
+            tokens=estimate_chat_tokens(messages, 6),
+            priority=Priority.BATCH,
+            max_retries=max_retries,
+            model="claude-3-haiku-20240307",
+            max_tokens=6,
+            messages=messages
+        )
+        return message.content[0].text.strip().replace('"', '').replace("'", "")
+    except Exception as e:
+        print(f"Claude API call failed, falling back to keyword extraction. Error: {e}")
     return extract_keywords_from_titles(conversation_titles)
 
 def extract_keywords_from_titles(titles, top_n=2):
@@ -118,22 +128,23 @@ def fetch_embeddings_from_supabase():
             offset += batch_size
             continue
 
-    embeddings, emails, titles, timestamps, bodies = [], [], [], [], []
-    for i, r in enumerate(all_records):
+    emails, titles, timestamps, bodies = [], [], [], []
+    for r in all_records:
         emails.append(r.get("email", "unknown"))
         titles.append(r.get("title", "untitled"))
         timestamps.append(r.get("created_at", datetime.now().isoformat()))
         bodies.append(r.get("body", ""))
-        emb = r.get("embeddings_json")
-        if emb:
-            try:
-                emb_obj = json.loads(emb)
-                embeddings.append(emb_obj.get("conversation", np.random.randn(512).tolist()))
-            except:
-                embeddings.append(np.random.randn(512).tolist())
-        else:
-            embeddings.append(np.random.randn(512).tolist())
-    return np.array(embeddings), emails, titles, timestamps, bodies
+
+    # Binary (v2) and legacy JSON embeddings decode straight into one matrix.
+    # Rows without a vector from the configured backend's model are left out
+    # rather than placed at random; `reembed.py` fills them in.
+    embeddings, ok = decode_many((r.get("embeddings_json") for r in all_records),
+                                 embedding_backend.dim, model=embedding_backend.model_id)
+    if not ok.all():
+        print(f"Skipping {int((~ok).sum())} records without a {embedding_backend.model_id} embedding")
+    keep = np.flatnonzero(ok)
+    pick = lambda values: [values[i] for i in keep]
+    return embeddings[ok], pick(emails), pick(titles), pick(timestamps), pick(bodies)
 
 def generate_cluster_titles_for_users(df, embeddings, n_clusters=5):
     cluster_info = {}
@@ -206,6 +217,38 @@ if os.path.exists('dist'):
 def health():
     return jsonify({'status': 'ok'})
 
+@app.route('/api/limits')
+def limits():
+    # Per-provider rate limiter counters (calls, 429s, queueing, concurrency)
+    return jsonify(rate_limiter.metrics())
+
+@app.route('/api/activity')
+def activity():
+    # Activity views for [start, end) from the hourly rollup in wrapped_json;
+    # answered from the rollup alone, without reading message rows
+    email = request.args.get('email')
+    if not email:
+        return jsonify({"error": "email is required"}), 400
+    try:
+        utc_offset = int(request.args.get('utc_offset', 0))
+    except ValueError:
+        return jsonify({"error": "utc_offset must be a whole number of hours"}), 400
+
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    resp = (supabase.table("chat_logs_final").select("wrapped_json")
+            .eq("email", email).order("created_at").limit(1).execute())
+    rows = resp.data or []
+    wrapped = json.loads(rows[0].get("wrapped_json") or "{}") if rows else {}
+    if "activity" not in wrapped:
+        return jsonify({"error": "No activity rollup for this user yet."}), 404
+
+    rollup = ActivityRollup.from_dict(wrapped["activity"])
+    try:
+        summary = rollup.summary(request.args.get('start'), request.args.get('end'), utc_offset)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid range: {e}"}), 400
+    return jsonify(summary)
+
 @app.route('/api/data')
 def get_data():
     global cached_df, cached_cluster_info, cached_embeddings, last_updated
@@ -288,7 +331,7 @@ def compare_users():
 
 @app.route('/api/chat', methods=['POST'])
 def chat_handler():
-    global cached_df, cached_embeddings, embedding_model, claude
+    global cached_df, cached_embeddings, embedding_backend, claude
     if cached_df is None or cached_embeddings is None:
         return jsonify({"response": "Sorry, the data is not yet loaded. Please wait a moment and try again."}), 500
 
@@ -309,15 +352,7 @@ def chat_handler():
     user_embeddings = cached_embeddings[user_indices]
 
     # Embed the user's query
-    query_embedding = embedding_model.encode(query, convert_to_tensor=False)
-    
-    # Check for dimension mismatch and pad if necessary
-    if query_embedding.shape[0] != user_embeddings.shape[1]:
-        # This is a fallback. Ideally, the offline and online embedding models should be identical.
-        # all-MiniLM-L6-v2 is 384, and the db seems to have 512.
-        padded_query_embedding = np.zeros(user_embeddings.shape[1])
-        padded_query_embedding[:query_embedding.shape[0]] = query_embedding
-        query_embedding = padded_query_embedding
+    query_embedding = embedding_backend.embed_query(query)
 
     # Calculate similarities and get top results
     similarities = cosine_similarity([query_embedding], user_embeddings)[0]
@@ -360,7 +395,10 @@ Be conversational and helpful.
 
     # --- 3. Call Claude API ---
     try:
-        message = claude.messages.create(
+        message = rate_limiter.call(
+            "anthropic", claude.messages.create,
+            tokens=estimate_chat_tokens(messages, 800),
+            priority=Priority.INTERACTIVE,
             model="claude-3-haiku-20240307",
             max_tokens=800,
             temperature=0.2,
@@ -375,7 +413,7 @@ Be conversational and helpful.
 
 @app.route('/api/collab_chat', methods=['POST'])
 def collab_chat_handler():
-    global cached_df, cached_embeddings, embedding_model, groq_client, CHAT_LOG_DIR
+    global cached_df, cached_embeddings, embedding_backend, groq_client, CHAT_LOG_DIR
     if cached_df is None or cached_embeddings is None:
         return jsonify({"response": "Sorry, the main data is not yet loaded. Please wait a moment."}), 500
 
@@ -412,12 +450,9 @@ def collab_chat_handler():
             
             user_indices = user_df.index.tolist()
             user_embeddings = cached_embeddings[user_indices]
-            topic_embedding = embedding_model.encode(search_topic)
-
-            padded_topic_embedding = np.zeros(user_embeddings.shape[1])
-            padded_topic_embedding[:topic_embedding.shape[0]] = topic_embedding
+            topic_embedding = embedding_backend.embed_query(search_topic)
 
-            similarities = cosine_similarity([padded_topic_embedding], user_embeddings)[0]
+            similarities = cosine_similarity([topic_embedding], user_embeddings)[0]
             top_indices = np.argsort(similarities)[-3:][::-1]
 
             context = ""
@@ -450,7 +485,10 @@ Address the user who mentioned you ({currentUserEmail}) but keep the other parti
         
         
         try:
-            chat_completion = groq_client.chat.completions.create(
+            chat_completion = rate_limiter.call(
+                "groq", groq_client.chat.completions.create,
+                tokens=estimate_chat_tokens(messages_for_api, 1024),
+                priority=Priority.INTERACTIVE,
                 messages=messages_for_api,
                 model="llama-3.1-8b-instant",
                 temperature=0.5,
@@ -494,7 +532,10 @@ Conversation Text:
     ]
 
     try:
-        chat_completion = groq_client.chat.completions.create(
+        chat_completion = rate_limiter.call(
+            "groq", groq_client.chat.completions.create,
+            tokens=estimate_chat_tokens(messages_for_api, 150),
+            priority=Priority.INTERACTIVE,
             messages=messages_for_api,
             model="llama-3.1-8b-instant",
             temperature=0.2,
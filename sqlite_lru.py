@@ -0,0 +1,98 @@
+"""
+Key -> value store in a local SQLite file with LRU eviction by entry count.
+
+The embedding and entity caches are both content-addressed (the key is a
+digest of the model and the text) and only differ in what they store, so
+they share this store and encode their values themselves.
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Sequence, Tuple
+
+# SQLite's default limit on bound parameters is 999 on older builds
+_SQL_CHUNK = 900
+
+
+class SQLiteLRU:
+    """
+    One table of (key BLOB, <value_column>, last_used) rows.
+
+    Lookups bump last_used; once more than max_entries rows are stored,
+    the least recently used are deleted. Thread-safe.
+    """
+
+    def __init__(self, path: str | Path, table: str, value_column: str,
+                 value_type: str, max_entries: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.value_column = value_column
+        self.max_entries = max_entries
+        self.evicted = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f" key BLOB PRIMARY KEY, {value_column} {value_type} NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table}(last_used)"
+        )
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, Any]:
+        """Stored values of the keys that are present, marking them used"""
+        found: Dict[bytes, Any] = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_CHUNK):
+                part = list(keys[i:i + _SQL_CHUNK])
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, {self.value_column} FROM {self.table} WHERE key IN ({marks})",
+                    part,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, Any]]) -> int:
+        """Store values for keys not yet present; returns how many entries were evicted"""
+        now = time.time()
+        rows = [(k, v, now) for k, v in items]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO {self.table} (key, {self.value_column}, last_used)"
+                f" VALUES (?, ?, ?)", rows
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                return self._evict()
+        return 0
+
+    def _evict(self) -> int:
+        # Drop 5% extra so we don't evict on every insert once full
+        excess = self._count - int(self.max_entries * 0.95)
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f" SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        self.evicted += excess
+        return excess
+
+    def close(self):
+        self._conn.close()
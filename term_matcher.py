@@ -0,0 +1,94 @@
+"""
+Single-pass dictionary matching for the languages stat.
+
+TermMatcher compiles every surface form in a term dictionary into one
+case-insensitive regex whose alternation is factored as a trie
+("java|javascript" becomes "java(?:script)?"), so the regex engine walks
+shared prefixes once and a scan costs about the same for 12 terms as for
+thousands. Matches must not touch a word character or "+" on either side,
+nor a "#" after them, so "c" does not match inside "c++" or "c#", and
+"c++" does match (which `\\b` boundaries could not express). A version
+number may follow a term that ends in a symbol ("c++17"), and a hashtag
+counts ("#python").
+
+Terms map surface forms to labels, so aliases ("golang" -> "go") and large
+dictionaries of frameworks and libraries can be loaded from JSON:
+
+    {"go": ["go", "golang"], "react": ["react", "react.js", "reactjs"]}
+"""
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Set, Union
+
+import pandas as pd
+
+# Labels spotify_wrapped has always reported, each matched by its own name
+DEFAULT_LANGUAGES = [
+    "python", "javascript", "typescript", "c++", "c", "java",
+    "go", "rust", "ruby", "php", "scala", "sql",
+]
+
+# No word character or "+" may precede a match ("#python" counts). After a
+# term ending in a word character no word character, "+" or "#" may follow;
+# after one ending in a symbol ("c++", "c#") a version number may ("c++17").
+_BEFORE = r"(?<![\w+])"
+_AFTER = r"(?:(?<=\w)(?![\w+#])|(?<!\w)(?![^\W\d]|[+#]))"
+
+
+def trie_regex(terms: Iterable[str]) -> str:
+    """Regex source matching any of terms, with alternation factored as a trie"""
+    trie: dict = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            # Greedy: the longer term is tried first, the shorter one on backtrack
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+def load_terms(path: Union[str, Path]) -> Dict[str, str]:
+    """Surface form -> label from a JSON file of {label: [surface forms]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {form: label for label, forms in data.items() for form in forms}
+
+
+class TermMatcher:
+    """Counts, per label, how many texts mention any of its surface forms"""
+
+    def __init__(self, terms: Union[Mapping[str, str], Iterable[str]]):
+        if not isinstance(terms, Mapping):
+            terms = {t: t for t in terms}
+        self.labels: Dict[str, str] = {form.lower(): label for form, label in terms.items() if form}
+        source = trie_regex(self.labels)
+        self.pattern = re.compile(f"{_BEFORE}(?:{source}){_AFTER}", re.IGNORECASE)
+
+    def find(self, text: str) -> Set[str]:
+        """Labels mentioned in text"""
+        return {self.labels[m.group(0).lower()] for m in self.pattern.finditer(text)}
+
+    def count_documents(self, texts: pd.Series) -> Dict[str, int]:
+        """Number of texts mentioning each label (labels with no mentions are omitted)"""
+        found = texts.fillna("").astype(str).str.findall(self.pattern)
+        hits = found.explode().dropna()
+        if hits.empty:
+            return {}
+        pairs = pd.DataFrame({
+            "doc": pd.RangeIndex(len(found)).repeat(found.str.len()),
+            "label": hits.str.lower().map(self.labels).to_numpy(),
+        })
+        counts = pairs.drop_duplicates().label.value_counts()
+        return {label: int(n) for label, n in counts.items()}
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from activity_rollups import ROLES, ActivityRollup
+
+
+def _frame(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-01-01", tz="UTC").value
+    created = start + rng.integers(0, 120 * 86_400 * 10**9, n)
+    # One stray timestamp decades away must cost a single bucket
+    created[0] = pd.Timestamp("1999-06-01 12:30", tz="UTC").value
+    return pd.DataFrame({
+        "author_role": rng.choice(["user", "assistant", "system"], n),
+        "body": rng.choice(["one", "two words", "three words here", None], n),
+        "created_at": pd.to_datetime(created, utc=True),
+    })
+
+
+def _expected_totals(df):
+    role = df.author_role.where(df.author_role.isin(["user", "assistant"]), "other")
+    words = df.body.fillna("").str.split().str.len()
+    return (
+        {r: int((role == r).sum()) for r in ROLES},
+        {r: int(words[role == r].sum()) for r in ROLES},
+    )
+
+
+def _assert_same(a, b):
+    assert np.array_equal(a.hours, b.hours)
+    assert np.array_equal(a.messages, b.messages)
+    assert np.array_equal(a.tokens, b.tokens)
+
+
+def test_range_totals_match_the_rows_in_range():
+    df = _frame()
+    rollup = ActivityRollup().update(df)
+    assert rollup.buckets == df.created_at.dt.floor("h").nunique()
+
+    for start, end in [(None, None), ("2024-02-01", "2024-03-01"),
+                       ("2024-01-15 06:00", None), (None, "2024-01-01"),
+                       ("2024-03-01", "2024-02-01")]:
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df.created_at >= pd.Timestamp(start, tz="UTC")
+        if end is not None:
+            mask &= df.created_at < pd.Timestamp(end, tz="UTC")
+        messages, tokens = _expected_totals(df[mask])
+        got = rollup.totals(start, end)
+        assert got["messages"] == messages
+        assert got["tokens"] == tokens
+
+
+def test_heatmap_daily_and_monthly_use_local_hours():
+    df = _frame(seed=1)
+    rollup = ActivityRollup().update(df)
+    offset = -5
+    local = df.created_at + pd.Timedelta(hours=offset)
+
+    expected = np.zeros((7, 24), dtype=int)
+    np.add.at(expected, (local.dt.weekday.to_numpy(), local.dt.hour.to_numpy()), 1)
+    assert rollup.heatmap(utc_offset_hours=offset) == expected.tolist()
+
+    days = local.dt.strftime("%Y-%m-%d").value_counts()
+    assert rollup.daily(utc_offset_hours=offset) == {d: int(n) for d, n in days.items()}
+
+    months = df.created_at.dt.strftime("%Y-%m").value_counts()
+    monthly = rollup.monthly()
+    assert {m: v["messages"] for m, v in monthly.items()} == {m: int(n) for m, n in months.items()}
+
+
+def test_weekly_streaks():
+    days = ["2024-01-01", "2024-01-09", "2024-01-17", "2024-02-05", "2024-02-12"]
+    df = pd.DataFrame({
+        "author_role": "user",
+        "body": "hi",
+        "created_at": pd.to_datetime(days, utc=True),
+    })
+    rollup = ActivityRollup().update(df)
+    assert rollup.weekly_streaks() == {"active_weeks": 5, "longest": 3, "current": 2}
+    assert rollup.weekly_streaks(end="2024-02-01")["current"] == 0
+
+
+def test_merge_equals_one_update():
+    df = _frame(seed=2)
+    whole = ActivityRollup().update(df)
+    parts = [ActivityRollup().update(df.iloc[i::3]) for i in range(3)]
+    merged = parts[0].merge(parts[1]).merge(parts[2])
+    _assert_same(merged, whole)
+    assert merged.summary() == whole.summary()
+
+
+def test_dict_round_trip():
+    rollup = ActivityRollup().update(_frame(seed=3))
+    _assert_same(ActivityRollup.from_dict(rollup.to_dict()), rollup)
+    assert ActivityRollup.from_dict(ActivityRollup().to_dict()).buckets == 0
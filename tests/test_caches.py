@@ -0,0 +1,59 @@
+import time
+
+from embedding_cache import EmbeddingCache
+from entity_cache import EntityCache
+from sqlite_lru import SQLiteLRU
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    store = SQLiteLRU(tmp_path / "s.sqlite3", "t", "v", "TEXT", max_entries=4)
+    for i in range(4):
+        store.put_many([(bytes([i]), str(i))])
+        time.sleep(0.01)
+    store.get_many([b"\x00"])                       # 0 is now the most recent
+    time.sleep(0.01)
+    # Over the limit: down to 95% of max_entries, oldest first (1 and 2)
+    assert store.put_many([(b"\x09", "9")]) == 2
+    assert len(store) == 3
+    assert store.get_many([bytes([i]) for i in (0, 1, 2, 3, 9)]) == {
+        b"\x00": "0", b"\x03": "3", b"\x09": "9",
+    }
+
+
+def test_embedding_cache_only_embeds_misses(tmp_path):
+    cache = EmbeddingCache("m", cache_dir=tmp_path)
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    assert cache.embed(["a", "bb", "a"], embed) == [[1.0], [2.0], [1.0]]
+    assert cache.embed(["bb", "ccc"], embed) == [[2.0], [3.0]]
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.requests) == (1, 4, 2)
+
+
+def test_embedding_cache_is_keyed_by_model(tmp_path):
+    EmbeddingCache("a", cache_dir=tmp_path).put_many(["x"], [[1.0]])
+    assert EmbeddingCache("b", cache_dir=tmp_path).get_many(["x"]) == [None]
+    assert EmbeddingCache("a", cache_dir=tmp_path).get_many(["x"]) == [[1.0]]
+
+
+def test_entity_cache_round_trip(tmp_path):
+    cache = EntityCache("v1", cache_dir=tmp_path)
+    cache.put_many(["in Paris"], [[("Paris", "GPE")]])
+    assert cache.get_many(["in Paris", "other"]) == [[("Paris", "GPE")], None]
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_embedding_cache_stats_add_up_across_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = EmbeddingCache("m", cache_dir=tmp_path)
+    batches = [[f"text {i % 50}", f"other {i}"] for i in range(400)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda b: cache.embed(b, lambda ts: [[1.0]] * len(ts)), batches))
+    s = cache.stats
+    assert s.requests == len(batches)
+    assert s.hits + s.misses == 2 * len(batches)
@@ -0,0 +1,89 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from cooccurrence import EntityCooccurrence
+
+
+def _documents(n=200, vocab=40, seed=0):
+    rng = np.random.default_rng(seed)
+    # Zipf-ish popularity so PageRank has a clear head
+    p = 1.0 / np.arange(1, vocab + 1)
+    p /= p.sum()
+    return [[f"E{i}" for i in rng.choice(vocab, rng.integers(1, 8), p=p)] for _ in range(n)]
+
+
+def _reference_graph(docs):
+    """The per-pair networkx build the sparse matrix replaced"""
+    g = nx.Graph()
+    for entities in docs:
+        g.add_nodes_from(entities)
+        for i, a in enumerate(entities):
+            for b in entities[i + 1:]:
+                if g.has_edge(a, b):
+                    g[a][b]["weight"] += 1
+                else:
+                    g.add_edge(a, b, weight=1)
+    return g
+
+
+@pytest.fixture
+def docs():
+    return _documents()
+
+
+def test_edge_weights_match_networkx(docs):
+    cooc = EntityCooccurrence()
+    cooc.add_documents(docs)
+    expected = _reference_graph(docs)
+    got = cooc.to_networkx()
+
+    assert set(got.nodes) == set(expected.nodes)
+    assert {frozenset(e) for e in got.edges} == {frozenset(e) for e in expected.edges}
+    for a, b, w in expected.edges(data="weight"):
+        assert got[a][b]["weight"] == w
+    assert nx.number_of_selfloops(expected) > 0
+
+
+def test_bridge_edges_are_the_heaviest_networkx_edges(docs):
+    cooc = EntityCooccurrence()
+    cooc.add_documents(docs)
+    expected = _reference_graph(docs)
+
+    k = 10
+    top = cooc.top_edges(k)
+    heaviest = sorted((w for _, _, w in expected.edges(data="weight")), reverse=True)[:k]
+    assert [w for _, _, w in top] == heaviest
+    for a, b, w in top:
+        assert expected[a][b]["weight"] == w
+
+
+def test_pagerank_matches_networkx(docs):
+    cooc = EntityCooccurrence()
+    cooc.add_documents(docs)
+    expected = nx.pagerank(_reference_graph(docs), weight="weight", tol=1e-10)
+
+    pr = cooc.pagerank(tol=1e-10)
+    for name, i in cooc.vocab.items():
+        assert pr[i] == pytest.approx(expected[name], abs=1e-8)
+
+    k = 5
+    ranked = sorted(expected, key=expected.get, reverse=True)[:k]
+    assert [name for name, _ in cooc.top_entities(k)] == ranked
+
+
+def test_keyed_documents_extend_their_row(docs):
+    whole = EntityCooccurrence()
+    for i, entities in enumerate(docs):
+        whole.add_document(entities, key=f"c{i % 50}")
+
+    # The same mentions, added in two passes under the same keys
+    first = EntityCooccurrence()
+    for i, entities in enumerate(docs[:100]):
+        first.add_document(entities, key=f"c{i % 50}")
+    resumed = EntityCooccurrence.from_state(first.state())
+    for i, entities in enumerate(docs[100:], start=100):
+        resumed.add_document(entities, key=f"c{i % 50}")
+
+    assert resumed.documents == whole.documents == 50
+    assert nx.utils.graphs_equal(resumed.to_networkx(), whole.to_networkx())
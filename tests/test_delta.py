@@ -0,0 +1,46 @@
+import pandas as pd
+
+from claude_parser import DeltaStats, StoredMessages, _body_hash, _message_slots, diff_messages
+
+
+def _frame(bodies, roles=("user", "assistant"), ts="2024-01-01T00:00:00Z"):
+    return pd.DataFrame({
+        "conversation_id": ["c1"] * len(bodies),
+        "author_role": list(roles)[:len(bodies)],
+        "body": list(bodies),
+        "created_at": [ts] * len(bodies),
+    })
+
+
+def _stored(df, ids):
+    slots = {}
+    for slot, row_id, body in zip(_message_slots(df), ids, df["body"]):
+        slots.setdefault(slot, []).append((row_id, _body_hash(body)))
+    return StoredMessages(slots)
+
+
+def test_same_timestamp_messages_are_all_stored():
+    stored = _stored(_frame(["hi", "hello"]), ["r1", "r2"])
+    assert len(stored) == 2
+
+
+def test_unchanged_export_with_shared_timestamp_is_a_no_op():
+    df = _frame(["hi", "hello"])
+    stats = DeltaStats()
+    new, edited = diff_messages(df, _stored(df, ["r1", "r2"]), stats)
+    assert len(new) == 0 and len(edited) == 0
+    assert stats.unchanged == 2
+
+
+def test_edit_within_shared_timestamp_keeps_the_right_id():
+    stored = _stored(_frame(["hi", "hello"]), ["r1", "r2"])
+    new, edited = diff_messages(_frame(["hi", "hello there"]), stored)
+    assert len(new) == 0
+    assert edited[["id", "author_role", "body"]].values.tolist() == [["r2", "assistant", "hello there"]]
+
+
+def test_extra_message_in_a_shared_slot_is_new():
+    stored = _stored(_frame(["hi"]), ["r1"])
+    new, edited = diff_messages(_frame(["hi", "hello"]), stored)
+    assert new["body"].tolist() == ["hello"]
+    assert len(edited) == 0
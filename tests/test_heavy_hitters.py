@@ -0,0 +1,95 @@
+import collections
+
+import numpy as np
+import pytest
+
+from heavy_hitters import SpaceSaving
+
+
+def _stream(n=20_000, vocab=2_000, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"item{i}" for i in rng.zipf(1.3, n) % vocab]
+
+
+def _batches(items, size=1_000):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _assert_guarantees(sketch, truth):
+    assert sketch.n == sum(truth.values())
+    assert len(sketch) <= sketch.capacity
+    for item, true in truth.items():
+        count, error = sketch.estimate(item)
+        assert count >= true
+        assert count - error <= true
+        assert error <= sketch.error_bound
+        if true > sketch.floor:
+            assert item in sketch.counts
+    assert sketch.floor <= sketch.error_bound
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_counts_bound_the_true_counts(seed):
+    items = _stream(seed=seed)
+    sketch = SpaceSaving(capacity=100)
+    for batch in _batches(items):
+        sketch.update(batch)
+    _assert_guarantees(sketch, collections.Counter(items))
+
+
+def test_guaranteed_items_are_in_the_true_top_k():
+    items = _stream(seed=3)
+    truth = collections.Counter(items)
+    sketch = SpaceSaving(capacity=50)
+    for batch in _batches(items, 500):
+        sketch.update(batch)
+
+    k = 10
+    kth = sorted(truth.values(), reverse=True)[k - 1]
+    guaranteed = sketch.guaranteed(k)
+    assert guaranteed
+    for item, _ in guaranteed:
+        assert truth[item] >= kth
+    assert [item for item, _ in guaranteed] == [item for item, _ in sketch.most_common(len(guaranteed))]
+
+
+def test_exact_sketch_guarantees_its_whole_top_k():
+    items = _stream(n=2_000, seed=4)
+    sketch = SpaceSaving().update(items)
+    assert sketch.floor == 0 and sketch.max_error == 0
+    assert dict(sketch.counts) == collections.Counter(items)
+    assert sketch.guaranteed(3) == sketch.most_common(3)
+
+
+def test_merge_keeps_the_guarantees():
+    items = _stream(n=30_000, seed=5)
+    parts = [items[i::4] for i in range(4)]
+    sketches = []
+    for part in parts:
+        s = SpaceSaving(capacity=80)
+        for batch in _batches(part):
+            s.update(batch)
+        sketches.append(s)
+
+    merged = sketches[0]
+    for s in sketches[1:]:
+        merged.merge(s)
+    _assert_guarantees(merged, collections.Counter(items))
+
+    top = collections.Counter(items).most_common(1)[0][0]
+    assert merged.most_common(1)[0][0] == top
+
+
+def test_merge_of_exact_sketches_is_exact():
+    items = _stream(n=3_000, seed=6)
+    a = SpaceSaving().update(items[:1_000])
+    b = SpaceSaving().update(items[1_000:])
+    assert a.merge(b).counts == collections.Counter(items)
+    assert a.floor == 0 and not a.errors
+
+
+def test_dict_round_trip():
+    sketch = SpaceSaving(capacity=20).update(_stream(n=1_000, seed=7))
+    restored = SpaceSaving.from_dict(sketch.to_dict())
+    assert restored.to_dict() == sketch.to_dict()
+    assert restored.guaranteed(5) == sketch.guaranteed(5)
@@ -0,0 +1,75 @@
+import pytest
+
+from near_dedup import NearDuplicateIndex
+
+
+@pytest.fixture
+def index():
+    return NearDuplicateIndex(threshold=0.9)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("2+2?", "2*2?"),
+    ("x = a + b", "x = a - b"),
+    ("c++", "c#"),
+    ("???", "!!!"),
+    ("if (a < b) { return a; }", "if (a > b) { return a; }"),
+])
+def test_texts_differing_in_symbols_are_not_merged(index, a, b):
+    first, _ = index.assign(a)
+    second, founded = index.assign(b)
+    assert founded and first != second
+
+
+def test_exact_copies_share_a_group(index):
+    group, founded = index.assign("hello there")
+    assert founded
+    assert index.assign("hello there") == (group, False)
+    assert index.stats.exact == 1
+
+
+def test_near_copies_share_a_group(index):
+    body = " ".join(f"token{i}" for i in range(400))
+    group, _ = index.assign(body)
+    assert index.assign(body + " and one more") == (group, False)
+    assert index.assign(body.replace("token200", "token999")) == (group, False)
+    assert index.stats.near == 2
+
+
+def test_vectors_fan_out_to_members(index):
+    group, _ = index.assign("some body")
+    index.set_vector(group, [1.0, 2.0])
+    assert index.vector(index.assign("some body")[0]) == [1.0, 2.0]
+
+
+def test_eviction_keeps_at_most_max_groups():
+    index = NearDuplicateIndex(threshold=0.9, max_groups=2)
+    for text in ("one body", "another body", "a third body"):
+        index.assign(text)
+    assert index.stats.evicted == 1
+    assert index.assign("one body")[1]     # evicted, so it founds a new group
+
+
+def test_concurrent_copies_found_one_group(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = NearDuplicateIndex(threshold=0.9)
+    workers = 8
+    # Every thread finishes signing before any of them looks the text up
+    barrier = threading.Barrier(workers)
+    sign = NearDuplicateIndex.signature
+
+    def signature(self, text):
+        sig = sign(self, text)
+        barrier.wait(timeout=10)
+        return sig
+
+    monkeypatch.setattr(NearDuplicateIndex, "signature", signature)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(index.assign, ["the same body " * 20] * workers))
+    assert len({group for group, _ in results}) == 1
+    assert sum(founded for _, founded in results) == 1
+    assert index.stats.groups == 1
+    # The copies were matched by the re-check inside the critical section
+    assert index.stats.exact == workers - 1
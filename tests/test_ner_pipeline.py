@@ -0,0 +1,27 @@
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+from ner_pipeline import BatchedNER, ner_components
+
+
+@pytest.fixture
+def nlp():
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns([{"label": "ORG", "pattern": "Acme Corp"}])
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+
+def test_entity_ruler_stays_enabled(nlp):
+    ner = BatchedNER(nlp)
+    assert ner.disabled == ["sentencizer"]
+    assert ner_components(nlp) == ["entity_ruler"]
+    assert ner.entities(["I work at Acme Corp today", "nothing here"]) == [[("Acme Corp", "ORG")], []]
+
+
+def test_long_texts_are_split_and_merged(nlp):
+    ner = BatchedNER(nlp, max_chars=40)
+    text = "Acme Corp is great.\n\n" + "filler words here. " * 10 + "\n\nAcme Corp again."
+    assert ner.entities([text]) == [[("Acme Corp", "ORG"), ("Acme Corp", "ORG")]]
@@ -0,0 +1,81 @@
+import json
+
+import pandas as pd
+import pytest
+
+from claude_parser import (
+    _parse_parallel,
+    conversations_to_dataframe,
+    iter_conversations,
+    iter_message_batches,
+    load_conversations,
+    parse_chatgpt_json,
+)
+
+EMAIL = "user@example.com"
+
+
+def _message(i, role, parts, t):
+    return {"id": f"m{i}", "message": {
+        "author": {"role": role},
+        "create_time": t,
+        "content": {"parts": parts},
+    }}
+
+
+def _export(n=23):
+    convs = []
+    for c in range(n):
+        mapping = {"root": {"id": "root", "message": None}}
+        for i in range(c % 5 + 1):
+            parts = [f"message {i} of conversation {c}: ünïcode, \"quotes\", [brackets] {{}}"]
+            if i == 1:
+                parts.append({"content_type": "code", "text": "print('x')"})
+            if i == 2:
+                parts.append({"content_type": "image_asset_pointer", "size": 3})
+            if i == 3:
+                parts = ["   "]         # empty body, dropped
+            role = ("user", "assistant", "tool")[i % 3]
+            mapping[f"m{i}"] = _message(i, role, parts, 1_700_000_000 + c * 3_600 + i * 7.5)
+        convs.append({
+            "title": f"Conversation {c}" if c % 4 else None,
+            "conversation_id": f"conv-{c}" if c % 6 else float("nan"),
+            "mapping": mapping,
+        })
+    # A conversation without a single non-empty message
+    convs.append({"title": "empty", "conversation_id": "conv-empty",
+                  "mapping": {"root": {"id": "root", "message": None}}})
+    return convs
+
+
+@pytest.fixture
+def export_path(tmp_path):
+    path = tmp_path / "conversations.json"
+    path.write_text(json.dumps(_export(), indent=1), encoding="utf-8")
+    return path
+
+
+def _json_load_frame(path):
+    frames = [parse_chatgpt_json(conv, EMAIL) for conv in load_conversations(path)]
+    return pd.concat([f for f in frames if len(f)], ignore_index=True)
+
+
+def test_iter_conversations_matches_json_load(export_path):
+    expected = json.dumps(load_conversations(export_path))
+    for chunk_size in (7, 64, 1 << 20):
+        assert json.dumps(list(iter_conversations(export_path, chunk_size))) == expected
+
+
+def test_serial_parallel_and_streaming_frames_match_json_load(export_path):
+    expected = _json_load_frame(export_path)
+    assert len(expected) == sum(c % 5 + 1 - (c % 5 >= 3) for c in range(23))
+
+    serial = conversations_to_dataframe(export_path, EMAIL)
+    parallel = conversations_to_dataframe(export_path, EMAIL, parallel=True, workers=2)
+    sharded = _parse_parallel(export_path, EMAIL, workers=3, shard_size=4)
+    batches = list(iter_message_batches(export_path, EMAIL, batch_size=7))
+    streamed = pd.concat(batches, ignore_index=True)
+
+    assert len(batches) > 1
+    for frame in (serial, parallel, sharded, streamed):
+        pd.testing.assert_frame_equal(frame, expected)
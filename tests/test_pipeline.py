@@ -0,0 +1,165 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import claude_parser
+from claude_parser import pipelined_embed_and_insert
+from embedding_backends import EmbeddingBackend
+from ingest_journal import IngestJournal
+
+
+class FakeBackend(EmbeddingBackend):
+    model_id = "fake"
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.embedded = []
+        self._lock = threading.Lock()
+
+    @property
+    def dim(self) -> int:
+        return 4
+
+    def embed(self, texts):
+        if self.fail_on is not None and self.fail_on in texts:
+            raise RuntimeError("embedding failed")
+        with self._lock:
+            self.embedded.extend(texts)
+        return [[float(len(t)), 1.0, 0.0, 0.0] for t in texts]
+
+
+class FakeTable:
+    """Records upserted rows; raises once `fail_after` chunks were written"""
+
+    def __init__(self, fail_after=None, delay_s=0.0):
+        self.fail_after = fail_after
+        self.delay_s = delay_s
+        self.chunks = []
+        self._lock = threading.Lock()
+
+    def upsert(self, rows):
+        table = self
+
+        class Request:
+            def execute(self):
+                time.sleep(table.delay_s)
+                with table._lock:
+                    if table.fail_after is not None and len(table.chunks) >= table.fail_after:
+                        raise RuntimeError("upsert failed")
+                    table.chunks.append(rows)
+
+        return Request()
+
+    @property
+    def bodies(self):
+        return [r["body"] for chunk in self.chunks for r in chunk]
+
+
+@pytest.fixture
+def table(monkeypatch):
+    tbl = FakeTable()
+
+    class Client:
+        def table(self, name):
+            return tbl
+
+    monkeypatch.setattr(claude_parser, "get_client", lambda: Client())
+    return tbl
+
+
+def _frames(n_frames=10, rows=20, consumed=None):
+    for f in range(n_frames):
+        if consumed is not None:
+            consumed.append(f)
+        yield pd.DataFrame({
+            "conversation_id": [f"c{f}"] * rows,
+            "created_at": [f"2024-01-01T00:{f:02d}:{i:02d}" for i in range(rows)],
+            "body": [f"frame {f} row {i}" for i in range(rows)],
+            "embeddings_json": [None] * rows,
+        })
+
+
+def _run(frames, **kwargs):
+    kwargs.setdefault("backend", FakeBackend())
+    return pipelined_embed_and_insert(frames, "t", batch_size=10, embed_workers=2,
+                                      upsert_workers=2, queue_size=2, use_cache=False,
+                                      dedup_threshold=0, **kwargs)
+
+
+def _no_pipeline_threads():
+    return not [t for t in threading.enumerate() if t.name.startswith("ingest-")]
+
+
+def test_every_row_is_embedded_and_inserted_once(table):
+    stats = _run(_frames())
+    assert sorted(table.bodies) == sorted(f"frame {f} row {i}" for f in range(10) for i in range(20))
+    assert all(r["embeddings_json"] for chunk in table.chunks for r in chunk)
+    assert stats["upsert"].rows == stats["embed"].rows == stats["parse"].rows == 200
+    assert _no_pipeline_threads()
+
+
+def test_embed_error_aborts_the_pipeline(table):
+    consumed = []
+    backend = FakeBackend(fail_on="frame 3 row 0")
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        _run(_frames(n_frames=1_000, consumed=consumed), backend=backend)
+    # Bounded queues stop the parser shortly after the failure
+    assert len(consumed) < 20
+    assert "frame 3 row 0" not in table.bodies
+    assert _no_pipeline_threads()
+
+
+def test_upsert_error_aborts_the_pipeline(table):
+    consumed = []
+    table.fail_after = 3
+    with pytest.raises(RuntimeError, match="upsert failed"):
+        _run(_frames(n_frames=1_000, consumed=consumed), max_retries=0)
+    assert len(table.chunks) == 3
+    assert len(consumed) < 20
+    assert _no_pipeline_threads()
+
+
+def test_slow_writer_bounds_the_work_in_flight(table):
+    table.delay_s = 0.02
+    in_flight = []
+    backend = FakeBackend()
+    embed = backend.embed
+
+    def tracking_embed(texts):
+        # Chunks embedded but not yet written are held by the queues and workers
+        in_flight.append(len(backend.embedded) // 10 - len(table.chunks))
+        return embed(texts)
+
+    backend.embed = tracking_embed
+    _run(_frames(), backend=backend)
+    # queue_size chunks queued plus one per embed and upsert worker
+    assert max(in_flight) <= 2 + 2 + 2
+    assert len(table.chunks) == 20
+    assert _no_pipeline_threads()
+
+
+def test_resume_skips_completed_batches(table, tmp_path):
+    export = tmp_path / "conversations.json"
+    export.write_text("[]")
+    journal = IngestJournal.open(export, "a@x.com", jobs_dir=tmp_path / "jobs")
+
+    table.fail_after = 7
+    with pytest.raises(RuntimeError):
+        _run(_frames(), journal=journal, max_retries=0)
+    journal.close()
+    first = set(table.bodies)
+    assert len(journal.done) == 7 and len(first) == 70
+
+    table.fail_after = None
+    table.chunks.clear()
+    resumed = IngestJournal.open(export, "a@x.com", resume=True, jobs_dir=tmp_path / "jobs")
+    assert set(resumed.done) == set(journal.done)
+    backend = FakeBackend()
+    stats = _run(_frames(), journal=resumed, backend=backend)
+
+    assert stats["parse"].skipped_rows == 70
+    assert first.isdisjoint(table.bodies) and first.isdisjoint(backend.embedded)
+    assert len(first) + len(table.bodies) == 200
+    assert len(resumed.done) == 20
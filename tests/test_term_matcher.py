@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from term_matcher import DEFAULT_LANGUAGES, TermMatcher
+
+
+@pytest.fixture(scope="module")
+def languages():
+    return TermMatcher(DEFAULT_LANGUAGES)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I write c++ daily", {"c++"}),
+    ("ported it to c++11", {"c++"}),
+    ("c++17 structured bindings", {"c++"}),
+    ("C++20 modules", {"c++"}),
+    ("tagged #python", {"python"}),
+    ("plain c and C#", {"c"}),
+    ("the c99 standard", set()),
+    ("c++ and c", {"c++", "c"}),
+    ("pythonic", set()),
+    ("g++ -O2", set()),
+])
+def test_find(languages, text, expected):
+    assert languages.find(text) == expected
+
+
+def test_count_documents_counts_each_text_once(languages):
+    texts = pd.Series(["c++17 and c++20", "#python python", None, "nothing here"])
+    assert languages.count_documents(texts) == {"c++": 1, "python": 1}
+
+
+def test_aliases_map_to_labels():
+    matcher = TermMatcher({"go": "go", "golang": "go", "c#": "c#"})
+    assert matcher.find("golang or go, and c#10") == {"go", "c#"}
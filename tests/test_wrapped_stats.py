@@ -0,0 +1,54 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+from term_matcher import DEFAULT_LANGUAGES, TermMatcher
+from wrapped_stats import WrappedAccumulator, WrappedRollups
+
+LANGUAGES = TermMatcher(DEFAULT_LANGUAGES)
+
+
+def _frame(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-01-01", tz="UTC").value
+    return pd.DataFrame({
+        "conversation_id": rng.choice(["a", "b", "c", None], n),
+        "author_role": rng.choice(["user", "assistant"], n),
+        "body": rng.choice(["python please", "use rust", "hello there friend"], n),
+        "created_at": pd.to_datetime(start + rng.integers(0, 200 * 86_400 * 10**9, n), utc=True),
+    })
+
+
+def _entities(df):
+    users = df[df.author_role == "user"]
+    return [[(f"Entity{i % 7}", "ORG")] for i in range(len(users))]
+
+
+def test_rollups_attribute_entities_to_their_month():
+    df = _frame()
+    ents = _entities(df)
+    rollups = WrappedRollups().update(df, ents, LANGUAGES)
+
+    month = df.created_at.dt.strftime("%Y-%m")[df.author_role == "user"].to_numpy()
+    expected = collections.defaultdict(collections.Counter)
+    for m, e in zip(month, ents):
+        expected[m].update(txt for txt, _ in e)
+    assert set(rollups.months) == set(df.created_at.dt.strftime("%Y-%m"))
+    for key, acc in rollups.months.items():
+        assert dict(acc.entities.most_common()) == dict(expected[key])
+
+
+def test_rollups_total_matches_one_accumulator():
+    df = _frame(seed=1)
+    ents = _entities(df)
+    total = WrappedRollups().update(df, ents, LANGUAGES).total()
+    flat = WrappedAccumulator().update(df, ents, LANGUAGES)
+    assert total.to_dict() == flat.to_dict()
+
+
+def test_missing_conversation_id_is_not_a_conversation():
+    df = _frame(seed=2)
+    acc = WrappedAccumulator().update(df, _entities(df), LANGUAGES)
+    assert acc.conversations == set(df.conversation_id.dropna())
+    assert acc.result()["num_chats"] == df.conversation_id.nunique()
@@ -0,0 +1,222 @@
+"""
+Token-aware, adaptive request batching for embedding APIs.
+
+Message bodies range from a few tokens to tens of thousands, so batching by
+row count either overflows the provider's per-request token limit or leaves
+most of it unused. TokenBudgetBatcher packs texts by estimated token count
+against a per-request budget, applies an overflow policy to bodies longer
+than the model context, and adapts the budget from observed latency and
+rate-limit responses (additive increase, multiplicative decrease).
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+OVERFLOW_POLICIES = ("truncate", "split")
+
+
+def is_rate_limited(err: BaseException) -> bool:
+    """Best-effort detection of HTTP 429 / rate-limit errors across SDKs"""
+    for obj in (err, getattr(err, "response", None)):
+        if getattr(obj, "status_code", None) == 429 or getattr(obj, "status", None) == 429:
+            return True
+    if "RateLimit" in type(err).__name__:
+        return True
+    msg = str(err).lower()
+    return "429" in msg or "rate limit" in msg or "too many requests" in msg
+
+
+@dataclass
+class BatcherStats:
+    requests: int = 0
+    rate_limited: int = 0
+    bisections: int = 0
+    failed_texts: int = 0
+    truncated: int = 0
+    split: int = 0
+
+    def summary(self) -> str:
+        return (f"{self.requests} requests, {self.rate_limited} rate-limited, "
+                f"{self.bisections} bisections, {self.failed_texts} failed texts, "
+                f"{self.truncated} truncated / {self.split} split bodies")
+
+
+class TokenBudgetBatcher:
+    """
+    Packs texts into requests by estimated tokens.
+
+    Defaults follow Voyage's documented limits for voyage-3-lite (32k-token
+    context, 1000 inputs per request) with a conservative starting budget;
+    the budget then grows while requests are fast and shrinks on 429s.
+    """
+
+    def __init__(
+        self,
+        max_tokens_per_request: int = 120_000,
+        min_tokens_per_request: int = 4_000,
+        max_texts_per_request: int = 1_000,
+        max_tokens_per_text: int = 32_000,
+        overflow: str = "truncate",
+        chars_per_token: float = 3.0,
+        target_latency_s: float = 4.0,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.max_budget = max_tokens_per_request
+        self.min_budget = min_tokens_per_request
+        self.max_texts = max_texts_per_request
+        self.max_tokens_per_text = max_tokens_per_text
+        self.overflow = overflow
+        self.chars_per_token = chars_per_token
+        self.target_latency_s = target_latency_s
+
+        self.budget = max(self.min_budget, self.max_budget // 4)
+        self.stats = BatcherStats()
+        self._lock = threading.Lock()
+
+    # ── Sizing ──────────────────────────────────────────────────────
+
+    def estimate_tokens(self, text: str) -> int:
+        return max(1, int(len(text) / self.chars_per_token))
+
+    def _pieces(self, text: str) -> List[str]:
+        """Apply the overflow policy to one body"""
+        max_chars = int(self.max_tokens_per_text * self.chars_per_token)
+        if len(text) <= max_chars:
+            return [text]
+        if self.overflow == "truncate":
+            self._count("truncated")
+            return [text[:max_chars]]
+
+        self._count("split")
+        pieces, start = [], 0
+        while start < len(text):
+            end = min(len(text), start + max_chars)
+            if end < len(text):
+                # Prefer to cut on whitespace in the last tenth of the window
+                cut = text.rfind(" ", start + max_chars * 9 // 10, end)
+                end = cut if cut > start else end
+            pieces.append(text[start:end])
+            start = end
+        return pieces
+
+    def next_batch(self, costs: Sequence[int], start: int) -> List[int]:
+        """Greedily take indices from `start` while they fit the current budget"""
+        budget = self.budget
+        batch, tokens = [], 0
+        for i in range(start, len(costs)):
+            if batch and (tokens + costs[i] > budget or len(batch) >= self.max_texts):
+                break
+            batch.append(i)
+            tokens += costs[i]
+        return batch
+
+    # ── Feedback ────────────────────────────────────────────────────
+
+    def on_success(self, latency_s: float):
+        with self._lock:
+            if latency_s <= self.target_latency_s:
+                self.budget = min(self.max_budget, self.budget + self.max_budget // 10)
+            else:
+                self.budget = max(self.min_budget, int(self.budget * 0.75))
+
+    def on_rate_limited(self, tokens: Optional[int] = None):
+        """Halve the budget, or to half of a rejected request of `tokens` if smaller"""
+        with self._lock:
+            self.stats.rate_limited += 1
+            budget = self.budget if tokens is None else min(self.budget, tokens)
+            self.budget = max(self.min_budget, budget // 2)
+
+    # ── Driver ──────────────────────────────────────────────────────
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        embed_batch: Callable[[List[str]], List[List[float]]],
+    ) -> List[Optional[List[float]]]:
+        """
+        Embed texts with as few requests as the budget allows.
+
+        Waiting and retrying on 429s is left to embed_batch (see
+        ProviderLimiter.wrap); a 429 that still comes back shrinks the
+        budget below the rejected request's size and splits it. Other
+        failures are bisected, so one bad input only costs its own slot;
+        texts that still fail on their own come back as None.
+        Split bodies are embedded piecewise and mean-pooled.
+        """
+        pieces, owner = [], []
+        for i, text in enumerate(texts):
+            for piece in self._pieces(text):
+                pieces.append(piece)
+                owner.append(i)
+
+        costs = [self.estimate_tokens(p) for p in pieces]
+        vectors: List[Optional[List[float]]] = [None] * len(pieces)
+        start = 0
+        while start < len(pieces):
+            # Re-pack after every request so budget changes apply immediately
+            batch = self.next_batch(costs, start)
+            self._run(batch, pieces, costs, vectors, embed_batch)
+            start = batch[-1] + 1
+
+        if len(pieces) == len(texts):
+            return vectors
+
+        grouped: List[List[List[float]]] = [[] for _ in texts]
+        failed = set()
+        for i, vec in zip(owner, vectors):
+            if vec is None:
+                failed.add(i)
+            else:
+                grouped[i].append(vec)
+        out: List[Optional[List[float]]] = []
+        for i, vecs in enumerate(grouped):
+            if i in failed or not vecs:
+                out.append(None)
+            elif len(vecs) == 1:
+                out.append(vecs[0])
+            else:
+                mean = np.mean(np.asarray(vecs, dtype=np.float64), axis=0)
+                norm = np.linalg.norm(mean)
+                out.append((mean / norm if norm else mean).tolist())
+        return out
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            setattr(self.stats, field, getattr(self.stats, field) + n)
+
+    def _run(self, batch, pieces, costs, vectors, embed_batch):
+        t0 = time.perf_counter()
+        try:
+            self._count("requests")
+            result = embed_batch([pieces[i] for i in batch])
+        except Exception as err:
+            if is_rate_limited(err):
+                # embed_batch (a ProviderLimiter wrapper) has already waited
+                # and retried; only the request size is ours to fix
+                self.on_rate_limited(sum(costs[i] for i in batch))
+                if len(batch) > 1:
+                    print(f"⚠️  Rate limited; budget now {self.budget} tokens, splitting the request")
+                    self._split(batch, pieces, costs, vectors, embed_batch)
+                    return
+                self._count("failed_texts", len(batch))
+                print(f"⚠️  Rate limited; giving up on {len(batch)} texts: {err}")
+                return
+            if len(batch) == 1:
+                self._count("failed_texts")
+                print(f"⚠️  Failed to embed text: {err}")
+                return
+            self._count("bisections")
+            self._split(batch, pieces, costs, vectors, embed_batch)
+            return
+        self.on_success(time.perf_counter() - t0)
+        for i, vec in zip(batch, result):
+            vectors[i] = vec
+
+    def _split(self, batch, pieces, costs, vectors, embed_batch):
+        mid = len(batch) // 2
+        self._run(batch[:mid], pieces, costs, vectors, embed_batch)
+        self._run(batch[mid:], pieces, costs, vectors, embed_batch)
@@ -16,12 +16,20 @@ interface ChatLog {
   created_at: string
   company: string | null
   attachments: any
-  embeddings_json?: number[]
+  embeddings_json?: number[] | string | EncodedEmbedding
   wrapped_json: any
   graph_json: any
   similarity?: number
 }
 
+interface EncodedEmbedding {
+  v: 2
+  dtype: 'f16' | 'f32'
+  dim: number
+  model: string | null
+  b64: string
+}
+
 export async function POST(request: NextRequest) {
   try {
     const { queryEmbedding, userEmai, topK = 3 } = await request.json()
@@ -81,8 +89,14 @@ export async function POST(request: NextRequest) {
         }
       }
 
+      // Compact v2 envelope: base64 float16/float32 (see embedding_codec.py)
+      if (raw && typeof raw === 'object' && !Array.isArray(raw) && (raw as any).v === 2) {
+        const decoded = decodeEmbedding(raw as unknown as EncodedEmbedding);
+        if (decoded) {
+          embeddings = [decoded];
+        }
       // If it's an object with a key (e.g., 'conversation'), extract the array
-      if (raw && typeof raw === 'object' && !Array.isArray(raw)) {
+      } else if (raw && typeof raw === 'object' && !Array.isArray(raw)) {
         // Use the first property value as the embedding
         const firstKey = Object.keys(raw)[0];
         if (firstKey && Array.isArray(raw[firstKey])) {
@@ -176,4 +190,28 @@ function cosineSimilarity(vecA: number[], vecB: number[]): number {
   
   const similarity = dotProduct / (magnitudeA * magnitudeB)
   return similarity
-} 
\ No newline at end of file
+} 
+
+// Decode a v2 embedding envelope (little-endian float16 or float32, base64)
+function decodeEmbedding(enc: EncodedEmbedding): number[] | null {
+  const buf = Buffer.from(enc.b64, 'base64')
+  const view = new DataView(buf.buffer, buf.byteOffset, buf.byteLength)
+  const out: number[] = []
+  if (enc.dtype === 'f32') {
+    for (let i = 0; i + 4 <= buf.byteLength; i += 4) out.push(view.getFloat32(i, true))
+  } else if (enc.dtype === 'f16') {
+    for (let i = 0; i + 2 <= buf.byteLength; i += 2) out.push(halfToFloat(view.getUint16(i, true)))
+  } else {
+    return null
+  }
+  return out
+}
+
+function halfToFloat(h: number): number {
+  const sign = h & 0x8000 ? -1 : 1
+  const exp = (h >> 10) & 0x1f
+  const frac = h & 0x3ff
+  if (exp === 0) return sign * Math.pow(2, -14) * (frac / 1024)
+  if (exp === 0x1f) return frac ? NaN : sign * Infinity
+  return sign * Math.pow(2, exp - 15) * (1 + frac / 1024)
+}
@@ -0,0 +1,265 @@
+"""
+Mergeable state for Wrapped statistics.
+
+WrappedAccumulator holds everything spotify_wrapped reports as plain
+counters, sums and a 24-bin hour histogram, so it can be updated with new
+messages only, merged with another accumulator (a shard, a process, a
+month) and serialized to JSON. Entities and queries are SpaceSaving
+counters, exact by default or bounded by a capacity (see heavy_hitters). WrappedRollups keeps one accumulator per
+calendar month (UTC); any date range is the merge of its months. It also
+keeps an hourly ActivityRollup (see activity_rollups), whose compact form
+is published in the wrapped payload under "activity".
+
+AnalyticsStore persists a user's rollups and entity co-occurrence
+incidence under the cache directory, so update_analytics_for_email can fold
+in only the messages an upload added instead of re-reading the whole
+history.
+"""
+import collections
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from activity_rollups import ActivityRollup
+from cooccurrence import EntityCooccurrence
+from embedding_cache import DEFAULT_CACHE_DIR
+from entity_cache import Entity
+from heavy_hitters import SpaceSaving
+from ner_pipeline import keep_entity
+from term_matcher import TermMatcher
+
+QUERY_WORDS = 8
+TOP_ENTITIES = 15
+TOP_QUERIES = 10
+# Bump when the saved format changes; older states are rebuilt
+STATE_VERSION = 3
+
+
+def query_key(text: str) -> str:
+    """What counts as "the same query": the first QUERY_WORDS words, lowercased"""
+    return " ".join(text.strip().split()[:QUERY_WORDS]).lower()
+
+
+@dataclass
+class WrappedAccumulator:
+    messages: int = 0
+    response_tokens: int = 0
+    conversations: Set[str] = field(default_factory=set)
+    entities: SpaceSaving = field(default_factory=SpaceSaving)
+    queries: SpaceSaving = field(default_factory=SpaceSaving)
+    languages: collections.Counter = field(default_factory=collections.Counter)
+    hours: List[int] = field(default_factory=lambda: [0] * 24)
+
+    @classmethod
+    def bounded(cls, capacity: Optional[int]) -> "WrappedAccumulator":
+        """Empty accumulator keeping at most capacity entities and queries"""
+        return cls(entities=SpaceSaving(capacity), queries=SpaceSaving(capacity))
+
+    def update(self, df: pd.DataFrame, user_entities: Sequence[List[Entity]],
+               languages: TermMatcher) -> "WrappedAccumulator":
+        """
+        Add a sanitized frame of messages. user_entities holds the entities
+        of the frame's user messages, in frame order.
+        """
+        if df.empty:
+            return self
+        user = df.author_role.eq("user")
+        assistant = df.author_role.eq("assistant")
+
+        self.messages += len(df)
+        self.conversations.update(df.conversation_id.dropna().astype(str).unique())
+        self.response_tokens += int(df.body[assistant].str.split().map(len).sum())
+        entities = collections.Counter()
+        for ents in user_entities:
+            entities.update(txt for txt, _ in ents if keep_entity(txt))
+        self.entities.update(entities)
+        self.queries.update(df.body[user].map(query_key).value_counts().to_dict())
+        self.languages.update(languages.count_documents(df.body))
+        hist = np.bincount(df.created_at.dt.hour.to_numpy(), minlength=24)
+        self.hours = (np.asarray(self.hours) + hist).tolist()
+        return self
+
+    def merge(self, other: "WrappedAccumulator") -> "WrappedAccumulator":
+        """Fold other into self"""
+        self.messages += other.messages
+        self.response_tokens += other.response_tokens
+        self.conversations |= other.conversations
+        self.entities.merge(other.entities)
+        self.queries.merge(other.queries)
+        self.languages.update(other.languages)
+        self.hours = [a + b for a, b in zip(self.hours, other.hours)]
+        return self
+
+    @classmethod
+    def merged(cls, accs: Iterable["WrappedAccumulator"],
+               capacity: Optional[int] = None) -> "WrappedAccumulator":
+        out = cls.bounded(capacity)
+        for acc in accs:
+            out.merge(acc)
+        return out
+
+    def result(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """The spotify_wrapped payload"""
+        languages = {k: v for k, v in self.languages.most_common() if v > 0}
+        return {
+            "year": datetime.utcnow().year,
+            "user_id": user_id or "default",
+            "num_chats": len(self.conversations),
+            "num_messages": self.messages,
+            "response_tokens": self.response_tokens,
+            "top_entities": self.entities.most_common(TOP_ENTITIES),
+            "top_queries": dict(self.queries.most_common(TOP_QUERIES)),
+            "languages": languages,
+            "most_active_hour": int(np.argmax(self.hours)) if self.messages else None,
+            "generated_at": datetime.utcnow().isoformat(),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "messages": self.messages,
+            "response_tokens": self.response_tokens,
+            "conversations": sorted(self.conversations),
+            "entities": self.entities.to_dict(),
+            "queries": self.queries.to_dict(),
+            "languages": dict(self.languages),
+            "hours": list(self.hours),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WrappedAccumulator":
+        return cls(
+            messages=data["messages"],
+            response_tokens=data["response_tokens"],
+            conversations=set(data["conversations"]),
+            entities=SpaceSaving.from_dict(data["entities"]),
+            queries=SpaceSaving.from_dict(data["queries"]),
+            languages=collections.Counter(data["languages"]),
+            hours=list(data["hours"]),
+        )
+
+
+class WrappedRollups:
+    """
+    One WrappedAccumulator per "YYYY-MM" (UTC), each bounded by capacity,
+    plus hourly activity
+    """
+
+    def __init__(self, months: Optional[Dict[str, WrappedAccumulator]] = None,
+                 capacity: Optional[int] = None,
+                 activity: Optional[ActivityRollup] = None):
+        self.months: Dict[str, WrappedAccumulator] = months or {}
+        self.capacity = capacity
+        self.activity = activity or ActivityRollup()
+
+    def _month(self, key: str) -> WrappedAccumulator:
+        if key not in self.months:
+            self.months[key] = WrappedAccumulator.bounded(self.capacity)
+        return self.months[key]
+
+    def update(self, df: pd.DataFrame, user_entities: Sequence[List[Entity]],
+               languages: TermMatcher) -> "WrappedRollups":
+        """Add a sanitized frame; user_entities as for WrappedAccumulator.update"""
+        if df.empty:
+            return self
+        month = df.created_at.dt.strftime("%Y-%m").to_numpy()
+        is_user = df.author_role.eq("user").to_numpy()
+        keys, month_idx = np.unique(month, return_inverse=True)
+        month_idx = month_idx.ravel()
+        # Group user messages by month once: a stable argsort keeps frame order
+        user_idx = month_idx[is_user]
+        order = np.argsort(user_idx, kind="stable")
+        bounds = np.searchsorted(user_idx[order], np.arange(len(keys) + 1))
+        user_entities = list(user_entities)
+        for i, key in enumerate(keys):
+            ents = [user_entities[j] for j in order[bounds[i]:bounds[i + 1]]]
+            self._month(key).update(df[month_idx == i], ents, languages)
+        self.activity.update(df)
+        return self
+
+    @property
+    def messages(self) -> int:
+        return sum(acc.messages for acc in self.months.values())
+
+    def merge(self, other: "WrappedRollups") -> "WrappedRollups":
+        for key, acc in other.months.items():
+            self._month(key).merge(acc)
+        self.activity.merge(other.activity)
+        return self
+
+    def total(self, start: Optional[str] = None, end: Optional[str] = None) -> WrappedAccumulator:
+        """Merge of the months in [start, end] ("YYYY-MM", inclusive; open if None)"""
+        return WrappedAccumulator.merged(
+            (acc for key, acc in sorted(self.months.items())
+             if (start is None or key >= start) and (end is None or key <= end)),
+            self.capacity,
+        )
+
+    def result(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """The spotify_wrapped payload over every month, with the activity rollup"""
+        return {**self.total().result(user_id), "activity": self.activity.to_dict()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "months": {key: acc.to_dict() for key, acc in sorted(self.months.items())},
+            "activity": self.activity.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WrappedRollups":
+        months = {key: WrappedAccumulator.from_dict(acc) for key, acc in data["months"].items()}
+        return cls(months, data["capacity"], ActivityRollup.from_dict(data["activity"]))
+
+
+@dataclass
+class AnalyticsState:
+    """What update_analytics_for_email keeps between runs for one user"""
+    rollups: WrappedRollups = field(default_factory=WrappedRollups)
+    cooc: EntityCooccurrence = field(default_factory=EntityCooccurrence)
+
+
+class AnalyticsStore:
+    """Per-user AnalyticsState on local disk (JSON rollups + npz incidence)"""
+
+    def __init__(self, cache_dir: str | Path | None = None):
+        self.root = Path(cache_dir or DEFAULT_CACHE_DIR) / "analytics"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, email: str) -> Tuple[Path, Path]:
+        stem = hashlib.sha1(email.encode("utf-8")).hexdigest()
+        return self.root / f"{stem}.json", self.root / f"{stem}.npz"
+
+    def load(self, email: str) -> Optional[AnalyticsState]:
+        meta_path, graph_path = self._paths(email)
+        if not meta_path.exists() or not graph_path.exists():
+            return None
+        with meta_path.open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STATE_VERSION:
+            return None
+        with np.load(graph_path, allow_pickle=False) as arrays:
+            cooc = EntityCooccurrence.from_state({k: arrays[k] for k in arrays.files})
+        return AnalyticsState(WrappedRollups.from_dict(meta["rollups"]), cooc)
+
+    def save(self, email: str, state: AnalyticsState):
+        meta_path, graph_path = self._paths(email)
+        meta = {"version": STATE_VERSION, "email": email, "rollups": state.rollups.to_dict()}
+        # Write-then-rename so a crash never leaves half a state behind
+        tmp = meta_path.with_suffix(".json.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        tmp_graph = graph_path.with_suffix(".tmp.npz")
+        np.savez_compressed(tmp_graph, **state.cooc.state())
+        os.replace(tmp_graph, graph_path)
+        os.replace(tmp, meta_path)
+
+    def clear(self, email: str):
+        for path in self._paths(email):
+            path.unlink(missing_ok=True)